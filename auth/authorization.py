@@ -8,3 +8,14 @@ def login_required(f):
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
+
+def has_project_access(project_id):
+    """Verifica se o usuário da sessão é administrador ou tem acesso ao projeto"""
+    from models.db import db, Project
+
+    if session.get('is_admin'):
+        return True
+    return db.session.query(Project.id).filter(
+        Project.id == project_id,
+        Project.authorized_teams.any(id=session.get('user_id'))
+    ).first() is not None
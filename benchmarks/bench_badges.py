@@ -0,0 +1,102 @@
+"""
+Benchmark do motor de medalhas (utils/badges.py).
+
+Mede o custo de record_event por evento com históricos crescentes: sessões
+de Pomodoro já registradas para o usuário e linhas de BadgeProgress/UserBadge
+de outros usuários. Como a avaliação é incremental, o tempo por evento deve
+permanecer estável em todos os tamanhos.
+
+Uso (banco SQLite temporário, não toca no banco da aplicação):
+
+    python benchmarks/bench_badges.py [--sizes 0,10000,100000] [--events 500]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+
+from models.db import db, Team, PomodoroLog, BadgeProgress, UserBadge
+from utils.badges import record_event, BADGE_RULES
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(history):
+    """Usuário do benchmark com `history` sessões e o mesmo número de linhas de outros usuários"""
+    user = Team(name='Bench', email='bench@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+
+    start = datetime.utcnow() - timedelta(days=history // 20 + 1)
+    batch = []
+    for i in range(history):
+        begin = start + timedelta(minutes=3 * i)
+        batch.append({'user_id': user.id, 'start_time': begin, 'end_time': begin + timedelta(minutes=25),
+                      'duration': 1500, 'timer_type': 'work', 'completed': True})
+        if len(batch) == 5000:
+            db.session.execute(insert(PomodoroLog), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(PomodoroLog), batch)
+
+    # Estado de medalhas de outros usuários (ids fictícios, sem FK no SQLite)
+    others = max(history // len(BADGE_RULES), 0)
+    rows = [{'user_id': 1000 + i, 'badge_code': rule['code'], 'count': 5}
+            for i in range(others) for rule in BADGE_RULES]
+    for offset in range(0, len(rows), 5000):
+        db.session.execute(insert(BadgeProgress), rows[offset:offset + 5000])
+    earned = [{'user_id': 1000 + i, 'badge_code': BADGE_RULES[0]['code']} for i in range(others)]
+    for offset in range(0, len(earned), 5000):
+        db.session.execute(insert(UserBadge), earned[offset:offset + 5000])
+    db.session.commit()
+    return user.id
+
+
+def measure(user_id, events):
+    """Tempo médio (ms) de record_event + commit, alternando os tipos de evento"""
+    kinds = ['work_session', 'kudos_received', 'kudos_sent', 'card_completed']
+    when = datetime.utcnow()
+    started = time.perf_counter()
+    for i in range(events):
+        record_event(user_id, kinds[i % len(kinds)], when + timedelta(hours=i))
+        db.session.commit()
+    return (time.perf_counter() - started) * 1000 / events
+
+
+def main():
+    logging.getLogger('badges').setLevel(logging.WARNING)  # sem uma linha por medalha concedida
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='0,10000,100000', help='Tamanhos de histórico, separados por vírgula.')
+    parser.add_argument('--events', type=int, default=500, help='Eventos medidos em cada tamanho.')
+    args = parser.parse_args()
+
+    print(f"{'histórico':>10}  {'ms/evento':>10}")
+    for history in (int(size) for size in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as directory:
+            app = make_app(os.path.join(directory, 'bench.db'))
+            with app.app_context():
+                db.create_all()
+                user_id = seed(history)
+                per_event = measure(user_id, args.events)
+                db.session.remove()
+                db.engine.dispose()
+        print(f"{history:>10}  {per_event:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
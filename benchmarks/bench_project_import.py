@@ -0,0 +1,128 @@
+"""
+Benchmark da importação de projetos (utils/project_import.py).
+
+Gera uma planilha no formato da exportação (por padrão 50.000 linhas, com
+usuários, tags e datas em todas as linhas) e mede ProjectImporter.run +
+commit duas vezes sobre o mesmo projeto: a primeira cria todos os cards e
+a segunda atualiza os mesmos cards e regrava as associações.
+
+Uso (banco SQLite temporário, não toca no banco da aplicação):
+
+    python benchmarks/bench_project_import.py [--rows 50000] [--batch-size 2000]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from openpyxl import Workbook
+from sqlalchemy import func, insert
+
+from models.db import db, Project, Phase, Team, Tag, KanbanCard, card_users, card_tags
+from utils.project_import import ProjectImporter, BATCH_SIZE
+from utils.exports import EXPORT_HEADERS
+
+PHASES = ['Backlog', 'Doing', 'Review', 'Done']
+USERS = 50
+TAGS = 20
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed():
+    """Projeto com fases, usuários e tags referenciados pela planilha"""
+    project = Project(name='Bench', description='')
+    db.session.add(project)
+    db.session.flush()
+    db.session.execute(insert(Phase), [
+        {'name': name, 'order': order, 'project_id': project.id} for order, name in enumerate(PHASES)
+    ])
+    db.session.execute(insert(Team), [
+        {'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x'} for i in range(USERS)
+    ])
+    db.session.execute(insert(Tag), [{'name': f'tag{i}'} for i in range(TAGS)])
+    db.session.commit()
+    return project.id
+
+
+def write_workbook(path, rows):
+    """Planilha com 'rows' cards; algumas fases com espaços extras, como em planilhas editadas à mão"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Project Export')
+    ws.append(EXPORT_HEADERS)
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        phase = PHASES[i % len(PHASES)]
+        ws.append([
+            f' {phase} ' if i % 10 == 0 else phase,
+            f'Card {i}',
+            f'Descrição do card {i}',
+            f'{i % 8 + 1}h',
+            (start + timedelta(days=i % 365)).strftime('%Y-%m-%d'),
+            start + timedelta(days=i % 365 + 14),
+            ';'.join(f'user{(i + k) % USERS}@example.com' for k in range(2)),
+            ';'.join(f'tag{(i + k) % TAGS}' for k in range(3)),
+            '',
+            i % 101
+        ])
+    wb.save(path)
+
+
+def measure(project_id, path, batch_size):
+    """Segundos de ProjectImporter.run + commit e o resultado da importação"""
+    started = time.perf_counter()
+    importer = ProjectImporter(project_id, batch_size=batch_size)
+    with open(path, 'rb') as f:
+        result = importer.run(f)
+    db.session.commit()
+    return time.perf_counter() - started, result
+
+
+def main():
+    logging.getLogger('project_import').setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=50000, help='Linhas da planilha gerada.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Cards por lote de gravação.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        xlsx_path = os.path.join(directory, 'bench.xlsx')
+        started = time.perf_counter()
+        write_workbook(xlsx_path, args.rows)
+        print(f"planilha: {args.rows} linhas, {os.path.getsize(xlsx_path) / 1024 / 1024:.1f} MB "
+              f"gerada em {time.perf_counter() - started:.1f}s")
+
+        app = make_app(os.path.join(directory, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            project_id = seed()
+
+            print(f"{'execução':>11}  {'segundos':>9}  {'linhas/s':>9}  {'criados':>8}  {'atualizados':>11}  {'erros':>6}")
+            for label in ('criação', 'atualização'):
+                elapsed, result = measure(project_id, xlsx_path, args.batch_size)
+                print(f"{label:>11}  {elapsed:>9.2f}  {args.rows / elapsed:>9.0f}  {result.created:>8}  "
+                      f"{result.updated:>11}  {len(result.errors):>6}")
+
+            cards = db.session.query(func.count(KanbanCard.id)).scalar()
+            links = db.session.query(func.count()).select_from(card_users).scalar() \
+                + db.session.query(func.count()).select_from(card_tags).scalar()
+            print(f"cards no banco: {cards}, associações: {links}")
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -8,8 +8,11 @@ It includes models for Kanban cards, teams, tags, and projects.
 
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import mysql
 from datetime import datetime
 import hashlib
+from utils.user_refs import get_user_ref, user_ref_from
+from utils.thumbnails import derivative_kind
 
 db = SQLAlchemy()
 
@@ -333,7 +336,7 @@ class Channel(db.Model):
             'created_at': self.created_at.isoformat(),
             'created_by': self.created_by,
             'project_id': self.project_id,
-            'members': [member.to_dict() for member in self.members]
+            'members': [user_ref_from(member) for member in self.members]
         }
 
 class Message(db.Model):
@@ -404,8 +407,8 @@ class Kudos(db.Model):
     def to_dict(self):
         return {
             'id': self.id,
-            'sender': self.sender.to_dict(),
-            'receiver': self.receiver.to_dict(),
+            'sender': get_user_ref(self.sender_id),
+            'receiver': get_user_ref(self.receiver_id),
             'category': self.category,
             'type': self.type,
             'message': self.message,
@@ -431,7 +434,7 @@ class KudosComment(db.Model):
             'id': self.id,
             'content': self.content,
             'created_at': self.created_at.isoformat(),
-            'user': self.user.to_dict(),
+            'user': get_user_ref(self.user_id),
             'replies': [reply.to_dict() for reply in self.replies]
         }
 
@@ -449,7 +452,68 @@ class KudosReaction(db.Model):
         return {
             'id': self.id,
             'reaction_type': self.reaction_type,
-            'user': self.user.to_dict()
+            'user': get_user_ref(self.user_id)
+        }
+
+class KudosQuota(db.Model):
+    """
+    Cota mensal de kudos por remetente.
+
+    Consumida com um UPDATE condicional (used < limite), o que garante o
+    limite mesmo com envios simultâneos.
+    """
+    sender_id = db.Column(db.Integer, db.ForeignKey('team.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM'
+    used = db.Column(db.Integer, nullable=False, default=0)
+
+class KudosReactionCount(db.Model):
+    """Contador desnormalizado de reações por kudo e tipo, mantido por add_reaction"""
+    kudo_id = db.Column(db.Integer, db.ForeignKey('kudos.id'), primary_key=True)
+    reaction_type = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class BadgeProgress(db.Model):
+    """
+    Estado incremental de uma regra de medalha para um usuário.
+
+    Guarda apenas o necessário para avaliar o próximo evento (contador,
+    período corrente e último dia visto), de modo que a concessão nunca
+    precise reler o histórico de PomodoroLog, Kudos ou cards.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('team.id'), primary_key=True)
+    badge_code = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    period = db.Column(db.String(10), nullable=True)     # ex.: '2025-W14' para regras semanais
+    last_date = db.Column(db.Date, nullable=True)        # último dia contabilizado (sequências)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CardCompletion(db.Model):
+    """
+    Conclusão de um card já contabilizada nas medalhas.
+
+    A chave primária garante um único evento 'card_completed' por card, mesmo
+    que ele saia e volte para a última fase.
+    """
+    card_id = db.Column(db.String(50), db.ForeignKey('kanban_card.id', ondelete='CASCADE'), primary_key=True)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserBadge(db.Model):
+    """Medalhas conquistadas pelos usuários"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False, index=True)
+    badge_code = db.Column(db.String(50), nullable=False)
+    earned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'badge_code', name='uq_user_badge'),)
+
+    user = db.relationship('Team', backref=db.backref('badges', lazy=True))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'badge_code': self.badge_code,
+            'earned_at': self.earned_at.isoformat()
         }
 
 class AppUsage(db.Model):
@@ -474,6 +538,75 @@ class AppUsage(db.Model):
             'minutes_used': self.minutes_used
         }
 
+class AppUsageDaily(db.Model):
+    """
+    Agregado diário de uso de aplicativos (usuário, dia, aplicativo).
+
+    Mantido na ingestão das amostras de AppUsage, para que as consultas de
+    relatório nunca precisem varrer a tabela bruta.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('team.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    app_name = db.Column(db.String(255), primary_key=True)
+    minutes_used = db.Column(db.Integer, nullable=False, default=0)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'day': self.day.isoformat(),
+            'app_name': self.app_name,
+            'minutes_used': self.minutes_used,
+            'samples': self.samples
+        }
+
+class ImportJob(db.Model):
+    """
+    Importação de planilha processada em segundo plano.
+
+    status: queued -> running -> done | failed. O relatório de erros e avisos
+    fica gravado em disco (report_path) e pode ser baixado a qualquer momento.
+    """
+    id = db.Column(db.String(36), primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    created_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_count = db.Column(db.Integer, nullable=False, default=0)
+    skipped_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    warning_count = db.Column(db.Integer, nullable=False, default=0)
+    rows_per_second = db.Column(db.Float, nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    report_path = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'user_id': self.user_id,
+            'filename': self.filename,
+            'status': self.status,
+            'rows_processed': self.rows_processed,
+            'created': self.created_count,
+            'updated': self.updated_count,
+            'skipped': self.skipped_count,
+            'error_count': self.error_count,
+            'warning_count': self.warning_count,
+            'rows_per_second': self.rows_per_second,
+            'error': self.error_message,
+            'has_report': bool(self.report_path),
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 # Modelos para o sistema de gerenciamento de documentos
 class DocFolder(db.Model):
     """
@@ -510,6 +643,17 @@ class DocFolder(db.Model):
             'path': self.path
         }
 
+class DocFolderClosure(db.Model):
+    """
+    Closure table da hierarquia de pastas (utils/doc_folders.py).
+
+    Uma linha por par (ancestral, descendente), incluindo a própria pasta
+    com depth 0.
+    """
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('doc_folder.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('doc_folder.id', ondelete='CASCADE'), primary_key=True, index=True)
+    depth = db.Column(db.Integer, nullable=False)
+
 class Document(db.Model):
     """
     Documento no sistema de gerenciamento de documentos
@@ -548,6 +692,7 @@ class Document(db.Model):
             data['latest_version'] = latest.version_number
             data['latest_version_date'] = latest.created_at.isoformat()
             data['latest_version_by'] = latest.uploader.name
+            data['thumbnail_url'] = latest.thumbnail_url
             
             if include_versions:
                 data['versions'] = [v.to_dict() for v in self.versions]
@@ -563,7 +708,7 @@ class DocumentVersion(db.Model):
     version_number = db.Column(db.Integer, nullable=False)
     file_path = db.Column(db.String(1024), nullable=False)  # Aumentado de 500 para 1024
     file_name = db.Column(db.String(255), nullable=False)   # Aumentado de 200 para 255
-    file_size = db.Column(db.Integer, nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
     file_type = db.Column(db.String(100), nullable=True)    # Aumentado de 50 para 100
     change_description = db.Column(db.Text, nullable=True)
     uploaded_by = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
@@ -571,6 +716,8 @@ class DocumentVersion(db.Model):
     
     # Relacionamentos
     uploader = db.relationship('Team', backref=db.backref('uploaded_versions', lazy=True))
+    text = db.relationship('DocumentText', backref='version', uselist=False, lazy=True,
+                           cascade="all, delete-orphan")
     
     def to_dict(self):
         return {
@@ -583,5 +730,183 @@ class DocumentVersion(db.Model):
             'change_description': self.change_description,
             'uploaded_by': self.uploaded_by,
             'uploader_name': self.uploader.name,
+            'thumbnail_url': self.thumbnail_url,
             'created_at': self.created_at.isoformat()
         }
+
+    @property
+    def thumbnail_url(self):
+        """URL da miniatura para imagens e PDFs (utils/thumbnails.py), ou None"""
+        if derivative_kind(self.file_name) is None:
+            return None
+        return f"/api/docs/versions/{self.id}/thumbnail"
+
+class DocumentBlob(db.Model):
+    """
+    Conteúdo armazenado por SHA-256 (utils/doc_storage.py).
+
+    ref_count é o número de DocumentVersion que apontam para o blob; o arquivo
+    é apagado quando a contagem chega a zero.
+    """
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'sha256': self.sha256,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class DocumentText(db.Model):
+    """
+    Texto extraído de uma versão de documento (utils/doc_text.py), usado na
+    busca de conteúdo. status: pending, done, failed ou skipped (tipo não
+    suportado ou arquivo grande demais).
+    """
+    version_id = db.Column(db.Integer, db.ForeignKey('document_version.id'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    # Carregado só quando usado: listagens e exclusões não leem o texto
+    content = db.deferred(db.Column(db.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'), nullable=True))
+    char_count = db.Column(db.Integer, nullable=False, default=0)
+    truncated = db.Column(db.Boolean, nullable=False, default=False)
+    error_message = db.Column(db.String(255), nullable=True)
+    extracted_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'version_id': self.version_id,
+            'status': self.status,
+            'char_count': self.char_count,
+            'truncated': self.truncated,
+            'error_message': self.error_message,
+            'extracted_at': self.extracted_at.isoformat() if self.extracted_at else None
+        }
+
+class ProjectStorage(db.Model):
+    """
+    Uso de armazenamento de documentos do projeto (utils/doc_usage.py).
+
+    bytes soma o tamanho de todas as versões (tamanho lógico, antes da
+    deduplicação dos blobs); files conta documentos e versions, versões.
+    quota_bytes nulo usa a cota padrão (DOCS_PROJECT_QUOTA_MB).
+    """
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), primary_key=True)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    files = db.Column(db.Integer, nullable=False, default=0)
+    versions = db.Column(db.Integer, nullable=False, default=0)
+    quota_bytes = db.Column(db.BigInteger, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FolderStorage(db.Model):
+    """
+    Uso de armazenamento de uma pasta, incluindo todas as subpastas
+    (mesmas medidas de ProjectStorage).
+    """
+    folder_id = db.Column(db.Integer, db.ForeignKey('doc_folder.id', ondelete='CASCADE'), primary_key=True)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    files = db.Column(db.Integer, nullable=False, default=0)
+    versions = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DocRetentionPolicy(db.Model):
+    """
+    Política de retenção de versões de documentos de um projeto
+    (utils/doc_retention.py). Uma versão é mantida se atender a qualquer
+    regra: ser a mais recente, estar entre as keep_last mais recentes, ter
+    menos de keep_days dias ou ser a primeira (keep_first). Regras nulas
+    não se aplicam; sem keep_last nem keep_days nada é removido.
+    """
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), primary_key=True)
+    keep_last = db.Column(db.Integer, nullable=True)
+    keep_days = db.Column(db.Integer, nullable=True)
+    keep_first = db.Column(db.Boolean, nullable=False, default=True)
+    updated_by = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'project_id': self.project_id,
+            'keep_last': self.keep_last,
+            'keep_days': self.keep_days,
+            'keep_first': self.keep_first,
+            'updated_by': self.updated_by,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class DocCompactionRun(db.Model):
+    """
+    Execução da compactação de versões de um projeto.
+
+    logical_bytes soma o tamanho das versões removidas; reclaimed_bytes é o
+    espaço efetivamente liberado no disco (blobs sem outras referências).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, completed, failed
+    dry_run = db.Column(db.Boolean, nullable=False, default=False)
+    versions_deleted = db.Column(db.Integer, nullable=False, default=0)
+    logical_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    reclaimed_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'project_id': self.project_id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'dry_run': self.dry_run,
+            'versions_deleted': self.versions_deleted,
+            'logical_bytes': self.logical_bytes,
+            'reclaimed_bytes': self.reclaimed_bytes,
+            'error': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class DocumentUpload(db.Model):
+    """
+    Envio de arquivo em partes (resumível) para o gerenciador de documentos.
+
+    Os bytes vão para um arquivo de staging; `received` é o deslocamento já
+    gravado, usado pelo cliente para retomar após uma desconexão. Ao finalizar
+    é criado o Document (se document_id for nulo) e a DocumentVersion, e o
+    registro de envio é removido.
+    """
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
+    folder_id = db.Column(db.Integer, db.ForeignKey('doc_folder.id'), nullable=False)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True)
+    name = db.Column(db.String(255), nullable=True)
+    description = db.Column(db.Text, nullable=True)
+    change_description = db.Column(db.Text, nullable=True)
+    file_name = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    expected_sha256 = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'project_id': self.project_id,
+            'folder_id': self.folder_id,
+            'document_id': self.document_id,
+            'file_name': self.file_name,
+            'total_size': self.total_size,
+            'offset': self.received,
+            'complete': self.received >= self.total_size,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -12,7 +12,14 @@ from routes import (
     docs,
     gamification,
     ai,
-    profile
+    profile,
+    usage,
+    exports,
+    import_jobs,
+    doc_uploads,
+    media,
+    doc_search,
+    doc_retention
 
 )
 
@@ -36,6 +43,13 @@ def init_app(app):
     gamification.init_app(app)  # Registra as rotas de gamificação
     ai.init_app(app)  # Registra as rotas de AI
     profile.init_app(app)  # Registra as rotas de perfil
+    usage.init_app(app)  # Registra as rotas de telemetria de uso de aplicativos
+    exports.init_app(app)  # Registra as rotas de exportação em streaming (CSV/NDJSON)
+    import_jobs.init_app(app)  # Registra as rotas de acompanhamento de importações
+    doc_uploads.init_app(app)  # Registra as rotas de envio de documentos em partes
+    media.init_app(app)  # Registra as rotas de miniaturas e fotos de perfil
+    doc_search.init_app(app)  # Registra a busca no conteúdo dos documentos
+    doc_retention.init_app(app)  # Registra a retenção e compactação de versões
 
     
 
@@ -6,6 +6,43 @@ import json
 
 from app import *
 from models.db import *
+from sqlalchemy.exc import IntegrityError
+from utils.badges import record_event
+from utils.user_refs import user_ref_from
+
+def last_phase_id(project_id):
+    """Id da última fase do projeto (None se não houver fases)"""
+    return db.session.query(Phase.id).filter_by(project_id=project_id)\
+        .order_by(Phase.order.desc()).limit(1).scalar()
+
+def is_card_completed(card, last_phase=None):
+    """
+    Um card está concluído com 100% ou quando está na última fase do projeto.
+    last_phase (id) evita repetir a consulta quando já é conhecido.
+    """
+    try:
+        if int(card.percentage or 0) >= 100:
+            return True
+    except (TypeError, ValueError):
+        pass
+    if last_phase is None:
+        last_phase = last_phase_id(card.project_id)
+    return last_phase is not None and card.phase_id == last_phase
+
+def record_card_completion(card):
+    """
+    Registra a conclusão do card e o evento 'card_completed' dos responsáveis,
+    uma única vez por card: sair e voltar para a última fase não conta de novo.
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.add(CardCompletion(card_id=card.id))
+    except IntegrityError:
+        return False
+    user_ids = [user.id for user in card.users] or [card.team_id]
+    for completed_by in user_ids:
+        record_event(completed_by, 'card_completed')
+    return True
 
 def init_app(app):
 
@@ -110,6 +147,9 @@ def init_app(app):
         try:
             card = KanbanCard.query.get_or_404(card_id)
             data = request.json
+            # A última fase não muda nesta requisição: consultada uma única vez
+            final_phase = last_phase_id(card.project_id)
+            was_completed = is_card_completed(card, final_phase)
             
             if 'title' in data:
                 card.title = data['title']
@@ -127,7 +167,8 @@ def init_app(app):
             if 'comments' in data:
                 card.comments = data['comments']
             if 'phase_id' in data:  # Atualizado: usar phase_id ao invés de column
-                card.phase_id = data['phase_id']
+                # O modal de edição envia o id como texto
+                card.phase_id = int(data['phase_id'])
             if 'team_id' in data:
                 card.team_id = data['team_id']
             if 'tag_ids' in data:
@@ -135,10 +176,15 @@ def init_app(app):
             if 'user_ids' in data:
                 users = Team.query.filter(Team.id.in_(data['user_ids'])).all()
                 card.users = users
+
+            # Evento de conclusão para as medalhas (apenas na transição e uma vez por card)
+            if not was_completed and is_card_completed(card, final_phase):
+                record_card_completion(card)
                 
             db.session.commit()
             return jsonify({"success": True, "card": card.to_dict()})
         except Exception as e:
+            db.session.rollback()
             return jsonify({"success": False, "error": str(e)}), 400
 
     @app.route('/api/cards/<string:card_id>', methods=['GET'])
@@ -146,7 +192,7 @@ def init_app(app):
         try:
             card = KanbanCard.query.get_or_404(card_id)
             card_data = card.to_dict()
-            card_data['users'] = [user.to_dict() for user in card.users]  # Adiciona explicitamente os usuários
+            card_data['users'] = [user_ref_from(user) for user in card.users]  # Adiciona explicitamente os usuários
             return jsonify(card_data)
         except Exception as e:
             print(f"Error getting card {card_id}: {str(e)}")
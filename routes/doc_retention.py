@@ -0,0 +1,134 @@
+from flask import request, jsonify, session, current_app
+from models.db import db, Project, DocRetentionPolicy, DocCompactionRun
+from auth.authorization import login_required, has_project_access
+from utils.doc_retention import compact_project, run_compaction_job, projects_with_policy, COMPACTION_BATCH_SIZE
+from utils.jobs import submit_job
+import click
+
+
+def _optional_positive_int(data, key):
+    """Valor inteiro >= 1 ou None; levanta ValueError se inválido"""
+    value = data.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f"{key} deve ser um inteiro maior que zero ou null")
+    return value
+
+
+def init_app(app):
+    # Política de retenção e últimas compactações do projeto
+    @app.route('/api/docs/projects/<int:project_id>/retention', methods=['GET'])
+    @login_required
+    def get_retention_policy(project_id):
+        if not has_project_access(project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+
+        policy = db.session.get(DocRetentionPolicy, project_id)
+        runs = DocCompactionRun.query.filter_by(project_id=project_id)\
+            .order_by(DocCompactionRun.id.desc()).limit(10).all()
+        return jsonify({
+            "success": True,
+            "policy": policy.to_dict() if policy else None,
+            "runs": [run.to_dict() for run in runs]
+        })
+
+    # Define a política de retenção do projeto (administradores)
+    @app.route('/api/docs/projects/<int:project_id>/retention', methods=['PUT'])
+    @login_required
+    def set_retention_policy(project_id):
+        if not session.get('is_admin'):
+            return jsonify({"error": "Apenas administradores podem alterar a retenção"}), 403
+        Project.query.get_or_404(project_id)
+
+        data = request.json or {}
+        try:
+            keep_last = _optional_positive_int(data, 'keep_last')
+            keep_days = _optional_positive_int(data, 'keep_days')
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            policy = db.session.get(DocRetentionPolicy, project_id)
+            if policy is None:
+                policy = DocRetentionPolicy(project_id=project_id)
+                db.session.add(policy)
+            policy.keep_last = keep_last
+            policy.keep_days = keep_days
+            policy.keep_first = bool(data.get('keep_first', True))
+            policy.updated_by = session.get('user_id')
+            db.session.commit()
+            return jsonify({"success": True, "policy": policy.to_dict()})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    # Remove a política (todas as versões passam a ser mantidas)
+    @app.route('/api/docs/projects/<int:project_id>/retention', methods=['DELETE'])
+    @login_required
+    def delete_retention_policy(project_id):
+        if not session.get('is_admin'):
+            return jsonify({"error": "Apenas administradores podem alterar a retenção"}), 403
+        policy = db.session.get(DocRetentionPolicy, project_id)
+        if policy:
+            db.session.delete(policy)
+            db.session.commit()
+        return jsonify({"success": True})
+
+    # Inicia a compactação do projeto em segundo plano (dry_run=true apenas estima)
+    @app.route('/api/docs/projects/<int:project_id>/retention/compact', methods=['POST'])
+    @login_required
+    def start_compaction(project_id):
+        if not session.get('is_admin'):
+            return jsonify({"error": "Apenas administradores podem compactar documentos"}), 403
+        if not db.session.get(DocRetentionPolicy, project_id):
+            return jsonify({"error": "Projeto sem política de retenção"}), 400
+
+        running = DocCompactionRun.query.filter(
+            DocCompactionRun.project_id == project_id,
+            DocCompactionRun.status.in_(['pending', 'running'])
+        ).first()
+        if running:
+            return jsonify({"error": "Compactação já em andamento", "run": running.to_dict()}), 409
+
+        try:
+            run = DocCompactionRun(
+                project_id=project_id,
+                user_id=session.get('user_id'),
+                dry_run=request.args.get('dry_run', 'false').lower() == 'true',
+                status='pending'
+            )
+            db.session.add(run)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+        submit_job(current_app._get_current_object(), run_compaction_job, run.id)
+        return jsonify({"success": True, "run": run.to_dict()}), 202
+
+    @app.route('/api/docs/compaction-runs/<int:run_id>')
+    @login_required
+    def get_compaction_run(run_id):
+        run = DocCompactionRun.query.get_or_404(run_id)
+        if not has_project_access(run.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        return jsonify({"success": True, "run": run.to_dict()})
+
+    @app.cli.command('docs-compact')
+    @click.option('--project-id', type=int, default=None, help='Compacta apenas este projeto.')
+    @click.option('--dry-run', is_flag=True, help='Apenas estima o que seria removido.')
+    @click.option('--batch-size', default=COMPACTION_BATCH_SIZE, help='Versões removidas por transação.')
+    def compact_documents(project_id, dry_run, batch_size):
+        """Aplica as políticas de retenção de versões (para execução agendada)."""
+        project_ids = [project_id] if project_id else projects_with_policy()
+        total_versions = total_reclaimed = 0
+        for pid in project_ids:
+            run = compact_project(pid, dry_run=dry_run, batch_size=batch_size)
+            click.echo(f"Projeto {pid}: {run.status}, {run.versions_deleted} versões, "
+                       f"{run.logical_bytes} bytes lógicos, {run.reclaimed_bytes} bytes recuperados"
+                       + (f" ({run.error_message})" if run.error_message else ""))
+            total_versions += run.versions_deleted
+            total_reclaimed += run.reclaimed_bytes
+        verb = "seriam recuperados" if dry_run else "recuperados"
+        click.echo(f"Total: {total_versions} versões, {total_reclaimed} bytes {verb}")
@@ -0,0 +1,81 @@
+from flask import request, jsonify, current_app
+from models.db import db, DocumentVersion, DocumentText
+from auth.authorization import login_required, has_project_access
+from utils.doc_text import (ensure_text_index, search_project_documents, search_terms, submit_extraction,
+                            MAX_TEXT_CHARS)
+import click
+
+
+def init_app(app):
+    with app.app_context():
+        ensure_text_index()
+
+    # Busca no conteúdo e no nome dos documentos de um projeto
+    @app.route('/api/docs/search')
+    @login_required
+    def search_documents():
+        project_id = request.args.get('project_id', type=int)
+        query = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', 50, type=int), 200)
+
+        if not project_id:
+            return jsonify({"error": "ID do projeto é obrigatório"}), 400
+        if not has_project_access(project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        if not search_terms(query):
+            return jsonify({"error": "Informe um termo de busca"}), 400
+
+        results = []
+        for document, version, snippet in search_project_documents(project_id, query, limit):
+            results.append({
+                "document": document.to_dict(),
+                "version_id": version.id if version else None,
+                "version_number": version.version_number if version else None,
+                "snippet": snippet,
+                "matched": "content" if version else "name"
+            })
+        return jsonify({"query": query, "results": results})
+
+    # Situação (e opcionalmente o conteúdo) do texto extraído de uma versão
+    @app.route('/api/docs/versions/<int:version_id>/text')
+    @login_required
+    def get_version_text(version_id):
+        version = DocumentVersion.query.get_or_404(version_id)
+        if not has_project_access(version.document.project_id):
+            return jsonify({"error": "Sem permissão para este documento"}), 403
+
+        if version.text is None:
+            return jsonify({"version_id": version_id, "status": "pending"})
+        data = version.text.to_dict()
+        if request.args.get('include_content') == 'true':
+            data['content'] = version.text.content
+        return jsonify(data)
+
+    @app.cli.command('docs-extract-text')
+    @click.option('--retry-failed', is_flag=True, help='Reprocessa também as extrações que falharam.')
+    @click.option('--batch-size', default=500, help='Versões agendadas por lote.')
+    def extract_missing_text(retry_failed, batch_size):
+        """Extrai o texto das versões que ainda não foram indexadas."""
+        statuses = ['pending', 'failed'] if retry_failed else ['pending']
+        total = {'done': 0, 'failed': 0, 'skipped': 0}
+        app_obj = current_app._get_current_object()
+        last_id = 0
+        while True:
+            version_ids = db.session.scalars(
+                db.select(DocumentVersion.id)
+                .outerjoin(DocumentText, DocumentText.version_id == DocumentVersion.id)
+                .where(DocumentVersion.id > last_id,
+                       db.or_(DocumentText.version_id.is_(None), DocumentText.status.in_(statuses)))
+                .order_by(DocumentVersion.id)
+                .limit(batch_size)
+            ).all()
+            if not version_ids:
+                break
+            futures = [submit_extraction(app_obj, version_id) for version_id in version_ids]
+            for future in futures:
+                status = future.result()
+                if status in total:
+                    total[status] += 1
+            last_id = version_ids[-1]
+            click.echo(f"... até a versão {last_id}: {total}")
+        click.echo(f"Extração concluída (limite de {MAX_TEXT_CHARS} caracteres por versão): {total}")
@@ -0,0 +1,463 @@
+from flask import request, jsonify, session
+from models.db import db, DocFolder, Document, DocumentVersion, DocumentUpload
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from werkzeug.utils import secure_filename
+from auth.authorization import login_required, has_project_access
+from utils.doc_storage import (staging_path, file_sha256, store_blob, save_to_staging, remove_files,
+                               blob_sha, HASH_CHUNK_SIZE)
+from utils.thumbnails import schedule_version_derivatives
+from utils.doc_text import schedule_text_extraction
+from utils.doc_usage import record_usage, quota_error
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mimetypes
+import threading
+import uuid
+import click
+import os
+
+# Tamanho sugerido de cada parte e limite aceito por requisição
+CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Tamanho máximo de um arquivo (total_size declarado no início do envio)
+MAX_UPLOAD_SIZE = int(os.getenv('DOCS_MAX_UPLOAD_MB', 10240)) * 1024 * 1024
+
+# Envio em lote: limite de arquivos por requisição e threads de gravação
+MAX_BATCH_FILES = 200
+BATCH_UPLOAD_WORKERS = int(os.getenv('DOCS_UPLOAD_WORKERS', 4))
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_UPLOAD_WORKERS, thread_name_prefix='docs-upload')
+
+# Estado do SHA-256 dos envios em andamento neste processo:
+# upload_id -> (deslocamento já incluído no hash, objeto hashlib)
+_hashers = {}
+_upload_locks = {}
+_registry_lock = threading.Lock()
+
+def _upload_lock(upload_id):
+    with _registry_lock:
+        return _upload_locks.setdefault(upload_id, threading.Lock())
+
+def _forget(upload_id):
+    with _registry_lock:
+        _hashers.pop(upload_id, None)
+        _upload_locks.pop(upload_id, None)
+
+def _hasher_at(upload):
+    """
+    Hash incremental posicionado em upload.received. Se o envio foi retomado
+    em outro processo (ou após reinício), o estado é reconstruído lendo o
+    arquivo de staging uma única vez.
+    """
+    with _registry_lock:
+        entry = _hashers.get(upload.id)
+    if entry and entry[0] == upload.received:
+        return entry[1]
+
+    path = staging_path(upload.id)
+    if upload.received and os.path.exists(path):
+        return file_sha256(path, limit=upload.received)
+    return hashlib.sha256()
+
+def _get_upload(upload_id):
+    upload = db.session.get(DocumentUpload, upload_id)
+    if not upload or upload.user_id != session.get('user_id'):
+        return None
+    return upload
+
+def _discard(upload):
+    path = staging_path(upload.id)
+    if os.path.exists(path):
+        os.remove(path)
+    _forget(upload.id)
+
+def init_app(app):
+    """
+    Envio de documentos em partes (resumível):
+        POST   /api/docs/uploads                    inicia o envio
+        PUT    /api/docs/uploads/<id>?offset=N      grava uma parte (corpo bruto)
+        GET    /api/docs/uploads/<id>               deslocamento atual, para retomar
+        POST   /api/docs/uploads/<id>/finalize      cria o documento/versão
+        DELETE /api/docs/uploads/<id>               cancela o envio
+    e envio de vários arquivos em uma requisição (POST /api/docs/documents/batch).
+    """
+
+    @app.route('/api/docs/uploads', methods=['POST'])
+    @login_required
+    def init_document_upload():
+        """Inicia um envio para um novo documento ou para uma nova versão (document_id)"""
+        data = request.json or {}
+        user_id = session.get('user_id')
+
+        file_name = secure_filename(data.get('file_name', ''))
+        if not file_name:
+            return jsonify({"error": "Nome do arquivo vazio"}), 400
+
+        total_size = data.get('total_size')
+        if total_size is None:
+            return jsonify({"error": "total_size é obrigatório"}), 400
+        if isinstance(total_size, bool):
+            return jsonify({"error": "total_size inválido"}), 400
+        try:
+            total_size = int(total_size)
+        except (TypeError, ValueError, OverflowError):
+            return jsonify({"error": "total_size inválido"}), 400
+        if total_size < 0:
+            return jsonify({"error": "total_size inválido"}), 400
+        if total_size > MAX_UPLOAD_SIZE:
+            return jsonify({"error": f"Arquivo excede o limite de {MAX_UPLOAD_SIZE // (1024 * 1024)} MB"}), 413
+
+        expected_sha256 = (data.get('sha256') or '').lower() or None
+        if expected_sha256 and len(expected_sha256) != 64:
+            return jsonify({"error": "sha256 inválido"}), 400
+
+        document_id = data.get('document_id')
+        if document_id:
+            document = db.session.get(Document, document_id)
+            if not document:
+                return jsonify({"error": "Documento não encontrado"}), 404
+            folder_id, project_id = document.folder_id, document.project_id
+            name = document.name
+        else:
+            name = (data.get('name') or '').strip()
+            folder_id = data.get('folder_id')
+            project_id = data.get('project_id')
+            if not name or not folder_id or not project_id:
+                return jsonify({"error": "Informações incompletas"}), 400
+            folder = db.session.get(DocFolder, folder_id)
+            if not folder or str(folder.project_id) != str(project_id):
+                return jsonify({"error": "Pasta não encontrada"}), 404
+
+        if not has_project_access(project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+
+        error = quota_error(project_id, total_size)
+        if error:
+            return jsonify({"error": error}), 413
+
+        try:
+            upload = DocumentUpload(
+                id=str(uuid.uuid4()),
+                user_id=user_id,
+                project_id=project_id,
+                folder_id=folder_id,
+                document_id=document_id,
+                name=name,
+                description=data.get('description', ''),
+                change_description=(data.get('change_description') or '').strip(),
+                file_name=file_name,
+                total_size=total_size,
+                received=0,
+                expected_sha256=expected_sha256
+            )
+            db.session.add(upload)
+            db.session.commit()
+
+            # Cria o arquivo de staging vazio
+            open(staging_path(upload.id), 'wb').close()
+
+            data = upload.to_dict()
+            data['chunk_size'] = CHUNK_SIZE
+            return jsonify({"success": True, "upload": data}), 201
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/docs/uploads/<upload_id>', methods=['GET'])
+    @login_required
+    def get_document_upload(upload_id):
+        """Estado do envio; o cliente retoma a partir de 'offset'"""
+        upload = _get_upload(upload_id)
+        if not upload:
+            return jsonify({"error": "Envio não encontrado"}), 404
+        return jsonify({"success": True, "upload": upload.to_dict()})
+
+    @app.route('/api/docs/uploads/<upload_id>', methods=['PUT'])
+    @login_required
+    def put_document_chunk(upload_id):
+        """
+        Grava uma parte a partir de ?offset=N, lendo o corpo em streaming
+        direto para o staging e atualizando o SHA-256. Se a conexão cair no
+        meio, os bytes recebidos são mantidos e o deslocamento avança até eles.
+        """
+        upload = _get_upload(upload_id)
+        if not upload:
+            return jsonify({"error": "Envio não encontrado"}), 404
+
+        try:
+            offset = int(request.args.get('offset', upload.received))
+        except ValueError:
+            return jsonify({"error": "offset inválido"}), 400
+
+        length = request.content_length
+        if length is not None and length > MAX_CHUNK_SIZE:
+            return jsonify({"error": f"Parte maior que o limite de {MAX_CHUNK_SIZE} bytes"}), 413
+
+        with _upload_lock(upload_id):
+            db.session.refresh(upload)
+            if offset != upload.received:
+                return jsonify({
+                    "error": "Deslocamento fora de ordem",
+                    "offset": upload.received
+                }), 409
+
+            path = staging_path(upload_id)
+            if not os.path.exists(path):
+                if upload.received:
+                    # Staging perdido (ex.: outro servidor): o envio recomeça do início
+                    upload.received = 0
+                    db.session.commit()
+                    return jsonify({"error": "Arquivo parcial não encontrado", "offset": 0}), 409
+                open(path, 'wb').close()
+
+            hasher = _hasher_at(upload)
+            written = 0
+            interrupted = None
+            with open(path, 'r+b') as f:
+                # Descarta bytes além do deslocamento confirmado (parte anterior incompleta)
+                f.seek(offset)
+                f.truncate()
+                try:
+                    while True:
+                        chunk = request.stream.read(HASH_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        if offset + written + len(chunk) > upload.total_size:
+                            interrupted = "Dados além do tamanho total declarado"
+                            break
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        written += len(chunk)
+                except Exception as e:
+                    interrupted = f"Conexão interrompida: {e}"
+
+            new_offset = offset + written
+            result = db.session.execute(
+                update(DocumentUpload)
+                .where(DocumentUpload.id == upload_id, DocumentUpload.received == offset)
+                .values(received=new_offset, updated_at=datetime.utcnow())
+            )
+            db.session.commit()
+            if result.rowcount != 1:
+                _forget(upload_id)
+                return jsonify({"error": "Envio alterado por outra requisição"}), 409
+
+            with _registry_lock:
+                _hashers[upload_id] = (new_offset, hasher)
+
+        status = 400 if interrupted else 200
+        return jsonify({
+            "success": not interrupted,
+            "error": interrupted,
+            "offset": new_offset,
+            "complete": new_offset >= upload.total_size
+        }), status
+
+    @app.route('/api/docs/uploads/<upload_id>/finalize', methods=['POST'])
+    @login_required
+    def finalize_document_upload(upload_id):
+        """Confere tamanho e SHA-256 e só então cria o documento e a versão"""
+        upload = _get_upload(upload_id)
+        if not upload:
+            return jsonify({"error": "Envio não encontrado"}), 404
+
+        with _upload_lock(upload_id):
+            db.session.refresh(upload)
+            if upload.received != upload.total_size:
+                return jsonify({
+                    "error": "Envio incompleto",
+                    "offset": upload.received,
+                    "total_size": upload.total_size
+                }), 409
+
+            digest = _hasher_at(upload).hexdigest()
+            if upload.expected_sha256 and upload.expected_sha256 != digest:
+                # Conteúdo corrompido: recomeça do zero
+                _discard(upload)
+                db.session.delete(upload)
+                db.session.commit()
+                return jsonify({"error": "SHA-256 não confere", "sha256": digest}), 422
+
+            # A cota pode ter sido consumida por outros envios desde o início
+            error = quota_error(upload.project_id, upload.total_size)
+            if error:
+                return jsonify({"error": error}), 413
+
+            try:
+                user_id = upload.user_id
+
+                if upload.document_id:
+                    document = db.session.get(Document, upload.document_id)
+                    if not document:
+                        return jsonify({"error": "Documento não encontrado"}), 404
+                    next_version = (db.session.query(func.max(DocumentVersion.version_number))
+                                    .filter_by(document_id=document.id).scalar() or 0) + 1
+                    change_description = upload.change_description
+                    document.updated_at = datetime.utcnow()
+                else:
+                    document = Document(
+                        name=upload.name,
+                        description=upload.description,
+                        folder_id=upload.folder_id,
+                        project_id=upload.project_id,
+                        created_by=user_id
+                    )
+                    db.session.add(document)
+                    db.session.flush()
+                    next_version = 1
+                    change_description = "Versão inicial"
+
+                file_path = store_blob(staging_path(upload.id), digest, upload.total_size)
+
+                version = DocumentVersion(
+                    document_id=document.id,
+                    version_number=next_version,
+                    file_path=file_path,
+                    file_name=upload.file_name,
+                    file_size=upload.total_size,
+                    file_type=mimetypes.guess_type(upload.file_name)[0],
+                    change_description=change_description,
+                    uploaded_by=user_id
+                )
+                db.session.add(version)
+                record_usage(document.project_id, document.folder_id, upload.total_size,
+                             0 if upload.document_id else 1, 1)
+                db.session.delete(upload)
+                db.session.commit()
+                _forget(upload_id)
+                schedule_version_derivatives(version)
+                schedule_text_extraction(version)
+
+                return jsonify({
+                    "success": True,
+                    "document": document.to_dict(),
+                    "version": version.to_dict(),
+                    "sha256": digest
+                })
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({"error": str(e)}), 500
+
+    @app.route('/api/docs/uploads/<upload_id>', methods=['DELETE'])
+    @login_required
+    def cancel_document_upload(upload_id):
+        """Cancela o envio e remove o arquivo de staging"""
+        upload = _get_upload(upload_id)
+        if not upload:
+            return jsonify({"error": "Envio não encontrado"}), 404
+
+        with _upload_lock(upload_id):
+            _discard(upload)
+            db.session.delete(upload)
+            db.session.commit()
+        return jsonify({"success": True})
+
+    @app.route('/api/docs/documents/batch', methods=['POST'])
+    @login_required
+    def create_documents_batch():
+        """
+        Cria vários documentos de uma vez (campo 'files' repetido no multipart).
+        Os arquivos são gravados em paralelo no staging e todos os Document e
+        DocumentVersion são criados em uma única transação. Campos opcionais:
+        'names' (um por arquivo, na mesma ordem) e 'description'.
+        """
+        user_id = session.get('user_id')
+        files = [f for f in request.files.getlist('files') if f and f.filename]
+        folder_id = request.form.get('folder_id')
+        project_id = request.form.get('project_id')
+        description = request.form.get('description', '')
+        names = request.form.getlist('names')
+
+        if not files:
+            return jsonify({"error": "Nenhum arquivo enviado"}), 400
+        if len(files) > MAX_BATCH_FILES:
+            return jsonify({"error": f"Máximo de {MAX_BATCH_FILES} arquivos por envio"}), 400
+        if not folder_id or not project_id:
+            return jsonify({"error": "Informações incompletas"}), 400
+
+        folder = db.session.get(DocFolder, folder_id)
+        if not folder or str(folder.project_id) != str(project_id):
+            return jsonify({"error": "Pasta não encontrada"}), 404
+        if not has_project_access(project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+
+        # Grava no staging (com SHA-256) em paralelo
+        futures = [_batch_executor.submit(save_to_staging, f.stream) for f in files]
+        results = []
+        staged = []
+        for index, (file, future) in enumerate(zip(files, futures)):
+            file_name = secure_filename(file.filename)
+            name = (names[index].strip() if index < len(names) else '') or file.filename
+            try:
+                staged_path, sha256, size = future.result()
+                staged.append((index, name, file_name, staged_path, sha256, size))
+                results.append({"file_name": file.filename, "success": True})
+            except Exception as e:
+                results.append({"file_name": file.filename, "success": False, "error": str(e)})
+
+        error = quota_error(folder.project_id, sum(entry[5] for entry in staged))
+        if error:
+            remove_files([entry[3] for entry in staged])
+            return jsonify({"error": error, "results": results}), 413
+
+        try:
+            documents = []
+            for index, name, file_name, staged_path, sha256, size in staged:
+                document = Document(
+                    name=name[:255],
+                    description=description,
+                    folder_id=folder.id,
+                    project_id=folder.project_id,
+                    created_by=user_id
+                )
+                documents.append((index, document, file_name, staged_path, sha256, size))
+            db.session.add_all([document for _, document, *_ in documents])
+            db.session.flush()  # Um único flush para obter todos os IDs
+
+            versions = []
+            for index, document, file_name, staged_path, sha256, size in documents:
+                versions.append((index, document, DocumentVersion(
+                    document_id=document.id,
+                    version_number=1,
+                    file_path=store_blob(staged_path, sha256, size),
+                    file_name=file_name,
+                    file_size=size,
+                    file_type=mimetypes.guess_type(file_name)[0],
+                    change_description="Versão inicial",
+                    uploaded_by=user_id
+                )))
+            db.session.add_all([version for _, _, version in versions])
+            record_usage(folder.project_id, folder.id, sum(entry[5] for entry in staged),
+                         len(versions), len(versions))
+            db.session.commit()
+            schedule_version_derivatives(*[version for _, _, version in versions])
+            schedule_text_extraction(*[version for _, _, version in versions])
+
+            for index, document, version in versions:
+                results[index]["document"] = document.to_dict()
+                results[index]["sha256"] = blob_sha(version.file_path)
+        except Exception as e:
+            db.session.rollback()
+            remove_files([entry[3] for entry in staged])
+            return jsonify({"error": f"Erro ao criar documentos: {str(e)}", "results": results}), 500
+
+        created = sum(1 for r in results if r["success"])
+        return jsonify({
+            "success": created == len(results),
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }), 200 if created else 400
+
+    @app.cli.command('docs-uploads-prune')
+    @click.option('--hours', default=48, help='Remove envios sem atividade há mais de N horas.')
+    def prune_document_uploads(hours):
+        """Remove envios em partes abandonados e seus arquivos de staging."""
+        cutoff = datetime.utcnow() - timedelta(hours=hours)
+        uploads = DocumentUpload.query.filter(DocumentUpload.updated_at < cutoff).all()
+        for upload in uploads:
+            _discard(upload)
+            db.session.delete(upload)
+        db.session.commit()
+        click.echo(f"{len(uploads)} envios abandonados removidos")
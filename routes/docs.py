@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, g
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, g
 from flask import Blueprint, current_app
 from werkzeug.utils import secure_filename
 import os
@@ -6,22 +6,79 @@ import uuid
 from datetime import datetime
 import mimetypes
 import shutil
+import click
+from concurrent.futures import ThreadPoolExecutor
 
-from auth.authorization import login_required
-from models.db import db, Project, Team, DocFolder, Document, DocumentVersion
+from auth.authorization import login_required, has_project_access
+from models.db import db, Project, Team, DocFolder, Document, DocumentVersion, DocumentBlob, ProjectStorage, FolderStorage
+from utils.doc_downloads import send_document_version
+from utils.doc_zip import zip_response, unique_arcname
+from utils.thumbnails import schedule_version_derivatives, AVATAR_DIR
+from utils.storage import get_storage
+from utils.doc_text import schedule_text_extraction
+from utils.doc_usage import (record_usage, quota_error, subtree_totals, forget_folders, project_usage,
+                             usage_dict, reconcile_usage, ensure_usage)
+from utils.doc_consistency import check_consistency, SCAN_BATCH_SIZE, ORPHAN_GRACE_SECONDS
+from utils.doc_folders import (add_folder, subtree_ids, get_subtree, get_ancestors, folders_with_children,
+                               is_descendant, remove_subtree, move_subtree, rewrite_paths,
+                               rebuild_closure, ensure_closure, provision_projects)
+from utils.doc_storage import (UPLOAD_BASE, BLOB_DIR, get_project_path, save_to_staging, store_blob,
+                               release_blobs, remove_blobs, remove_files, blob_sha, file_sha256, staging_path,
+                               ensure_size_columns)
+from utils.logger import setup_logger
 
 docs_bp = Blueprint('docs', __name__, url_prefix='/docs')
+logger = setup_logger('docs')
+
+# Tamanho de página do histórico de versões
+VERSIONS_PER_PAGE = 20
+MAX_VERSIONS_PER_PAGE = 100
 
 # Base para armazenamento de arquivos
-UPLOAD_BASE = 'Uploads'
 if not os.path.exists(UPLOAD_BASE):
     os.makedirs(UPLOAD_BASE)
 
-def get_project_path(project_id):
-    return os.path.join(UPLOAD_BASE, 'Projects', str(project_id))
+def latest_versions(document_ids):
+    """Versão mais recente de cada documento, em uma única consulta"""
+    if not document_ids:
+        return []
+    latest = db.select(
+        DocumentVersion.document_id,
+        db.func.max(DocumentVersion.version_number).label('version_number')
+    ).where(DocumentVersion.document_id.in_(list(document_ids)))\
+     .group_by(DocumentVersion.document_id).subquery()
+    return db.session.scalars(
+        db.select(DocumentVersion).join(latest, db.and_(
+            DocumentVersion.document_id == latest.c.document_id,
+            DocumentVersion.version_number == latest.c.version_number
+        ))
+    ).all()
+
+def versions_page(document_id, page, per_page):
+    """Página do histórico de versões (mais recentes primeiro)"""
+    pagination = db.paginate(
+        db.select(DocumentVersion)
+        .where(DocumentVersion.document_id == document_id)
+        .order_by(DocumentVersion.version_number.desc()),
+        page=page, per_page=per_page, error_out=False
+    )
+    return {
+        'versions': [v.to_dict() for v in pagination.items],
+        'versions_page': {
+            'page': pagination.page,
+            'per_page': pagination.per_page,
+            'total': pagination.total,
+            'pages': pagination.pages
+        }
+    }
 
 def init_app(app):
     app.register_blueprint(docs_bp)
+
+    with app.app_context():
+        ensure_size_columns()
+        ensure_closure()
+        ensure_usage()
     
     # Rota principal da página de documentos
     @app.route('/docs')
@@ -66,36 +123,23 @@ def init_app(app):
             if not has_access:
                 return jsonify({"error": "Sem permissão para este projeto"}), 403
         
-        # Cria o diretório do projeto se não existir
-        project_path = get_project_path(project_id)
-        if not os.path.exists(project_path):
-            os.makedirs(project_path)
-            
-        # Busca pasta raiz do projeto se não foi especificado folder_id
+        # Somente leitura: a pasta raiz é criada junto com o projeto (provision_project)
         if folder_id:
             folder = DocFolder.query.get(folder_id)
             folders = DocFolder.query.filter_by(parent_id=folder_id).all()
             documents = Document.query.filter_by(folder_id=folder_id).all()
         else:
-            # Cria pasta raiz se não existir
             root_folder = DocFolder.query.filter_by(project_id=project_id, parent_id=None).first()
             if not root_folder:
-                root_folder = DocFolder(
-                    name=f"Projeto {project_id}",
-                    project_id=project_id,
-                    parent_id=None,
-                    created_by=user_id,
-                    path=project_path
-                )
-                db.session.add(root_folder)
-                db.session.commit()
+                return jsonify({"error": "Projeto sem pasta de documentos"}), 404
                 
             folders = DocFolder.query.filter_by(project_id=project_id, parent_id=None).all()
             documents = Document.query.filter_by(project_id=project_id, folder_id=root_folder.id).all()
             folder = root_folder
         
-        # Constrói estrutura de pastas
+        # Constrói estrutura de pastas ("has_children" de todas em uma consulta)
         def build_folder_tree(folders_list):
+            with_children = folders_with_children([f.id for f in folders_list])
             result = []
             for f in folders_list:
                 result.append({
@@ -104,15 +148,20 @@ def init_app(app):
                     'description': f.description,
                     'created_by': f.creator.name,
                     'created_at': f.created_at.isoformat(),
-                    'has_children': bool(DocFolder.query.filter_by(parent_id=f.id).first())
+                    'has_children': f.id in with_children
                 })
             return result
             
-        return jsonify({
+        response = jsonify({
             'folder': folder.to_dict() if folder else None,
+            'breadcrumbs': [{'id': f.id, 'name': f.name} for f in get_ancestors(folder.id)] if folder else [],
             'subfolders': build_folder_tree(folders),
             'documents': [doc.to_dict() for doc in documents]
         })
+        # Revalidação pela ETag do conteúdo: sem alterações a resposta é 304
+        response.add_etag()
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
         
     # API para criar nova pasta
     @app.route('/api/docs/folders', methods=['POST'])
@@ -159,6 +208,8 @@ def init_app(app):
         )
         
         db.session.add(new_folder)
+        db.session.flush()
+        add_folder(new_folder.id, parent_id)
         db.session.commit()
         
         return jsonify({
@@ -178,14 +229,26 @@ def init_app(app):
             return jsonify({"error": "Não é possível excluir a pasta raiz"}), 400
         
         try:
-            # Remove diretório físico
-            if os.path.exists(folder.path):
-                shutil.rmtree(folder.path)
+            # Libera os blobs de todas as versões da subárvore
+            file_paths = db.session.scalars(
+                db.select(DocumentVersion.file_path)
+                .join(Document, Document.id == DocumentVersion.document_id)
+                .where(Document.folder_id.in_(subtree_ids(folder.id)))
+            ).all()
+            orphan_blobs = release_blobs(file_paths)
+            size, files, versions = subtree_totals(folder.id)
+            record_usage(folder.project_id, folder.parent_id, -size, -files, -versions)
+            forget_folders(remove_subtree(folder.id))
                 
             # Remove registro do banco
             db.session.delete(folder)
             db.session.commit()
             
+            # Remove os arquivos somente após o commit
+            remove_blobs(orphan_blobs)
+            if os.path.exists(folder.path):
+                shutil.rmtree(folder.path)
+            
             return jsonify({"success": True})
         except Exception as e:
             db.session.rollback()
@@ -231,17 +294,237 @@ def init_app(app):
             if os.path.exists(old_path):
                 try:
                     os.rename(old_path, new_path)
-                    folder.path = new_path
                 except OSError as e:
                     return jsonify({"error": f"Erro ao renomear diretório: {str(e)}"}), 500
+                
+                # Atualiza o caminho da pasta e de todos os descendentes de uma vez
+                rewrite_paths(folder.id, old_path, new_path)
             
             db.session.commit()
+            db.session.refresh(folder)
             return jsonify({"success": True, "folder": folder.to_dict()})
             
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
     
+    # API para mover pasta
+    @app.route('/api/docs/folders/<int:folder_id>/move', methods=['POST'])
+    @login_required
+    def move_folder(folder_id):
+        """Mover pasta (com toda a subárvore) para outra pasta do mesmo projeto"""
+        folder = DocFolder.query.get_or_404(folder_id)
+        if not has_project_access(folder.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+
+        data = request.json or {}
+        new_parent = DocFolder.query.get(data.get('parent_id')) if data.get('parent_id') else None
+
+        if folder.parent_id is None:
+            return jsonify({"error": "Não é possível mover a pasta raiz"}), 400
+        if not new_parent:
+            return jsonify({"error": "Pasta de destino não encontrada"}), 404
+        if not has_project_access(new_parent.project_id):
+            return jsonify({"error": "Sem permissão para o projeto de destino"}), 403
+        if new_parent.project_id != folder.project_id:
+            return jsonify({"error": "A pasta de destino pertence a outro projeto"}), 400
+        if is_descendant(new_parent.id, folder.id):
+            return jsonify({"error": "Não é possível mover uma pasta para dentro dela mesma"}), 400
+        if new_parent.id == folder.parent_id:
+            return jsonify({"success": True, "folder": folder.to_dict()})
+
+        existing_folder = DocFolder.query.filter_by(parent_id=new_parent.id, name=folder.name).first()
+        if existing_folder:
+            return jsonify({"error": "Já existe uma pasta com este nome no destino"}), 400
+
+        old_path = folder.path
+        new_path = os.path.join(new_parent.path, os.path.basename(old_path))
+        renamed = False
+        try:
+            if os.path.exists(old_path):
+                os.makedirs(new_parent.path, exist_ok=True)
+                os.rename(old_path, new_path)
+                renamed = True
+            
+            # Os totais da subárvore saem dos ancestrais antigos e entram nos novos
+            size, files, versions = subtree_totals(folder.id)
+            record_usage(folder_id=folder.parent_id, size=-size, files=-files, versions=-versions)
+            move_subtree(folder.id, new_parent.id)
+            record_usage(folder_id=new_parent.id, size=size, files=files, versions=versions)
+            rewrite_paths(folder.id, old_path, new_path)
+            db.session.commit()
+            db.session.refresh(folder)
+            
+            return jsonify({"success": True, "folder": folder.to_dict()})
+        except Exception as e:
+            db.session.rollback()
+            # O banco continua apontando para o caminho antigo: desfaz a renomeação
+            if renamed:
+                try:
+                    os.rename(new_path, old_path)
+                except OSError as rename_error:
+                    logger.error(f"Pasta {folder_id} ficou em {new_path} após falha ao mover: {rename_error}")
+            return jsonify({"error": str(e)}), 500
+    
+    # API para obter a subárvore completa de uma pasta
+    @app.route('/api/docs/folders/<int:folder_id>/tree')
+    @login_required
+    def get_folder_tree(folder_id):
+        """Subárvore completa da pasta (lista plana com parent_id e profundidade)"""
+        folder = DocFolder.query.get_or_404(folder_id)
+        if not has_project_access(folder.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        
+        return jsonify({
+            "success": True,
+            "folders": [{
+                'id': f.id,
+                'name': f.name,
+                'parent_id': f.parent_id,
+                'depth': depth
+            } for f, depth in get_subtree(folder.id)]
+        })
+    
+    # API para obter os ancestrais (breadcrumbs) de uma pasta
+    @app.route('/api/docs/folders/<int:folder_id>/breadcrumbs')
+    @login_required
+    def get_folder_breadcrumbs(folder_id):
+        """Caminho da pasta raiz até a pasta informada"""
+        folder = DocFolder.query.get_or_404(folder_id)
+        if not has_project_access(folder.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        
+        return jsonify({
+            "success": True,
+            "breadcrumbs": [{'id': f.id, 'name': f.name} for f in get_ancestors(folder.id)]
+        })
+    
+    # API para obter o uso de armazenamento de um projeto
+    @app.route('/api/docs/projects/<int:project_id>/storage')
+    @login_required
+    def get_project_storage(project_id):
+        """Bytes, documentos e versões do projeto, com a cota vigente"""
+        if not has_project_access(project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        return jsonify({"success": True, "project_id": project_id, "usage": project_usage(project_id)})
+
+    # API para definir a cota de armazenamento de um projeto (administradores)
+    @app.route('/api/docs/projects/<int:project_id>/storage/quota', methods=['PUT'])
+    @login_required
+    def set_project_quota(project_id):
+        """Define a cota em bytes (quota_bytes); null volta à cota padrão"""
+        if not session.get('is_admin'):
+            return jsonify({"error": "Apenas administradores podem alterar cotas"}), 403
+        Project.query.get_or_404(project_id)
+
+        quota = (request.json or {}).get('quota_bytes')
+        if quota is not None and (not isinstance(quota, int) or quota < 0):
+            return jsonify({"error": "quota_bytes inválido"}), 400
+
+        try:
+            row = db.session.get(ProjectStorage, project_id)
+            if row is None:
+                row = ProjectStorage(project_id=project_id, bytes=0, files=0, versions=0)
+                db.session.add(row)
+            row.quota_bytes = quota
+            db.session.commit()
+            return jsonify({"success": True, "usage": project_usage(project_id)})
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 500
+
+    # API para obter o uso de armazenamento de uma pasta (com subpastas)
+    @app.route('/api/docs/folders/<int:folder_id>/storage')
+    @login_required
+    def get_folder_storage(folder_id):
+        folder = DocFolder.query.get_or_404(folder_id)
+        if not has_project_access(folder.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        return jsonify({
+            "success": True,
+            "folder_id": folder.id,
+            "usage": usage_dict(db.session.get(FolderStorage, folder.id))
+        })
+
+    @app.cli.command('docs-storage-reconcile')
+    @click.option('--fix', is_flag=True, help='Regrava os contadores divergentes.')
+    @click.option('--workers', default=8, help='Threads para conferir os arquivos no disco.')
+    @click.option('--skip-disk', is_flag=True, help='Não confere os arquivos no disco.')
+    def reconcile_storage(fix, workers, skip_disk):
+        """Confere os contadores de armazenamento com o banco e o disco."""
+        report = reconcile_usage(fix=fix, workers=workers, check_disk=not skip_disk)
+        for entry in report['projects_drift']:
+            click.echo(f"Projeto {entry['project_id']}: gravado {entry['stored']}, esperado {entry['expected']}")
+        for entry in report['folders_drift']:
+            click.echo(f"Pasta {entry['folder_id']}: gravado {entry['stored']}, esperado {entry['expected']}")
+        if not skip_disk:
+            for issue in report['file_issues']:
+                click.echo(f"{issue['issue']}: {issue['path']} (esperado {issue['expected_size']}, "
+                           f"encontrado {issue['actual_size']})")
+            click.echo(f"Arquivos: {report['files']}")
+        drift = len(report['projects_drift']) + len(report['folders_drift'])
+        click.echo(f"{drift} contadores divergentes" + (" corrigidos" if report.get('fixed') else ""))
+
+    @app.cli.command('docs-consistency-scan')
+    @click.option('--repair', is_flag=True, help='Aplica as correções automáticas em lotes.')
+    @click.option('--workers', default=8, help='Threads para percorrer Uploads/.')
+    @click.option('--batch-size', default=SCAN_BATCH_SIZE, help='Itens corrigidos por transação.')
+    @click.option('--grace-minutes', default=ORPHAN_GRACE_SECONDS // 60,
+                  help='Arquivos mais recentes que isso não são tratados como órfãos.')
+    def consistency_scan(repair, workers, batch_size, grace_minutes):
+        """Confere Uploads/ com pastas, documentos, versões e blobs do banco."""
+        report = check_consistency(repair=repair, workers=workers, batch_size=batch_size,
+                                   grace_seconds=grace_minutes * 60)
+        for category, entries in report['issues'].items():
+            for entry in entries:
+                click.echo(f"{category}: " + ", ".join(f"{key}={value}" for key, value in entry.items()))
+        click.echo(f"Varredura: {report['scanned']}")
+        click.echo(f"Problemas: {report['counts'] or 'nenhum'}")
+        if 'repaired' in report:
+            click.echo(f"Corrigidos: {report['repaired']} ({report['freed_bytes']} bytes liberados)")
+
+    @app.cli.command('docs-storage-push')
+    @click.option('--workers', default=8, help='Envios simultâneos.')
+    @click.option('--delete-local', is_flag=True, help='Apaga as cópias locais após o envio.')
+    def push_storage(workers, delete_local):
+        """Copia blobs e fotos de perfil do disco para o armazenamento remoto configurado."""
+        storage = get_storage()
+        if storage.local:
+            click.echo("STORAGE_BACKEND=local: nada a enviar")
+            return
+
+        paths = [os.path.join(root, name)
+                 for directory in (BLOB_DIR, AVATAR_DIR)
+                 for root, _, names in os.walk(directory) for name in names]
+
+        def push(path):
+            if storage.exists(path):
+                return False
+            storage.put_file(path, path, move=False)
+            return True
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            uploaded = sum(pool.map(push, paths))
+        if delete_local:
+            remove_files(paths)
+        click.echo(f"{uploaded} arquivos enviados, {len(paths) - uploaded} já existiam")
+
+    @app.cli.command('docs-provision-projects')
+    @click.option('--user-id', type=int, default=None,
+                  help='Responsável pelas pastas raiz (padrão: o primeiro administrador).')
+    def provision_project_folders(user_id):
+        """Cria a pasta raiz e o diretório dos projetos que ainda não têm."""
+        provisioned = provision_projects(user_id)
+        click.echo(f"{len(provisioned)} projetos provisionados" +
+                   (f": {', '.join(map(str, provisioned))}" if provisioned else ""))
+
+    @app.cli.command('docs-rebuild-folder-closure')
+    def rebuild_folder_closure():
+        """Reconstrói a closure table de pastas a partir de DocFolder.parent_id."""
+        levels = rebuild_closure()
+        db.session.commit()
+        click.echo(f"Hierarquia de pastas reconstruída ({levels} níveis)")
+    
     # API para criar um novo documento
     @app.route('/api/docs/documents', methods=['POST'])
     @login_required
@@ -284,22 +567,17 @@ def init_app(app):
             db.session.add(new_doc)
             db.session.flush()  # Obtém ID sem commit
             
-            # Cria diretório para o documento
-            doc_dir = os.path.join(folder.path, f"doc_{new_doc.id}")
-            os.makedirs(doc_dir, exist_ok=True)
-                
-            # Salva o arquivo com nome seguro
+            # Grava o conteúdo no repositório de blobs (deduplicado por SHA-256)
             filename = secure_filename(file.filename)
-            file_path = os.path.join(doc_dir, f"1_{filename}")  # Versão 1
-            
-            # Garante que o arquivo seja salvo corretamente
-            file.save(file_path)
-            
-            if not os.path.exists(file_path):
-                raise Exception("Falha ao salvar o arquivo")
+            staged_path, sha256, file_size = save_to_staging(file.stream)
+            error = quota_error(folder.project_id, file_size)
+            if error:
+                remove_files([staged_path])
+                db.session.rollback()
+                return jsonify({"error": error}), 413
+            file_path = store_blob(staged_path, sha256, file_size)
             
             # Cria a primeira versão
-            file_size = os.path.getsize(file_path)
             file_type = mimetypes.guess_type(filename)[0]
             
             new_version = DocumentVersion(
@@ -314,7 +592,10 @@ def init_app(app):
             )
             
             db.session.add(new_version)
+            record_usage(folder.project_id, folder.id, file_size, 1, 1)
             db.session.commit()
+            schedule_version_derivatives(new_version)
+            schedule_text_extraction(new_version)
             
             return jsonify({
                 "success": True,
@@ -324,8 +605,6 @@ def init_app(app):
         except Exception as e:
             print(f"Erro ao criar documento: {str(e)}")  # Log do erro
             db.session.rollback()
-            if os.path.exists(doc_dir):
-                shutil.rmtree(doc_dir)  # Limpa arquivos em caso de erro
             return jsonify({"error": f"Erro ao criar documento: {str(e)}"}), 500
     
     # API para enviar nova versão de documento
@@ -355,20 +634,15 @@ def init_app(app):
             if document.versions:
                 next_version = max([v.version_number for v in document.versions]) + 1
             
-            # Cria diretório para o documento se não existir
-            folder = DocFolder.query.get(document.folder_id)
-            doc_dir = os.path.join(folder.path, f"doc_{document.id}")
-            if not os.path.exists(doc_dir):
-                os.makedirs(doc_dir)
-                
-            # Salva o arquivo
+            # Grava o conteúdo no repositório de blobs (deduplicado por SHA-256)
             filename = secure_filename(file.filename)
-            file_path = os.path.join(doc_dir, f"{next_version}_{filename}")
-            file.save(file_path)
-            
-            # Cria a nova versão
-            file_size = os.path.getsize(file_path)
-            file_type = mimetypes.guess_type(file_path)[0]
+            staged_path, sha256, file_size = save_to_staging(file.stream)
+            error = quota_error(document.project_id, file_size)
+            if error:
+                remove_files([staged_path])
+                return jsonify({"error": error}), 413
+            file_path = store_blob(staged_path, sha256, file_size)
+            file_type = mimetypes.guess_type(filename)[0]
             
             new_version = DocumentVersion(
                 document_id=document.id,
@@ -385,7 +659,10 @@ def init_app(app):
             document.updated_at = datetime.utcnow()
             
             db.session.add(new_version)
+            record_usage(document.project_id, document.folder_id, file_size, 0, 1)
             db.session.commit()
+            schedule_version_derivatives(new_version)
+            schedule_text_extraction(new_version)
             
             return jsonify({
                 "success": True,
@@ -403,8 +680,27 @@ def init_app(app):
         include_versions = request.args.get('include_versions', 'false').lower() == 'true'
         
         document = Document.query.get_or_404(doc_id)
+        data = document.to_dict()
+        
+        # Histórico paginado (page, per_page) em vez de todas as versões
+        if include_versions:
+            page = request.args.get('page', 1, type=int)
+            per_page = min(request.args.get('per_page', VERSIONS_PER_PAGE, type=int), MAX_VERSIONS_PER_PAGE)
+            data.update(versions_page(document.id, page, per_page))
+        
+        return jsonify(data)
+    
+    # API para listar o histórico de versões de um documento, paginado
+    @app.route('/api/docs/documents/<int:doc_id>/versions', methods=['GET'])
+    @login_required
+    def list_document_versions(doc_id):
+        document = Document.query.get_or_404(doc_id)
+        if not has_project_access(document.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
         
-        return jsonify(document.to_dict(include_versions=include_versions))
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', VERSIONS_PER_PAGE, type=int), MAX_VERSIONS_PER_PAGE)
+        return jsonify({"success": True, **versions_page(document.id, page, per_page)})
     
     # API para baixar uma versão específica
     @app.route('/api/docs/documents/<int:doc_id>/versions/<int:version_id>/download')
@@ -416,15 +712,13 @@ def init_app(app):
             document_id=doc_id
         ).first_or_404()
         
-        # Verifica se o arquivo existe
-        if not os.path.exists(version.file_path):
-            return jsonify({"error": "Arquivo não encontrado"}), 404
+        if not has_project_access(version.document.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
         
-        return send_file(
-            version.file_path, 
-            download_name=version.file_name,
-            as_attachment=True
-        )
+        response = send_document_version(version)
+        if response is None:
+            return jsonify({"error": "Arquivo não encontrado"}), 404
+        return response
         
     # API para baixar a versão mais recente
     @app.route('/api/docs/documents/<int:doc_id>/download')
@@ -436,17 +730,78 @@ def init_app(app):
         if not document.versions:
             return jsonify({"error": "Documento não tem versões"}), 404
         
+        if not has_project_access(document.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        
         version = document.versions[0]  # Versão mais recente
         
-        # Verifica se o arquivo existe
-        if not os.path.exists(version.file_path):
+        response = send_document_version(version)
+        if response is None:
             return jsonify({"error": "Arquivo não encontrado"}), 404
+        return response
         
-        return send_file(
-            version.file_path, 
-            download_name=version.file_name,
-            as_attachment=True
-        )
+    # API para baixar uma pasta inteira como ZIP
+    @app.route('/api/docs/folders/<int:folder_id>/zip')
+    @login_required
+    def download_folder_zip(folder_id):
+        """ZIP em streaming da subárvore da pasta, com a versão mais recente de cada documento"""
+        folder = DocFolder.query.get_or_404(folder_id)
+        if not has_project_access(folder.project_id):
+            return jsonify({"error": "Sem permissão para este projeto"}), 403
+        
+        # Caminho relativo de cada subpasta dentro do ZIP (subárvore em ordem de nível)
+        relative_dirs = {}
+        for f, depth in get_subtree(folder.id):
+            if depth == 0:
+                relative_dirs[f.id] = ''
+            else:
+                relative_dirs[f.id] = relative_dirs.get(f.parent_id, '') + f.name.replace('/', '_') + '/'
+        
+        folder_of = dict(db.session.query(Document.id, Document.folder_id)
+                         .filter(Document.folder_id.in_(list(relative_dirs))).all())
+        
+        used = set()
+        entries = [
+            (unique_arcname(relative_dirs[folder_of[v.document_id]] + v.file_name, used), v.file_path, v.created_at)
+            for v in sorted(latest_versions(folder_of), key=lambda v: (folder_of[v.document_id], v.file_name))
+        ]
+        filename = f"{secure_filename(folder.name) or 'pasta'}.zip"
+        return zip_response(entries, filename)
+    
+    # API para baixar vários documentos como ZIP
+    @app.route('/api/docs/documents/zip', methods=['GET', 'POST'])
+    @login_required
+    def download_documents_zip():
+        """
+        ZIP em streaming de uma seleção de documentos.
+        GET ?ids=1,2,3 (versão mais recente) ou
+        POST {"documents": [{"id": 1, "version_id": 7}, {"id": 2}]}
+        """
+        if request.method == 'POST':
+            items = (request.json or {}).get('documents', [])
+            chosen = {int(item['id']): item.get('version_id') for item in items if item.get('id')}
+        else:
+            ids = request.args.get('ids', '')
+            chosen = {int(i): None for i in ids.split(',') if i.strip().isdigit()}
+        
+        if not chosen:
+            return jsonify({"error": "Nenhum documento selecionado"}), 400
+        
+        documents = Document.query.filter(Document.id.in_(list(chosen))).all()
+        for project_id in {doc.project_id for doc in documents}:
+            if not has_project_access(project_id):
+                return jsonify({"error": "Sem permissão para este projeto"}), 403
+        
+        found = {doc.id for doc in documents}
+        pinned = [version_id for doc_id, version_id in chosen.items() if version_id and doc_id in found]
+        versions = DocumentVersion.query.filter(DocumentVersion.id.in_(pinned)).all() if pinned else []
+        versions = [v for v in versions if chosen.get(v.document_id) == v.id]
+        versions += latest_versions([doc_id for doc_id in found if not chosen[doc_id]])
+        
+        used = set()
+        entries = [(unique_arcname(v.file_name, used), v.file_path, v.created_at)
+                   for v in sorted(versions, key=lambda v: v.file_name)]
+        return zip_response(entries, f"documentos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
         
     # API para excluir um documento
     @app.route('/api/docs/documents/<int:doc_id>', methods=['DELETE'])
@@ -456,23 +811,84 @@ def init_app(app):
         document = Document.query.get_or_404(doc_id)
         
         try:
-            # Identifica diretório do documento
+            # Identifica diretório do documento (versões no formato antigo)
             folder = DocFolder.query.get(document.folder_id)
             doc_dir = os.path.join(folder.path, f"doc_{document.id}")
             
-            # Remove diretório físico se existir
-            if os.path.exists(doc_dir):
-                shutil.rmtree(doc_dir)
+            # Libera os blobs das versões; só os que ficarem sem referência são apagados
+            orphan_blobs = release_blobs([v.file_path for v in document.versions])
+            record_usage(document.project_id, document.folder_id,
+                         -sum(v.file_size for v in document.versions), -1, -len(document.versions))
                 
             # Remove registro do banco
             db.session.delete(document)
             db.session.commit()
             
+            remove_blobs(orphan_blobs)
+            if os.path.exists(doc_dir):
+                shutil.rmtree(doc_dir)
+            
             return jsonify({"success": True})
         except Exception as e:
             db.session.rollback()
             return jsonify({"error": str(e)}), 500
     
+    @app.cli.command('docs-migrate-blobs')
+    @click.option('--dry-run', is_flag=True, help='Apenas calcula quanto espaço seria economizado.')
+    @click.option('--batch-size', default=200, help='Versões convertidas por transação.')
+    def migrate_document_blobs(dry_run, batch_size):
+        """Converte as versões gravadas em Uploads/Projects para o repositório de blobs."""
+        migrated = missing = 0
+        saved_bytes = 0
+        seen = set()
+        last_id = 0
+
+        while True:
+            versions = DocumentVersion.query.filter(DocumentVersion.id > last_id)\
+                .order_by(DocumentVersion.id).limit(batch_size).all()
+            if not versions:
+                break
+            last_id = versions[-1].id
+
+            legacy_files = []
+            for version in versions:
+                if blob_sha(version.file_path):
+                    continue
+                if not os.path.exists(version.file_path):
+                    missing += 1
+                    click.echo(f"Arquivo ausente (versão {version.id}): {version.file_path}")
+                    continue
+
+                sha256 = file_sha256(version.file_path).hexdigest()
+                size = os.path.getsize(version.file_path)
+                if sha256 in seen or db.session.get(DocumentBlob, sha256) is not None:
+                    saved_bytes += size
+                seen.add(sha256)
+                migrated += 1
+                if dry_run:
+                    continue
+
+                # Trabalha sobre uma cópia; o original só é apagado após o commit
+                staged = staging_path(f"migrate_{version.id}")
+                try:
+                    os.link(version.file_path, staged)
+                except OSError:
+                    shutil.copy2(version.file_path, staged)
+                legacy_files.append(version.file_path)
+                version.file_path = store_blob(staged, sha256, size)
+
+            if not dry_run:
+                db.session.commit()
+                remove_files(legacy_files)
+                for doc_dir in {os.path.dirname(path) for path in legacy_files}:
+                    if os.path.basename(doc_dir).startswith('doc_') and os.path.isdir(doc_dir) \
+                            and not os.listdir(doc_dir):
+                        os.rmdir(doc_dir)
+
+        action = "seriam convertidas" if dry_run else "convertidas"
+        click.echo(f"{migrated} versões {action}, {missing} arquivos ausentes, "
+                   f"{saved_bytes / (1024 * 1024):.1f} MB economizados com deduplicação")
+
     @app.route('/logout')
     def logout():
         """Logout user and clear session"""
@@ -0,0 +1,67 @@
+from flask import request, jsonify, session
+from models.db import Project
+from datetime import datetime, timezone
+from auth.authorization import login_required, has_project_access
+from utils.exports import stream_entity_response, EXPORT_ENTITIES, STREAM_FORMATS
+
+def _parse_updated_since():
+    """Lê ?updated_since=<ISO 8601> como datetime UTC sem timezone (ou None)"""
+    value = request.args.get('updated_since')
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def init_app(app):
+    """
+    Dumps incrementais em streaming (CSV/NDJSON) para consumo por BI.
+    Entidades: cards, phases, tags, assignments, card_tags, messages, kudos, pomodoro.
+    """
+
+    @app.route('/api/projects/<int:project_id>/export/<entity>', methods=['GET'])
+    @login_required
+    def export_project_entity(project_id, entity):
+        """Exporta uma entidade do projeto (?format=csv|ndjson&updated_since=ISO)"""
+        if not has_project_access(project_id):
+            return jsonify({"success": False, "error": "Sem permissão para este projeto"}), 403
+        Project.query.get_or_404(project_id)
+
+        try:
+            fmt = request.args.get('format', 'csv')
+            filename = f"project_{project_id}_{entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            return stream_entity_response(entity, fmt, filename,
+                                          project_id=project_id,
+                                          updated_since=_parse_updated_since())
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+    @app.route('/api/export/<entity>', methods=['GET'])
+    @login_required
+    def export_workspace_entity(entity):
+        """Exporta uma entidade de todo o workspace (apenas administradores)"""
+        if not session.get('is_admin'):
+            return jsonify({"success": False, "error": "Acesso restrito a administradores"}), 403
+
+        try:
+            fmt = request.args.get('format', 'csv')
+            filename = f"workspace_{entity}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            return stream_entity_response(entity, fmt, filename,
+                                          updated_since=_parse_updated_since())
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+    @app.route('/api/export', methods=['GET'])
+    @login_required
+    def list_export_entities():
+        """Lista as entidades e formatos disponíveis para exportação"""
+        return jsonify({
+            "entities": {
+                name: {
+                    "project_scope": spec['project'] is not None,
+                    "updated_since": spec['changed'] is not None
+                } for name, spec in EXPORT_ENTITIES.items()
+            },
+            "formats": list(STREAM_FORMATS)
+        })
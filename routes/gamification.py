@@ -3,6 +3,7 @@ from auth.authorization import login_required
 from models.db import db, PomodoroLog, Team
 from datetime import datetime, timedelta
 from sqlalchemy import func, case
+from utils.badges import get_user_badges
 
 gamification_bp = Blueprint('gamification', __name__, url_prefix='/gamification')
 
@@ -84,3 +85,17 @@ def get_stats(period):
         'values': values,
         'ranking': ranking
     })
+
+@gamification_bp.route('/api/badges')
+@login_required
+def get_badges():
+    """Catálogo de medalhas com as conquistas e o progresso do usuário atual"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Usuário não autenticado'}), 401
+
+    badges = get_user_badges(user_id)
+    return jsonify({
+        'badges': badges,
+        'earned_count': sum(1 for badge in badges if badge['earned'])
+    })
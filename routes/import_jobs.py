@@ -0,0 +1,103 @@
+from flask import jsonify, session, send_file
+from models.db import db, ImportJob
+from datetime import datetime, timedelta
+from auth.authorization import login_required
+from utils.project_import import get_live_progress
+import click
+import os
+
+def _can_view(job):
+    return session.get('is_admin') or job.user_id == session.get('user_id')
+
+def job_to_dict(job):
+    """Status do job, com o progresso parcial quando a importação roda neste processo"""
+    data = job.to_dict()
+    if job.status == 'running':
+        progress = get_live_progress(job.id)
+        if progress:
+            data.update({
+                'rows_processed': progress['rows_processed'],
+                'created': progress['created_count'],
+                'updated': progress['updated_count'],
+                'skipped': progress['skipped_count'],
+                'error_count': progress['error_count'],
+                'warning_count': progress['warning_count'],
+                'rows_per_second': progress['rows_per_second']
+            })
+    return data
+
+def _remove_files(job):
+    for path in (job.file_path, job.report_path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def init_app(app):
+    """
+    Acompanhamento das importações de planilhas em segundo plano.
+    O envio é feito em POST /api/projects/<id>/import (routes/projects.py).
+    """
+
+    @app.route('/api/import-jobs/<job_id>', methods=['GET'])
+    @login_required
+    def get_import_job(job_id):
+        """Status da importação: linhas processadas, linhas por segundo, erros e avisos"""
+        job = db.session.get(ImportJob, job_id)
+        if not job or not _can_view(job):
+            return jsonify({"success": False, "error": "Importação não encontrada"}), 404
+        return jsonify({"success": True, "job": job_to_dict(job)})
+
+    @app.route('/api/import-jobs/<job_id>/report', methods=['GET'])
+    @login_required
+    def download_import_report(job_id):
+        """Baixa o relatório de erros e avisos (CSV) da importação"""
+        job = db.session.get(ImportJob, job_id)
+        if not job or not _can_view(job):
+            return jsonify({"success": False, "error": "Importação não encontrada"}), 404
+        if not job.report_path or not os.path.exists(job.report_path):
+            return jsonify({"success": False, "error": "Nenhum relatório disponível"}), 404
+
+        return send_file(
+            job.report_path,
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name=f"import_report_{job.project_id}_{job.id[:8]}.csv"
+        )
+
+    @app.route('/api/projects/<int:project_id>/import-jobs', methods=['GET'])
+    @login_required
+    def list_import_jobs(project_id):
+        """Últimas importações do projeto (do usuário, ou todas para administradores)"""
+        query = ImportJob.query.filter_by(project_id=project_id)
+        if not session.get('is_admin'):
+            query = query.filter_by(user_id=session.get('user_id'))
+        jobs = query.order_by(ImportJob.created_at.desc()).limit(20).all()
+        return jsonify({"success": True, "jobs": [job_to_dict(job) for job in jobs]})
+
+    @app.cli.command('import-jobs-prune')
+    @click.option('--days', default=30, help='Remove importações finalizadas há mais de N dias.')
+    @click.option('--stale-hours', default=6, help='Marca como falhas importações pendentes há mais de N horas.')
+    def prune_import_jobs(days, stale_hours):
+        """Remove jobs de importação antigos (e seus arquivos) e encerra jobs órfãos."""
+        stale_cutoff = datetime.utcnow() - timedelta(hours=stale_hours)
+        stale = ImportJob.query.filter(
+            ImportJob.status.in_(['queued', 'running']),
+            ImportJob.created_at < stale_cutoff
+        ).all()
+        for job in stale:
+            job.status = 'failed'
+            job.error_message = 'Importação interrompida (processo finalizado antes da conclusão)'
+            job.finished_at = datetime.utcnow()
+            _remove_files(job)
+            job.file_path = None
+        db.session.commit()
+
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        old = ImportJob.query.filter(
+            ImportJob.status.in_(['done', 'failed']),
+            ImportJob.finished_at < cutoff
+        ).all()
+        for job in old:
+            _remove_files(job)
+            db.session.delete(job)
+        db.session.commit()
+        click.echo(f"{len(stale)} importações órfãs encerradas, {len(old)} importações antigas removidas")
@@ -1,13 +1,297 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file, g, Blueprint
 from auth.authorization import login_required
-from models.db import db, Kudos, KudosComment, KudosReaction, Team
+from models.db import db, Kudos, KudosComment, KudosReaction, KudosReactionCount, KudosQuota, Team
 from datetime import datetime, timedelta
+from sqlalchemy import select, literal, func, update
+from sqlalchemy.exc import IntegrityError
+from utils.badges import record_event
+from utils.user_refs import get_user_refs
+from utils.kudos_graph import get_kudos_graph, invalidate_cache as invalidate_kudos_graph
+import click
 
 kudos_bp = Blueprint('kudos', __name__, url_prefix='/kudos')
 
+# Tamanho de página do feed de kudos
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+
+# Limite mensal de kudos por remetente
+MONTHLY_KUDOS_LIMIT = 5
+
+# Threads de comentários: profundidade exibida e respostas visíveis por nó no feed
+FEED_COMMENT_DEPTH = 3
+FEED_REPLIES_LIMIT = 3
+MAX_COMMENT_DEPTH = 50
+
 def init_app(app):
     app.register_blueprint(kudos_bp)
 
+    @app.cli.command('kudos-rebuild-reaction-counts')
+    def rebuild_reaction_counts():
+        """Recalcula os contadores de reações a partir de KudosReaction."""
+        KudosReactionCount.query.delete()
+        totals = db.session.query(
+            KudosReaction.kudo_id,
+            KudosReaction.reaction_type,
+            func.count(KudosReaction.id)
+        ).group_by(KudosReaction.kudo_id, KudosReaction.reaction_type).all()
+        db.session.add_all([
+            KudosReactionCount(kudo_id=kudo_id, reaction_type=reaction_type, count=count)
+            for kudo_id, reaction_type, count in totals
+        ])
+        db.session.commit()
+        click.echo(f"{len(totals)} contadores de reações recalculados")
+
+    @app.cli.command('kudos-rebuild-quota')
+    def rebuild_kudos_quota():
+        """Recalcula a cota do mês corrente a partir dos kudos já enviados."""
+        month = current_quota_month()
+        totals = db.session.query(
+            Kudos.sender_id,
+            func.count(Kudos.id)
+        ).filter(Kudos.created_at >= start_of_quota_month()).group_by(Kudos.sender_id).all()
+        KudosQuota.query.filter_by(month=month).delete()
+        db.session.add_all([
+            KudosQuota(sender_id=sender_id, month=month, used=count)
+            for sender_id, count in totals
+        ])
+        db.session.commit()
+        click.echo(f"Cota de {month} recalculada para {len(totals)} remetentes")
+
+def load_comment_rows(kudo_ids, parent_id=None, max_depth=MAX_COMMENT_DEPTH):
+    """
+    Carrega as threads de comentários com uma única CTE recursiva.
+
+    Parte dos comentários de primeiro nível dos kudos informados (ou das
+    respostas diretas de 'parent_id') e desce até 'max_depth' níveis. O nível
+    'max_depth' é carregado apenas para contar as respostas ocultas do nível
+    anterior. Retorna linhas ordenadas por profundidade e data.
+    """
+    comment = KudosComment.__table__
+    columns = [comment.c.id, comment.c.kudo_id, comment.c.user_id,
+               comment.c.content, comment.c.parent_id, comment.c.created_at]
+
+    anchor = select(*columns, literal(0).label('depth'))
+    if parent_id is not None:
+        anchor = anchor.where(comment.c.parent_id == parent_id)
+    else:
+        anchor = anchor.where(comment.c.kudo_id.in_(kudo_ids), comment.c.parent_id.is_(None))
+    tree = anchor.cte('comment_tree', recursive=True)
+
+    child = comment.alias('child')
+    tree = tree.union_all(
+        select(child.c.id, child.c.kudo_id, child.c.user_id,
+               child.c.content, child.c.parent_id, child.c.created_at,
+               (tree.c.depth + 1).label('depth'))
+        .where(child.c.parent_id == tree.c.id, tree.c.depth < max_depth)
+    )
+
+    return db.session.execute(
+        select(tree).order_by(tree.c.depth, tree.c.created_at, tree.c.id)
+    ).all()
+
+def build_comment_trees(rows, users, max_depth=MAX_COMMENT_DEPTH, replies_limit=None, roots_by='kudo_id'):
+    """
+    Monta as árvores de comentários em memória a partir de load_comment_rows.
+
+    Cada nó traz 'reply_count' e 'has_more_replies'; acima de 'replies_limit'
+    respostas (ou no limite de profundidade) as respostas ficam recolhidas e
+    podem ser buscadas em /api/kudos/<id>/comments?parent_id=<id>&offset=N.
+    Retorna {chave: [raízes]} agrupado por 'kudo_id' ou 'parent_id'.
+    """
+    children = {}
+    roots = {}
+    for row in rows:
+        if row.depth == 0:
+            roots.setdefault(getattr(row, roots_by), []).append(row)
+        else:
+            children.setdefault(row.parent_id, []).append(row)
+
+    def render(row):
+        replies = children.get(row.id, [])
+        if row.depth + 1 >= max_depth:
+            shown = []
+        else:
+            shown = replies if replies_limit is None else replies[:replies_limit]
+        return {
+            'id': row.id,
+            'content': row.content,
+            'created_at': row.created_at.isoformat(),
+            'parent_id': row.parent_id,
+            'user': users.get(row.user_id),
+            'reply_count': len(replies),
+            'has_more_replies': len(replies) > len(shown),
+            'replies': [render(reply) for reply in shown]
+        }
+
+    return {key: [render(row) for row in items] for key, items in roots.items()}
+
+def current_quota_month():
+    return datetime.utcnow().strftime('%Y-%m')
+
+def start_of_quota_month():
+    return datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def count_sent_this_month(sender_id):
+    """Kudos enviados no mês contados na tabela Kudos (semente da cota)"""
+    return db.session.query(func.count(Kudos.id)).filter(
+        Kudos.sender_id == sender_id,
+        Kudos.created_at >= start_of_quota_month()
+    ).scalar() or 0
+
+def get_quota_used(sender_id):
+    """
+    Kudos já enviados no mês (uma consulta pela chave primária).
+
+    Sem linha de cota para o mês (primeiro envio, ou kudos enviados antes
+    da tabela KudosQuota existir) conta os kudos do mês diretamente.
+    """
+    used = db.session.query(KudosQuota.used).filter_by(
+        sender_id=sender_id,
+        month=current_quota_month()
+    ).scalar()
+    if used is None:
+        return count_sent_this_month(sender_id)
+    return used
+
+def consume_kudos_quota(sender_id):
+    """
+    Consome uma unidade da cota mensal do remetente.
+
+    O UPDATE condicional é atômico no banco: com envios em paralelo, no
+    máximo MONTHLY_KUDOS_LIMIT deles conseguem incrementar a linha. Deve ser
+    chamado na mesma transação que cria o kudo. Retorna False se o limite
+    já foi atingido.
+    """
+    month = current_quota_month()
+    quota = KudosQuota.__table__
+    consume = update(quota).where(
+        quota.c.sender_id == sender_id,
+        quota.c.month == month,
+        quota.c.used < MONTHLY_KUDOS_LIMIT
+    ).values(used=quota.c.used + 1)
+
+    if db.session.execute(consume).rowcount == 1:
+        return True
+
+    current = db.session.query(KudosQuota.used).filter_by(sender_id=sender_id, month=month).scalar()
+    if current is not None:
+        return False
+
+    # Primeiro envio do mês: cria a linha já com os kudos enviados no mês, de
+    # modo que a cota vale mesmo sem rodar kudos-rebuild-quota após o deploy
+    # (outro request pode criá-la em paralelo)
+    try:
+        with db.session.begin_nested():
+            db.session.add(KudosQuota(sender_id=sender_id, month=month,
+                                      used=count_sent_this_month(sender_id)))
+    except IntegrityError:
+        pass
+
+    return db.session.execute(consume).rowcount == 1
+
+def count_reactions(kudo_id, reaction_type):
+    """Reações do tipo no kudo contadas na tabela KudosReaction (semente do contador)"""
+    return db.session.query(func.count(KudosReaction.id)).filter_by(
+        kudo_id=kudo_id,
+        reaction_type=reaction_type
+    ).scalar() or 0
+
+def change_reaction_count(kudo_id, reaction_type, delta):
+    """
+    Aplica delta ao contador de reações com um UPDATE atômico.
+
+    Deve ser chamado depois do flush da reação. Sem linha de contador
+    (reações anteriores à tabela KudosReactionCount) a linha é criada com a
+    contagem de KudosReaction, que já inclui a alteração, de modo que os
+    contadores valem mesmo sem rodar kudos-rebuild-reaction-counts após o
+    deploy. O contador nunca fica negativo.
+    """
+    counts = KudosReactionCount.__table__
+    change = update(counts).where(
+        counts.c.kudo_id == kudo_id,
+        counts.c.reaction_type == reaction_type,
+        counts.c.count + delta >= 0
+    ).values(count=counts.c.count + delta)
+
+    if db.session.execute(change).rowcount == 1:
+        return
+
+    current = db.session.query(KudosReactionCount.count).filter_by(
+        kudo_id=kudo_id,
+        reaction_type=reaction_type
+    ).scalar()
+    if current is not None:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(KudosReactionCount(kudo_id=kudo_id, reaction_type=reaction_type,
+                                              count=count_reactions(kudo_id, reaction_type)))
+        return
+    except IntegrityError:
+        pass
+
+    # Linha criada em paralelo por outro request, cuja contagem não vê esta reação
+    db.session.execute(change)
+
+def serialize_kudos_page(kudos, user_id=None, comment_depth=FEED_COMMENT_DEPTH, replies_limit=FEED_REPLIES_LIMIT):
+    """
+    Serializa uma página de kudos com comentários, reações e usuários.
+
+    Usa um número fixo de consultas (threads via CTE, contagem de
+    comentários, contadores de reações, reações do usuário atual e
+    usuários da página inteira), independente da quantidade de kudos e de
+    interações. A lista completa de reações fica em /api/kudos/<id>/reactions.
+    """
+    if not kudos:
+        return []
+
+    kudo_ids = [kudo.id for kudo in kudos]
+    comment_rows = load_comment_rows(kudo_ids, max_depth=comment_depth)
+    comment_counts = dict(
+        db.session.query(KudosComment.kudo_id, func.count(KudosComment.id))
+        .filter(KudosComment.kudo_id.in_(kudo_ids))
+        .group_by(KudosComment.kudo_id).all()
+    )
+
+    reaction_counts = {kudo_id: {} for kudo_id in kudo_ids}
+    for counter in KudosReactionCount.query.filter(
+        KudosReactionCount.kudo_id.in_(kudo_ids),
+        KudosReactionCount.count > 0
+    ).all():
+        reaction_counts[counter.kudo_id][counter.reaction_type] = counter.count
+
+    # Reação do usuário atual em cada kudo da página ("eu reagi?")
+    my_reactions = {}
+    if user_id:
+        my_reactions = dict(
+            db.session.query(KudosReaction.kudo_id, KudosReaction.reaction_type)
+            .filter(KudosReaction.kudo_id.in_(kudo_ids), KudosReaction.user_id == user_id).all()
+        )
+
+    user_ids = set()
+    for kudo in kudos:
+        user_ids.update((kudo.sender_id, kudo.receiver_id))
+    user_ids.update(row.user_id for row in comment_rows)
+    users = get_user_refs(user_ids)
+
+    comments_by_kudo = build_comment_trees(comment_rows, users, comment_depth, replies_limit)
+
+    return [{
+        'id': kudo.id,
+        'sender': users.get(kudo.sender_id),
+        'receiver': users.get(kudo.receiver_id),
+        'category': kudo.category,
+        'type': kudo.type,
+        'message': kudo.message,
+        'created_at': kudo.created_at.isoformat(),
+        'comments': comments_by_kudo.get(kudo.id, []),
+        'comment_count': comment_counts.get(kudo.id, 0),
+        'reaction_counts': reaction_counts[kudo.id],
+        'my_reaction': my_reactions.get(kudo.id)
+    } for kudo in kudos]
+
 @kudos_bp.route('/')
 @login_required
 def kudos_page():
@@ -23,6 +307,124 @@ def get_kudos():
     kudos = Kudos.query.order_by(Kudos.created_at.desc()).all()
     return jsonify([kudo.to_dict() for kudo in kudos])
 
+@kudos_bp.route('/api/kudos/feed', methods=['GET'])
+@login_required
+def get_kudos_feed():
+    """
+    Feed paginado de kudos (mais recentes primeiro).
+
+    Paginação por cursor: ?limit=20&before=<id do último kudo recebido>.
+    Filtros opcionais: category, type e date (YYYY-MM-DD, dia do envio).
+    """
+    limit = max(1, min(request.args.get('limit', FEED_PAGE_SIZE, type=int), FEED_MAX_PAGE_SIZE))
+    before = request.args.get('before', type=int)
+
+    query = Kudos.query
+    if before:
+        query = query.filter(Kudos.id < before)
+    if request.args.get('category'):
+        query = query.filter(Kudos.category == request.args['category'])
+    if request.args.get('type'):
+        query = query.filter(Kudos.type == request.args['type'])
+    if request.args.get('date'):
+        try:
+            day = datetime.strptime(request.args['date'], '%Y-%m-%d')
+        except ValueError:
+            return jsonify({'error': 'Invalid date format'}), 400
+        query = query.filter(Kudos.created_at >= day, Kudos.created_at < day + timedelta(days=1))
+    kudos = query.order_by(Kudos.id.desc()).limit(limit + 1).all()
+
+    has_more = len(kudos) > limit
+    kudos = kudos[:limit]
+
+    comment_depth = max(1, min(request.args.get('comment_depth', FEED_COMMENT_DEPTH, type=int), MAX_COMMENT_DEPTH))
+    replies_limit = max(0, request.args.get('replies_limit', FEED_REPLIES_LIMIT, type=int))
+
+    return jsonify({
+        'kudos': serialize_kudos_page(kudos, session.get('user_id'), comment_depth, replies_limit),
+        'has_more': has_more,
+        'next_cursor': kudos[-1].id if has_more else None
+    })
+
+@kudos_bp.route('/api/kudos/<int:kudo_id>/comments', methods=['GET'])
+@login_required
+def get_kudo_comments(kudo_id):
+    """
+    Thread de comentários de um kudo, carregada com uma única CTE recursiva.
+
+    Query params:
+        parent_id: expande apenas as respostas deste comentário
+        max_depth: níveis de profundidade retornados (padrão: todos)
+        replies_limit: respostas visíveis por nó antes de recolher
+        offset, limit: paginação dos comentários do primeiro nível retornado
+    """
+    Kudos.query.get_or_404(kudo_id)
+
+    parent_id = request.args.get('parent_id', type=int)
+    max_depth = max(1, min(request.args.get('max_depth', MAX_COMMENT_DEPTH, type=int), MAX_COMMENT_DEPTH))
+    replies_limit = request.args.get('replies_limit', type=int)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = request.args.get('limit', type=int)
+
+    if parent_id is not None:
+        parent = KudosComment.query.filter_by(id=parent_id, kudo_id=kudo_id).first()
+        if not parent:
+            return jsonify({'error': 'Comentário não encontrado'}), 404
+
+    rows = load_comment_rows([kudo_id], parent_id=parent_id, max_depth=max_depth)
+    users = get_user_refs({row.user_id for row in rows})
+    key = 'parent_id' if parent_id is not None else 'kudo_id'
+    roots = build_comment_trees(rows, users, max_depth, replies_limit, roots_by=key)\
+        .get(parent_id if parent_id is not None else kudo_id, [])
+
+    page = roots[offset:offset + limit] if limit else roots[offset:]
+    return jsonify({
+        'kudo_id': kudo_id,
+        'parent_id': parent_id,
+        'comments': page,
+        'total': len(roots),
+        'has_more': offset + len(page) < len(roots)
+    })
+
+@kudos_bp.route('/api/kudos/<int:kudo_id>/reactions', methods=['GET'])
+@login_required
+def get_kudo_reactions(kudo_id):
+    """Lista completa de reações de um kudo, sob demanda (?reaction_type=&offset=&limit=)"""
+    Kudos.query.get_or_404(kudo_id)
+
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = max(1, min(request.args.get('limit', FEED_MAX_PAGE_SIZE, type=int), FEED_MAX_PAGE_SIZE))
+    reaction_type = request.args.get('reaction_type')
+
+    query = KudosReaction.query.filter_by(kudo_id=kudo_id)
+    if reaction_type:
+        query = query.filter_by(reaction_type=reaction_type)
+    reactions = query.order_by(KudosReaction.id).offset(offset).limit(limit + 1).all()
+
+    has_more = len(reactions) > limit
+    reactions = reactions[:limit]
+    users = get_user_refs({reaction.user_id for reaction in reactions})
+
+    return jsonify({
+        'kudo_id': kudo_id,
+        'reactions': [{
+            'id': reaction.id,
+            'reaction_type': reaction.reaction_type,
+            'user': users.get(reaction.user_id)
+        } for reaction in reactions],
+        'has_more': has_more
+    })
+
+@kudos_bp.route('/api/kudos/analytics', methods=['GET'])
+@login_required
+def get_kudos_analytics():
+    """Métricas do grafo de reconhecimento: graus, centralidade, fluxo entre departamentos e isolados"""
+    try:
+        return jsonify(get_kudos_graph())
+    except Exception as e:
+        print(f"Erro ao calcular analytics de kudos: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @kudos_bp.route('/api/kudos/remaining', methods=['GET'])
 @login_required
 def get_remaining_kudos():
@@ -30,17 +432,12 @@ def get_remaining_kudos():
     if not user_id:
         return jsonify({'error': 'Usuário não autenticado'}), 401
     
-    start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    
-    monthly_count = Kudos.query.filter(
-        Kudos.sender_id == user_id,
-        Kudos.created_at >= start_of_month
-    ).count()
+    monthly_count = get_quota_used(user_id)
     
-    remaining = max(0, 5 - monthly_count)
+    remaining = max(0, MONTHLY_KUDOS_LIMIT - monthly_count)
     return jsonify({
         'remaining': remaining,
-        'total': 5,
+        'total': MONTHLY_KUDOS_LIMIT,
         'used': monthly_count
     })
 
@@ -64,16 +461,6 @@ def create_kudo():
         if not Team.query.get(data['receiver_id']):
             return jsonify({'error': 'Destinatário não encontrado'}), 404
             
-        # Verificações com lock
-        start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        monthly_count = db.session.query(Kudos).filter(
-            Kudos.sender_id == user_id,
-            Kudos.created_at >= start_of_month
-        ).count()
-        
-        if monthly_count >= 5:
-            return jsonify({'error': 'Limite mensal de kudos atingido (máximo 5)'}), 400
-            
         last_minute = datetime.utcnow() - timedelta(minutes=1)
         recent_duplicate = db.session.query(Kudos).filter(
             Kudos.sender_id == user_id,
@@ -83,6 +470,11 @@ def create_kudo():
         
         if recent_duplicate:
             return jsonify({'error': 'Você já enviou um kudo para este usuário nos últimos 60 segundos'}), 400
+
+        # Consome a cota mensal com UPDATE condicional atômico
+        if not consume_kudos_quota(user_id):
+            db.session.rollback()
+            return jsonify({'error': f'Limite mensal de kudos atingido (máximo {MONTHLY_KUDOS_LIMIT})'}), 400
         
         # Criar novo kudo em uma única transação
         new_kudo = Kudos(
@@ -94,7 +486,10 @@ def create_kudo():
         )
         
         db.session.add(new_kudo)
+        record_event(user_id, 'kudos_sent')
+        record_event(data['receiver_id'], 'kudos_received')
         db.session.commit()
+        invalidate_kudos_graph()
         
         return jsonify(new_kudo.to_dict())
             
@@ -137,10 +532,16 @@ def add_reaction(kudo_id):
             user_id=user_id
         ).first()
         
+        # Os contadores são atualizados na mesma transação da reação, depois
+        # do flush (a semente de um contador novo já conta a alteração)
+        changes = []
         if existing:
             if existing.reaction_type == data['reaction_type']:
                 db.session.delete(existing)
+                changes.append((existing.reaction_type, -1))
             else:
+                changes.append((existing.reaction_type, -1))
+                changes.append((data['reaction_type'], 1))
                 existing.reaction_type = data['reaction_type']
         else:
             reaction = KudosReaction(
@@ -149,6 +550,11 @@ def add_reaction(kudo_id):
                 reaction_type=data['reaction_type']
             )
             db.session.add(reaction)
+            changes.append((data['reaction_type'], 1))
+
+        db.session.flush()
+        for reaction_type, delta in changes:
+            change_reaction_count(kudo_id, reaction_type, delta)
         
         db.session.commit()
         return jsonify({'success': True})
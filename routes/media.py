@@ -0,0 +1,140 @@
+from flask import request, jsonify, send_file, abort, redirect, current_app
+from models.db import db, DocumentVersion, Team
+from auth.authorization import login_required, has_project_access
+from utils.doc_storage import blob_sha, file_sha256
+from utils.user_refs import invalidate_user_ref
+from utils.storage import get_storage
+from utils.thumbnails import (SIZES, AVATAR_SIZE, derivative_kind, find_derivative, schedule_derivatives,
+                              ensure_derivative, avatar_key, find_avatar_source)
+import click
+import mimetypes
+import os
+import re
+
+# Derivados são endereçados pelo hash do conteúdo: a mesma URL nunca muda de conteúdo
+IMMUTABLE_MAX_AGE = 31536000
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def avatar_dir():
+    """Diretório das fotos enviadas antes do armazenamento configurável"""
+    return os.path.join(current_app.static_folder, 'uploads', 'profile_photos')
+
+
+def _send_derivative(path, etag, public):
+    response = send_file(
+        os.path.abspath(path),
+        mimetype=mimetypes.guess_type(path)[0],
+        conditional=True,
+        etag=etag,
+        max_age=IMMUTABLE_MAX_AGE
+    )
+    scope = 'public' if public else 'private'
+    response.headers['Cache-Control'] = f'{scope}, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+
+def init_app(app):
+    # Miniatura de uma versão de documento (imagens e primeira página de PDFs)
+    @app.route('/api/docs/versions/<int:version_id>/thumbnail')
+    @login_required
+    def get_version_thumbnail(version_id):
+        version = DocumentVersion.query.get_or_404(version_id)
+        if not has_project_access(version.document.project_id):
+            return jsonify({"error": "Sem permissão para este documento"}), 403
+
+        size = request.args.get('size', 'md')
+        if size not in SIZES:
+            return jsonify({"error": f"Tamanho inválido. Use: {', '.join(SIZES)}"}), 400
+
+        sha256 = blob_sha(version.file_path)
+        if not sha256 or derivative_kind(version.file_name) is None:
+            return jsonify({"error": "Pré-visualização indisponível para este arquivo"}), 404
+
+        path = find_derivative(sha256, size)
+        if path:
+            return _send_derivative(path, f"{sha256}-{size}", public=False)
+
+        # Ainda não gerada (envio recente ou cache limpo): agenda e pede nova tentativa
+        if schedule_derivatives(sha256, version.file_path, version.file_name) is None:
+            return jsonify({"error": "Pré-visualização indisponível para este arquivo"}), 404
+        response = jsonify({"status": "pending"})
+        response.status_code = 202
+        response.headers['Retry-After'] = '2'
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    # Foto de perfil redimensionada, pública e com cache permanente
+    @app.route('/media/avatars/<sha256>')
+    def get_avatar(sha256):
+        if not _SHA256_RE.match(sha256):
+            abort(404)
+
+        path = find_derivative(sha256, AVATAR_SIZE)
+        if not path:
+            source = find_avatar_source(sha256, avatar_dir())
+            if not source:
+                abort(404)
+            path = ensure_derivative(sha256, source, source, AVATAR_SIZE)
+            if not path:
+                # Sem Pillow ou falha na geração: entrega o original
+                if os.path.isfile(source):
+                    return _send_derivative(source, sha256, public=True)
+                url = get_storage().download_url(source, 'inline', mimetypes.guess_type(source)[0])
+                response = redirect(url, 302)
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+        return _send_derivative(path, f"{sha256}-{AVATAR_SIZE}", public=True)
+
+    @app.cli.command('thumbnails-backfill')
+    @click.option('--batch-size', default=500, help='Versões carregadas por consulta.')
+    def backfill_thumbnails(batch_size):
+        """Gera as miniaturas que faltam para versões de documentos e fotos de perfil."""
+        futures = []
+        last_id = 0
+        while True:
+            versions = DocumentVersion.query.filter(DocumentVersion.id > last_id)\
+                .order_by(DocumentVersion.id).limit(batch_size).all()
+            if not versions:
+                break
+            for version in versions:
+                sha256 = blob_sha(version.file_path)
+                future = schedule_derivatives(sha256, version.file_path, version.file_name)
+                if future is not None:
+                    futures.append(future)
+            last_id = versions[-1].id
+            db.session.expunge_all()
+
+        # Fotos enviadas antes das miniaturas: copia o original para o armazenamento, pelo hash
+        renamed = []
+        storage = get_storage()
+        for user in Team.query.filter(Team.foto.like('/static/uploads/profile_photos/%')).all():
+            source = os.path.join(avatar_dir(), os.path.basename(user.foto))
+            if not os.path.exists(source):
+                continue
+            sha256 = file_sha256(source).hexdigest()
+            target = avatar_key(sha256, os.path.splitext(source)[1].lower().lstrip('.'))
+            if not storage.exists(target):
+                storage.put_file(target, source, move=False)
+            user.foto = f'/media/avatars/{sha256}'
+            renamed.append(user.id)
+        db.session.commit()
+        for user_id in renamed:
+            invalidate_user_ref(user_id)
+
+        for user in Team.query.filter(Team.foto.like('/media/avatars/%')).all():
+            sha256 = user.foto.rsplit('/', 1)[-1]
+            source = find_avatar_source(sha256, avatar_dir())
+            if source:
+                future = schedule_derivatives(sha256, source, source)
+                if future is not None:
+                    futures.append(future)
+
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                failed += 1
+        click.echo(f"{len(futures) - failed} arquivos processados, {failed} falhas")
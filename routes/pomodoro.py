@@ -2,6 +2,7 @@ from flask import request, jsonify, session
 from models.db import db, PomodoroLog
 from datetime import datetime
 from auth.authorization import login_required
+from utils.badges import record_event
 
 def init_app(app):
     @app.route('/api/pomodoro/log', methods=['POST'])
@@ -25,9 +26,19 @@ def init_app(app):
             )
             
             db.session.add(log)
+
+            # Avalia as medalhas na mesma transação do registro
+            awarded = []
+            if log.timer_type == 'work' and log.completed:
+                awarded = record_event(user_id, 'work_session', log.start_time)
+
             db.session.commit()
             
-            return jsonify({'success': True, 'log': log.to_dict()})
+            return jsonify({
+                'success': True,
+                'log': log.to_dict(),
+                'badges': [rule['code'] for rule in awarded]
+            })
         except Exception as e:
             db.session.rollback()
             print(f"Error logging pomodoro: {str(e)}") # Debug log
@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, request, jsonify, session, current_app
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, jsonify, session
 import os
 import hashlib
 from models.db import db, Team
 from auth.authorization import login_required
+from utils.user_refs import invalidate_user_ref
+from utils.thumbnails import schedule_derivatives, avatar_key
+from utils.doc_storage import save_to_staging
+from utils.storage import get_storage
 
 app = Blueprint('profile', __name__)
 
@@ -46,6 +49,7 @@ def init_app(app):
             user.contexto_trabalho = data.get('contexto_trabalho')
 
             db.session.commit()
+            invalidate_user_ref(user.id)
             return jsonify({"success": True})
         except Exception as e:
             db.session.rollback()
@@ -84,19 +88,23 @@ def init_app(app):
                 return jsonify({"success": False, "message": "Nenhum arquivo selecionado"})
 
             if file and allowed_file(file.filename):
-                filename = secure_filename(f"profile_{session['user_id']}_{file.filename}")
-                upload_folder = os.path.join(current_app.static_folder, 'uploads', 'profile_photos')
-                
-                # Criar diretório se não existir
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                filepath = os.path.join(upload_folder, filename)
-                file.save(filepath)
+                # O original vai para o armazenamento com o hash do conteúdo no nome;
+                # a foto é servida redimensionada em /media/avatars/<hash> com cache permanente
+                staged_path, sha256, _ = save_to_staging(file.stream)
+                extension = file.filename.rsplit('.', 1)[1].lower()
+                key = avatar_key(sha256, extension)
+                storage = get_storage()
+                if storage.exists(key):
+                    os.remove(staged_path)
+                else:
+                    storage.put_file(key, staged_path)
+                schedule_derivatives(sha256, key, key)
 
                 # Atualizar caminho da foto no banco de dados
                 user = Team.query.filter_by(email=session['usuario']).first()
-                user.foto = f'/static/uploads/profile_photos/{filename}'
+                user.foto = f'/media/avatars/{sha256}'
                 db.session.commit()
+                invalidate_user_ref(user.id)
 
                 return jsonify({
                     "success": True,
@@ -7,6 +7,7 @@ import hashlib
 
 from app import *
 from models.db import *
+from utils.user_refs import invalidate_user_ref
 
 def init_app(app):
 
@@ -84,6 +85,7 @@ def init_app(app):
                 team.project_access = projects
                 
             db.session.commit()
+            invalidate_user_ref(team_id)
             return jsonify({"success": True, "team": team.to_dict()})
         except Exception as e:
             return jsonify({"success": False, "error": str(e)}), 400
@@ -101,6 +103,7 @@ def init_app(app):
                 
             db.session.delete(team)
             db.session.commit()
+            invalidate_user_ref(team_id)
             return jsonify({"success": True})
         except Exception as e:
             return jsonify({"success": False, "error": str(e)}), 400
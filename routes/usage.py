@@ -0,0 +1,247 @@
+from flask import request, jsonify, session
+from models.db import db, AppUsage, AppUsageDaily
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, insert
+from auth.authorization import login_required
+from utils.counters import upsert_increment
+from utils.logger import setup_logger
+import click
+import math
+import os
+
+logger = setup_logger('usage')
+
+# Limite de amostras aceitas por requisição do agente de desktop
+MAX_BATCH_SIZE = 5000
+
+# Palavras-chave para classificar aplicativos (comparação sem diferenciar maiúsculas).
+# Podem ser substituídas pelas variáveis de ambiente FOCUS_APPS e DISTRACTION_APPS.
+DEFAULT_FOCUS_APPS = [
+    'code', 'visual studio', 'pycharm', 'intellij', 'vim', 'terminal',
+    'word', 'excel', 'powerpoint', 'outlook', 'notion', 'figma', 'deeply'
+]
+DEFAULT_DISTRACTION_APPS = [
+    'youtube', 'netflix', 'instagram', 'facebook', 'twitter', 'tiktok',
+    'whatsapp', 'telegram', 'steam', 'spotify'
+]
+
+def _keywords(env_name, default):
+    value = os.getenv(env_name)
+    if not value:
+        return default
+    return [k.strip().lower() for k in value.split(',') if k.strip()]
+
+FOCUS_APPS = _keywords('FOCUS_APPS', DEFAULT_FOCUS_APPS)
+DISTRACTION_APPS = _keywords('DISTRACTION_APPS', DEFAULT_DISTRACTION_APPS)
+
+def classify_app(app_name):
+    """Classifica o aplicativo como 'focus', 'distraction' ou 'neutral'"""
+    name = app_name.lower()
+    if any(k in name for k in DISTRACTION_APPS):
+        return 'distraction'
+    if any(k in name for k in FOCUS_APPS):
+        return 'focus'
+    return 'neutral'
+
+def _parse_datetime(value):
+    """Converte ISO 8601 para datetime UTC sem timezone (padrão do banco)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _parse_sample(user_id, sample):
+    app_name = (sample.get('app_name') or '').strip()
+    if not app_name:
+        raise ValueError('app_name é obrigatório')
+
+    start_time = _parse_datetime(sample['start_time'])
+    end_time = _parse_datetime(sample['end_time'])
+    if end_time < start_time:
+        raise ValueError('end_time anterior a start_time')
+
+    minutes_used = sample.get('minutes_used')
+    if minutes_used is None:
+        minutes_used = round((end_time - start_time).total_seconds() / 60)
+    elif isinstance(minutes_used, bool):
+        raise ValueError('minutes_used deve ser um número')
+    else:
+        minutes_used = float(minutes_used)
+        if not math.isfinite(minutes_used) or minutes_used < 0:
+            raise ValueError('minutes_used deve ser um número finito maior ou igual a zero')
+
+    return {
+        'user_id': user_id,
+        'app_name': app_name[:255],
+        'start_time': start_time,
+        'end_time': end_time,
+        'minutes_used': int(minutes_used)
+    }
+
+def _get_period(default_days=7):
+    days = max(1, min(request.args.get('days', default_days, type=int), 366))
+    start_day = datetime.utcnow().date() - timedelta(days=days - 1)
+    return days, start_day
+
+def init_app(app):
+    @app.route('/api/usage/samples', methods=['POST'])
+    @login_required
+    def ingest_usage_samples():
+        """
+        Recebe um lote de amostras de uso do agente de desktop.
+
+        Expected JSON payload:
+            samples: lista de {app_name, start_time, end_time, minutes_used (opcional)}
+
+        As amostras válidas são gravadas com um único INSERT em lote e
+        acumuladas no agregado diário (AppUsageDaily) na mesma transação.
+        """
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401
+
+        data = request.json or {}
+        samples = data.get('samples') if isinstance(data, dict) else data
+        if not isinstance(samples, list) or not samples:
+            return jsonify({'success': False, 'error': 'Nenhuma amostra enviada'}), 400
+        if len(samples) > MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'error': f'Lote excede o limite de {MAX_BATCH_SIZE} amostras'
+            }), 413
+
+        rows = []
+        rejected = []
+        for index, sample in enumerate(samples):
+            try:
+                rows.append(_parse_sample(user_id, sample))
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                rejected.append({'index': index, 'error': str(e)})
+
+        if not rows:
+            return jsonify({'success': False, 'error': 'Nenhuma amostra válida', 'rejected': rejected}), 400
+
+        # Agrega o lote em memória antes de tocar o banco
+        daily = {}
+        for row in rows:
+            key = (row['user_id'], row['start_time'].date(), row['app_name'])
+            aggregate = daily.setdefault(key, {
+                'user_id': key[0], 'day': key[1], 'app_name': key[2],
+                'minutes_used': 0, 'samples': 0
+            })
+            aggregate['minutes_used'] += row['minutes_used']
+            aggregate['samples'] += 1
+
+        try:
+            if rows:
+                db.session.execute(insert(AppUsage), rows)
+                upsert_increment(
+                    AppUsageDaily,
+                    list(daily.values()),
+                    keys=['user_id', 'day', 'app_name'],
+                    counters=['minutes_used', 'samples']
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao gravar amostras de uso: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+        return jsonify({
+            'success': True,
+            'inserted': len(rows),
+            'rejected': rejected
+        })
+
+    @app.route('/api/usage/top', methods=['GET'])
+    @login_required
+    def get_top_apps():
+        """Aplicativos mais usados pelo usuário no período (?days=7&limit=10)"""
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401
+
+        days, start_day = _get_period()
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+
+        total_minutes = func.sum(AppUsageDaily.minutes_used).label('minutes_used')
+        results = db.session.query(
+            AppUsageDaily.app_name,
+            total_minutes
+        ).filter(
+            AppUsageDaily.user_id == user_id,
+            AppUsageDaily.day >= start_day
+        ).group_by(
+            AppUsageDaily.app_name
+        ).order_by(
+            total_minutes.desc()
+        ).limit(limit).all()
+
+        return jsonify({
+            'success': True,
+            'days': days,
+            'apps': [{
+                'app_name': r.app_name,
+                'minutes_used': int(r.minutes_used or 0),
+                'category': classify_app(r.app_name)
+            } for r in results]
+        })
+
+    @app.route('/api/usage/focus', methods=['GET'])
+    @login_required
+    def get_focus_split():
+        """Divisão entre foco, distração e neutro no período, total e por dia (?days=7)"""
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'success': False, 'error': 'Usuário não autenticado'}), 401
+
+        days, start_day = _get_period()
+
+        results = db.session.query(
+            AppUsageDaily.day,
+            AppUsageDaily.app_name,
+            AppUsageDaily.minutes_used
+        ).filter(
+            AppUsageDaily.user_id == user_id,
+            AppUsageDaily.day >= start_day
+        ).all()
+
+        totals = {'focus': 0, 'distraction': 0, 'neutral': 0}
+        by_day = {}
+        categories = {}
+        for r in results:
+            category = categories.get(r.app_name)
+            if category is None:
+                category = categories[r.app_name] = classify_app(r.app_name)
+            totals[category] += r.minutes_used
+            day_totals = by_day.setdefault(r.day.isoformat(), {'focus': 0, 'distraction': 0, 'neutral': 0})
+            day_totals[category] += r.minutes_used
+
+        classified = totals['focus'] + totals['distraction']
+        return jsonify({
+            'success': True,
+            'days': days,
+            'focus_minutes': totals['focus'],
+            'distraction_minutes': totals['distraction'],
+            'neutral_minutes': totals['neutral'],
+            'focus_ratio': round(totals['focus'] / classified, 3) if classified else None,
+            'by_day': [{'day': day, **values} for day, values in sorted(by_day.items())]
+        })
+
+    @app.cli.command('usage-prune')
+    @click.option('--days', default=90, help='Mantém apenas as amostras brutas mais recentes que N dias.')
+    @click.option('--batch-size', default=10000, help='Quantidade de linhas removidas por transação.')
+    def prune_usage_samples(days, batch_size):
+        """Remove amostras brutas antigas de AppUsage (os agregados diários são mantidos)."""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        removed = 0
+        while True:
+            ids = [row.usage_id for row in db.session.query(AppUsage.usage_id)
+                   .filter(AppUsage.end_time < cutoff)
+                   .limit(batch_size).all()]
+            if not ids:
+                break
+            AppUsage.query.filter(AppUsage.usage_id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            removed += len(ids)
+        click.echo(f"{removed} amostras removidas (anteriores a {cutoff.date().isoformat()})")
@@ -16,25 +16,37 @@ Created: 2024
 License: Proprietary
 """
 
-from app import app
-from routes import init_app
-from models.db import db
 import secrets
 from datetime import timedelta
 
-# Configurações de segurança
-app.config.update(
-    SECRET_KEY=secrets.token_hex(32),
-    SESSION_COOKIE_SECURE=True,  # Requer HTTPS
-    SESSION_COOKIE_HTTPONLY=True,  # Previne acesso via JavaScript
-    SESSION_COOKIE_SAMESITE='Lax',  # Proteção contra CSRF
-    PERMANENT_SESSION_LIFETIME=timedelta(minutes=30)  # Tempo máximo da sessão
-)
 
+def create_app():
+    """
+    Configura o app e inicializa as rotas e o banco.
 
+    Fica fora do nível do módulo porque os pools de processos (miniaturas,
+    extração de texto) usam spawn: cada processo filho reimporta o módulo
+    principal como __mp_main__ e repetiria toda a inicialização. Servidores
+    WSGI e o CLI do Flask chamam a fábrica (gunicorn "run:create_app()");
+    por isso o app também só é importado aqui (o CLI usaria uma instância
+    encontrada no módulo antes de procurar a fábrica).
+    """
+    from app import app
+    from routes import init_app
+
+    # Configurações de segurança
+    app.config.update(
+        SECRET_KEY=secrets.token_hex(32),
+        SESSION_COOKIE_SECURE=True,  # Requer HTTPS
+        SESSION_COOKIE_HTTPONLY=True,  # Previne acesso via JavaScript
+        SESSION_COOKIE_SAMESITE='Lax',  # Proteção contra CSRF
+        PERMANENT_SESSION_LIFETIME=timedelta(minutes=30)  # Tempo máximo da sessão
+    )
+
+    # Inicializa as rotas e o banco de dados
+    init_app(app)
+    return app
 
-# Inicializa as rotas e o banco de dados
-init_app(app)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -18,7 +18,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Event listeners para uploads de arquivo
     document.getElementById('documentFile').addEventListener('change', function(e) {
-        if (e.target.files.length > 0) {
+        if (e.target.files.length > 1) {
+            document.getElementById('selectedFileName').textContent = `${e.target.files.length} arquivos selecionados`;
+        } else if (e.target.files.length > 0) {
             document.getElementById('selectedFileName').textContent = e.target.files[0].name;
         }
     });
@@ -110,11 +112,7 @@ function loadProjectDocs(projectId) {
                     documentsHTML += `
                         <div class="document-item">
                             <div class="document-info">
-                                <div class="document-icon">
-                                    <svg viewBox="0 0 24 24">
-                                        <path fill="currentColor" d="M14,17H7V15H14M17,13H7V11H17M17,9H7V7H17M19,3H5C3.89,3 3,3.89 3,5V19A2,2 0 0,0 5,21H19A2,2 0 0,0 21,19V5C21,3.89 20.1,3 19,3Z" />
-                                    </svg>
-                                </div>
+                                <div class="document-icon">${documentIconHTML(doc)}</div>
                                 <div class="document-name">${doc.name}</div>
                                 <div class="document-meta">
                                     <span>${doc.creator_name} - ${formatDate(doc.created_at)}</span>
@@ -212,18 +210,12 @@ function loadFolder(folderId) {
         .then(data => {
             currentFolder = folderId;
             
-            // Atualiza o breadcrumb
-            if (data.folder) {
-                const existingIndex = breadcrumbHistory.findIndex(item => item.id === folderId);
-                
-                if (existingIndex >= 0) {
-                    breadcrumbHistory = breadcrumbHistory.slice(0, existingIndex + 1);
-                } else {
-                    breadcrumbHistory.push({
-                        id: data.folder.id,
-                        name: data.folder.name
-                    });
-                }
+            // Atualiza o breadcrumb com os ancestrais retornados pelo servidor
+            if (data.breadcrumbs && data.breadcrumbs.length > 0) {
+                breadcrumbHistory = data.breadcrumbs.map((item, index) => ({
+                    id: item.id,
+                    name: index === 0 ? "Home" : item.name
+                }));
                 
                 renderBreadcrumb();
             }
@@ -270,11 +262,7 @@ function loadFolder(folderId) {
                     documentsHTML += `
                         <div class="document-item">
                             <div class="document-info">
-                                <div class="document-icon">
-                                    <svg viewBox="0 0 24 24">
-                                        <path fill="currentColor" d="M14,17H7V15H14M17,13H7V11H17M17,9H7V7H17M19,3H5C3.89,3 3,3.89 3,5V19A2,2 0 0,0 5,21H19A2,2 0 0,0 21,19V5C21,3.89 20.1,3 19,3Z" />
-                                    </svg>
-                                </div>
+                                <div class="document-icon">${documentIconHTML(doc)}</div>
                                 <div class="document-name">${doc.name}</div>
                                 <div class="document-meta">
                                     <span>${doc.creator_name} - ${formatDate(doc.created_at)}</span>
@@ -403,6 +391,21 @@ function renderFolderTree(folders) {
     tree.innerHTML = foldersHTML;
 }
 
+const DOCUMENT_SVG = `
+    <svg viewBox="0 0 24 24">
+        <path fill="currentColor" d="M14,17H7V15H14M17,13H7V11H17M17,9H7V7H17M19,3H5C3.89,3 3,3.89 3,5V19A2,2 0 0,0 5,21H19A2,2 0 0,0 21,19V5C21,3.89 20.1,3 19,3Z" />
+    </svg>`;
+
+// Miniatura da versão mais recente (imagens e PDFs); volta ao ícone enquanto
+// a miniatura ainda está sendo gerada ou se não puder ser carregada
+function documentIconHTML(doc) {
+    if (!doc.thumbnail_url) {
+        return DOCUMENT_SVG;
+    }
+    return `<img class="document-thumb" src="${doc.thumbnail_url}?size=sm" alt="" loading="lazy"
+                 onerror="this.parentElement.innerHTML = DOCUMENT_SVG">`;
+}
+
 function renderDocuments(documents) {
     const documentsList = document.getElementById('documentsList');
     
@@ -423,11 +426,7 @@ function renderDocuments(documents) {
     documents.forEach(doc => {
         documentsHTML += `
             <div class="document-item">
-                <div class="document-icon">
-                    <svg viewBox="0 0 24 24">
-                        <path fill="currentColor" d="M14,17H7V15H14M17,13H7V11H17M17,9H7V7H17M19,3H5C3.89,3 3,3.89 3,5V19A2,2 0 0,0 5,21H19A2,2 0 0,0 21,19V5C21,3.89 20.1,3 19,3Z" />
-                    </svg>
-                </div>
+                <div class="document-icon">${documentIconHTML(doc)}</div>
                 <div class="document-info">
                     <div class="document-name">${doc.name}</div>
                     <div class="document-meta">
@@ -595,7 +594,14 @@ function uploadDocument() {
     
     const documentName = document.getElementById('documentName').value.trim();
     const documentDescription = document.getElementById('documentDescription').value.trim();
-    const documentFile = document.getElementById('documentFile').files[0];
+    const documentFiles = document.getElementById('documentFile').files;
+    const documentFile = documentFiles[0];
+    
+    // Vários arquivos: envio em lote, usando o nome de cada arquivo
+    if (documentFiles.length > 1) {
+        uploadDocumentsBatch(documentFiles, documentDescription);
+        return;
+    }
     
     if (!documentName) {
         showNotification('Nome do documento é obrigatório', 'warning');
@@ -640,6 +646,41 @@ function uploadDocument() {
     });
 }
 
+function uploadDocumentsBatch(files, description) {
+    const formData = new FormData();
+    formData.append('description', description);
+    formData.append('folder_id', currentFolder);
+    formData.append('project_id', currentProject);
+    for (const file of files) {
+        formData.append('files', file);
+    }
+    
+    showNotification(`Enviando ${files.length} documentos...`, 'info');
+    
+    fetch('/api/docs/documents/batch', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error && !data.results) {
+            throw new Error(data.error);
+        }
+        closeModal('uploadDocumentModal');
+        if (data.failed > 0) {
+            const failedNames = data.results.filter(r => !r.success).map(r => r.file_name).join(', ');
+            showNotification(`${data.created} documentos criados, ${data.failed} com erro: ${failedNames}`, 'warning');
+        } else {
+            showNotification(`${data.created} documentos criados com sucesso`, 'success');
+        }
+        loadFolder(currentFolder);
+    })
+    .catch(error => {
+        console.error('Erro ao enviar documentos:', error);
+        showNotification(error.message || 'Erro ao enviar documentos', 'error');
+    });
+}
+
 function showNewVersionModal(documentId, documentName) {
     document.getElementById('documentNameVersion').textContent = documentName;
     document.getElementById('currentDocumentId').value = documentId;
@@ -692,6 +733,65 @@ function downloadLatestVersion(documentId) {
     window.location.href = `/api/docs/documents/${documentId}/download`;
 }
 
+function versionItemHTML(documentId, version) {
+    return `
+        <div class="version-item">
+            <div class="version-header">
+                <div class="version-number">Versão ${version.version_number}</div>
+                <div class="version-date">${formatDate(version.created_at)}</div>
+            </div>
+            ${version.change_description ? `
+                <div class="version-description">${version.change_description}</div>
+            ` : ''}
+            <div class="version-meta">
+                <span>Enviado por: ${version.uploader_name}</span>
+                <span>Arquivo: ${version.file_name}</span>
+                <span>Tamanho: ${formatFileSize(version.file_size)}</span>
+            </div>
+            <div class="version-actions">
+                <button class="version-download" onclick="downloadVersionFile(${documentId}, ${version.id})">
+                    <svg viewBox="0 0 24 24" width="16" height="16">
+                        <path fill="currentColor" d="M5,20H19V18H5M19,9H15V3H9V9H5L12,16L19,9Z" />
+                    </svg>
+                    Download
+                </button>
+            </div>
+        </div>
+    `;
+}
+
+// Botão "Carregar mais" do histórico, quando há mais páginas
+function versionHistoryMoreHTML(documentId, pageInfo) {
+    if (!pageInfo || pageInfo.page >= pageInfo.pages) {
+        return '';
+    }
+    return `
+        <button class="version-load-more" onclick="loadMoreVersions(${documentId}, ${pageInfo.page + 1})">
+            Carregar mais versões (${pageInfo.total - pageInfo.page * pageInfo.per_page} restantes)
+        </button>
+    `;
+}
+
+function loadMoreVersions(documentId, page) {
+    fetch(`/api/docs/documents/${documentId}/versions?page=${page}`)
+        .then(response => {
+            if (!response.ok) throw new Error(response.statusText);
+            return response.json();
+        })
+        .then(data => {
+            const versionHistoryElement = document.getElementById('versionHistory');
+            const button = versionHistoryElement.querySelector('.version-load-more');
+            if (button) button.remove();
+            versionHistoryElement.insertAdjacentHTML('beforeend',
+                data.versions.map(version => versionItemHTML(documentId, version)).join('') +
+                versionHistoryMoreHTML(documentId, data.versions_page));
+        })
+        .catch(error => {
+            console.error('Erro ao carregar histórico de versões:', error);
+            showNotification('Erro ao carregar histórico de versões', 'error');
+        });
+}
+
 function showVersionHistory(documentId) {
     fetch(`/api/docs/documents/${documentId}?include_versions=true`)
         .then(response => {
@@ -714,36 +814,9 @@ function showVersionHistory(documentId) {
                     </div>
                 `;
             } else {
-                let versionsHTML = '';
-                
-                data.versions.forEach(version => {
-                    versionsHTML += `
-                        <div class="version-item">
-                            <div class="version-header">
-                                <div class="version-number">Versão ${version.version_number}</div>
-                                <div class="version-date">${formatDate(version.created_at)}</div>
-                            </div>
-                            ${version.change_description ? `
-                                <div class="version-description">${version.change_description}</div>
-                            ` : ''}
-                            <div class="version-meta">
-                                <span>Enviado por: ${version.uploader_name}</span>
-                                <span>Arquivo: ${version.file_name}</span>
-                                <span>Tamanho: ${formatFileSize(version.file_size)}</span>
-                            </div>
-                            <div class="version-actions">
-                                <button class="version-download" onclick="downloadVersionFile(${documentId}, ${version.id})">
-                                    <svg viewBox="0 0 24 24" width="16" height="16">
-                                        <path fill="currentColor" d="M5,20H19V18H5M19,9H15V3H9V9H5L12,16L19,9Z" />
-                                    </svg>
-                                    Download
-                                </button>
-                            </div>
-                        </div>
-                    `;
-                });
-                
-                versionHistoryElement.innerHTML = versionsHTML;
+                versionHistoryElement.innerHTML =
+                    data.versions.map(version => versionItemHTML(documentId, version)).join('') +
+                    versionHistoryMoreHTML(documentId, data.versions_page);
             }
             
             showModal('versionHistoryModal');
@@ -1,7 +1,6 @@
 document.addEventListener('DOMContentLoaded', function() {
     loadKudos();
     loadUsers();
-    setupFilters();
     setupNewKudoButton();
 
     // Configurar o emoji picker
@@ -30,16 +29,38 @@ document.addEventListener('DOMContentLoaded', function() {
     updateRemainingKudos();
 });
 
-function loadKudos() {
-    fetch('/kudos/api/kudos')
+// Feed paginado por cursor: cada página traz o id para buscar a seguinte
+let nextCursor = null;
+let feedRequest = 0;
+
+function loadKudos(reset = true) {
+    const params = new URLSearchParams({
+        category: document.getElementById('filterCategory').value,
+        type: document.getElementById('filterType').value,
+        date: document.getElementById('filterDate').value
+    });
+    if (!reset && nextCursor) {
+        params.set('before', nextCursor);
+    }
+
+    // Ignora respostas de buscas anteriores (ex.: filtros trocados em sequência)
+    const request = ++feedRequest;
+    return fetch(`/kudos/api/kudos/feed?${params}`)
         .then(response => response.json())
-        .then(kudos => {
+        .then(page => {
+            if (request !== feedRequest) return;
             const feed = document.getElementById('kudosFeed');
-            feed.innerHTML = '';
-            kudos.forEach(kudo => {
+            if (reset) {
+                feed.innerHTML = '';
+            }
+            page.kudos.forEach(kudo => {
                 feed.appendChild(createKudoCard(kudo));
             });
-            updateRemainingKudos(); // Atualiza as estrelas após carregar kudos
+            nextCursor = page.next_cursor;
+            document.getElementById('loadMoreKudos').style.display = page.has_more ? 'block' : 'none';
+            if (reset) {
+                updateRemainingKudos(); // Atualiza as estrelas após carregar kudos
+            }
         })
         .catch(error => {
             console.error('Error loading kudos:', error);
@@ -103,16 +124,16 @@ function createKudoCard(kudo) {
         <div class="kudo-footer">
             <div class="reactions">
                 <button onclick="addReaction(${kudo.id}, 'like')" 
-                        class="reaction-button ${hasReaction(kudo.reactions, 'like') ? 'active' : ''}">
-                    👍 ${countReactions(kudo.reactions, 'like')}
+                        class="reaction-button ${hasReaction(kudo, 'like') ? 'active' : ''}">
+                    👍 ${countReactions(kudo, 'like')}
                 </button>
                 <button onclick="addReaction(${kudo.id}, 'heart')" 
-                        class="reaction-button ${hasReaction(kudo.reactions, 'heart') ? 'active' : ''}">
-                    ❤️ ${countReactions(kudo.reactions, 'heart')}
+                        class="reaction-button ${hasReaction(kudo, 'heart') ? 'active' : ''}">
+                    ❤️ ${countReactions(kudo, 'heart')}
                 </button>
             </div>
             <button onclick="toggleComments(${kudo.id})" class="comment-button">
-                ${kudo.comments.length} comentários
+                ${kudo.comment_count} comentários
             </button>
         </div>
         <div class="comments-section" id="comments-${kudo.id}" style="display: none;">
@@ -126,27 +147,9 @@ function createKudoCard(kudo) {
     return card;
 }
 
-function setupFilters() {
-    const categoryFilter = document.getElementById('filterCategory');
-    const dateFilter = document.getElementById('filterDate');
-
-    categoryFilter.addEventListener('change', filterKudos);
-    dateFilter.addEventListener('change', filterKudos);
-}
-
 function filterKudos() {
-    const category = document.getElementById('filterCategory').value;
-    const date = document.getElementById('filterDate').value;
-
-    fetch(`/api/kudos?category=${category}&date=${date}`)
-        .then(response => response.json())
-        .then(kudos => {
-            const feed = document.getElementById('kudosFeed');
-            feed.innerHTML = '';
-            kudos.forEach(kudo => {
-                feed.appendChild(createKudoCard(kudo));
-            });
-        });
+    // Os filtros são aplicados pelo feed; recomeça da primeira página
+    loadKudos();
 }
 
 function setupNewKudoButton() {
@@ -226,7 +229,7 @@ function formatDate(dateString) {
     return new Date(dateString).toLocaleDateString('pt-BR');
 }
 
-function createReactionsHTML(reactions) {
+function createReactionsHTML(kudo) {
     const types = {
         'like': '👍',
         'heart': '❤️'
@@ -234,8 +237,8 @@ function createReactionsHTML(reactions) {
     
     return Object.entries(types).map(([type, emoji]) => `
         <button onclick="addReaction(${kudo.id}, '${type}')" 
-                class="reaction-button ${hasReaction(reactions, type) ? 'active' : ''}">
-            ${emoji} ${countReactions(reactions, type)}
+                class="reaction-button ${hasReaction(kudo, type) ? 'active' : ''}">
+            ${emoji} ${countReactions(kudo, type)}
         </button>
     `).join('');
 }
@@ -246,6 +249,7 @@ function createCommentsHTML(comments) {
             <strong>${comment.user.name}</strong>
             <div>${comment.content}</div>
             <small>${formatDate(comment.created_at)}</small>
+            ${comment.replies.length ? `<div class="comment-replies">${createCommentsHTML(comment.replies)}</div>` : ''}
         </div>
     `).join('');
 }
@@ -292,12 +296,12 @@ function addComment(event, kudoId) {
     });
 }
 
-function hasReaction(reactions, type) {
-    return reactions.some(r => r.reaction_type === type);
+function hasReaction(kudo, type) {
+    return kudo.my_reaction === type;
 }
 
-function countReactions(reactions, type) {
-    return reactions.filter(r => r.reaction_type === type).length;
+function countReactions(kudo, type) {
+    return kudo.reaction_counts[type] || 0;
 }
 
 function selectType(type) {
@@ -0,0 +1,65 @@
+"""
+Provisionamento da pasta raiz dos projetos (utils/doc_folders.py) com
+processos simultâneos, simulados por threads com sessões próprias sobre um
+banco SQLite em arquivo.
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models.db import db, Team, Project, DocFolder
+from utils.doc_folders import provision_project, provision_projects
+
+THREADS = 8
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'docs.db'}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Team(name='Admin', email='admin@example.com', password_hash='x', is_admin=True),
+                            Project(name='P')])
+        db.session.commit()
+    return app
+
+
+def test_concurrent_provisioning_creates_a_single_root(app):
+    barrier = threading.Barrier(THREADS)
+    errors = []
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                provision_project(1)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with app.app_context():
+        roots = DocFolder.query.filter_by(project_id=1, parent_id=None).all()
+        assert len(roots) == 1
+        assert os.path.isdir(roots[0].path)
+        # O preenchimento posterior não encontra nada a fazer
+        assert provision_projects() == []
@@ -0,0 +1,99 @@
+"""
+Cota mensal de kudos (routes/kudos.py) sob envios concorrentes.
+
+Usa um banco SQLite em arquivo temporário: cada thread tem a própria
+sessão/conexão, como requests paralelos do servidor.
+"""
+
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models.db import db, Team, Kudos, KudosQuota
+from routes.kudos import MONTHLY_KUDOS_LIMIT, consume_kudos_quota, current_quota_month, get_quota_used
+
+THREADS = 20
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'kudos.db'}"
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Team(name='Remetente', email='sender@example.com', password_hash='x'),
+            Team(name='Destinatário', email='receiver@example.com', password_hash='x')
+        ])
+        db.session.commit()
+    return app
+
+
+def send_concurrently(app, sender_id, receiver_id):
+    """Dispara THREADS envios simultâneos; retorna quantos consumiram a cota"""
+    barrier = threading.Barrier(THREADS)
+    results = []
+    errors = []
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                if consume_kudos_quota(sender_id):
+                    db.session.add(Kudos(sender_id=sender_id, receiver_id=receiver_id,
+                                         category='reconhecimento', type='ajuda', message='ok'))
+                    db.session.commit()
+                    results.append(True)
+                else:
+                    db.session.rollback()
+                    results.append(False)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    return results.count(True)
+
+
+def test_concurrent_sends_never_exceed_limit(app):
+    sent = send_concurrently(app, 1, 2)
+
+    assert sent == MONTHLY_KUDOS_LIMIT
+    with app.app_context():
+        assert get_quota_used(1) == MONTHLY_KUDOS_LIMIT
+        assert Kudos.query.filter_by(sender_id=1).count() == MONTHLY_KUDOS_LIMIT
+
+
+def test_quota_seeded_from_kudos_already_sent(app):
+    # Kudos do mês enviados antes de existir a linha de cota (ex.: antes do deploy)
+    with app.app_context():
+        db.session.add_all([
+            Kudos(sender_id=1, receiver_id=2, category='reconhecimento', type='ajuda',
+                  message='antigo', created_at=datetime.utcnow())
+            for _ in range(3)
+        ])
+        db.session.commit()
+        assert get_quota_used(1) == 3
+
+    sent = send_concurrently(app, 1, 2)
+
+    assert sent == MONTHLY_KUDOS_LIMIT - 3
+    with app.app_context():
+        quota = db.session.get(KudosQuota, (1, current_quota_month()))
+        assert quota.used == MONTHLY_KUDOS_LIMIT
@@ -0,0 +1,70 @@
+"""
+Contadores de reações dos kudos (routes/kudos.py) para reações gravadas
+antes de existir a linha de KudosReactionCount.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models.db import db, Team, Kudos, KudosReaction, KudosReactionCount
+from routes.kudos import change_reaction_count
+
+USERS = 4
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'kudos.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Team(name=f'U{i}', email=f'u{i}@example.com', password_hash='x')
+                            for i in range(USERS)])
+        db.session.flush()
+        db.session.add(Kudos(sender_id=1, receiver_id=2, category='reconhecimento',
+                             type='ajuda', message='ok'))
+        db.session.flush()
+        # Reações antigas, sem contador
+        db.session.add_all([KudosReaction(kudo_id=1, user_id=user_id, reaction_type='like')
+                            for user_id in range(1, USERS)])
+        db.session.commit()
+        yield app
+
+
+def reaction_count(reaction_type):
+    return db.session.get(KudosReactionCount, (1, reaction_type)).count
+
+
+def test_new_reaction_seeds_counter_from_existing_reactions(app):
+    db.session.add(KudosReaction(kudo_id=1, user_id=USERS, reaction_type='like'))
+    db.session.flush()
+    change_reaction_count(1, 'like', 1)
+    db.session.commit()
+
+    assert reaction_count('like') == USERS
+
+    change_reaction_count(1, 'like', 1)
+    assert reaction_count('like') == USERS + 1
+
+
+def test_removing_old_reaction_never_goes_negative(app):
+    db.session.delete(KudosReaction.query.filter_by(user_id=1).one())
+    db.session.flush()
+    change_reaction_count(1, 'like', -1)
+    db.session.commit()
+
+    assert reaction_count('like') == USERS - 2
+
+    # Contador já zerado: o decremento não cria valor negativo
+    db.session.add(KudosReactionCount(kudo_id=1, reaction_type='love', count=0))
+    db.session.flush()
+    change_reaction_count(1, 'love', -1)
+    assert reaction_count('love') == 0
@@ -0,0 +1,193 @@
+"""
+Driver S3 (utils/storage.py) contra um bucket simulado pelo moto.
+
+Cobre envio de arquivo e de stream com multipart, leitura, cópia local,
+exclusão, listagem e URL pré-assinada, além da remoção de objetos órfãos
+pela verificação de consistência (utils/doc_consistency.py).
+"""
+
+import hashlib
+import io
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+boto3 = pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+requests = pytest.importorskip('requests')
+
+from flask import Flask
+
+import utils.storage as storage_module
+from models.db import db, Team, Project, DocFolder, Document, DocumentVersion, DocumentBlob
+from utils.doc_storage import blob_path, store_blob
+from utils.storage import S3Storage
+
+BUCKET = 'deeply-test'
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setenv('S3_BUCKET', BUCKET)
+    monkeypatch.setenv('S3_REGION', 'us-east-1')
+    monkeypatch.setenv('S3_PREFIX', 'deeply')
+    # Partes de 5 MB (mínimo do S3) para exercitar o multipart com arquivos pequenos
+    monkeypatch.setenv('S3_MULTIPART_THRESHOLD_MB', '5')
+    monkeypatch.setenv('S3_MULTIPART_CHUNK_MB', '5')
+    with moto.mock_aws():
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        yield S3Storage()
+
+
+def _object(s3, key):
+    return s3.client.head_object(Bucket=BUCKET, Key=f"deeply/{key}")
+
+
+def test_put_file_multipart_and_read_back(s3, tmp_path):
+    data = os.urandom(12 * MB)
+    src = tmp_path / 'upload.bin'
+    src.write_bytes(data)
+
+    s3.put_file('Uploads/Blobs/aa/bb/file', str(src))
+
+    assert not src.exists()  # move=True apaga o staging
+    assert '-' in _object(s3, 'Uploads/Blobs/aa/bb/file')['ETag']  # ETag de envio multipart
+    assert s3.exists('Uploads/Blobs/aa/bb/file')
+    assert s3.size('Uploads/Blobs/aa/bb/file') == len(data)
+    with s3.open('Uploads/Blobs/aa/bb/file') as body:
+        assert hashlib.sha256(body.read()).digest() == hashlib.sha256(data).digest()
+
+
+def test_put_file_copy_keeps_source(s3, tmp_path):
+    src = tmp_path / 'small.txt'
+    src.write_bytes(b'conteudo')
+
+    s3.put_file('Uploads/Blobs/cc/dd/small', str(src), move=False)
+
+    assert src.exists()
+    assert '-' not in _object(s3, 'Uploads/Blobs/cc/dd/small')['ETag']
+
+
+def test_put_stream_multipart(s3):
+    data = os.urandom(11 * MB)
+
+    s3.put_stream('Uploads/Avatars/stream', io.BytesIO(data))
+
+    assert '-' in _object(s3, 'Uploads/Avatars/stream')['ETag']
+    assert s3.open('Uploads/Avatars/stream').read() == data
+
+
+def test_local_copy_is_temporary(s3):
+    s3.put_stream('Uploads/Blobs/ee/ff/doc', io.BytesIO(b'pdf bytes'))
+
+    with s3.local_copy('Uploads/Blobs/ee/ff/doc') as path:
+        with open(path, 'rb') as f:
+            assert f.read() == b'pdf bytes'
+    assert not os.path.exists(path)
+
+
+def test_missing_objects(s3):
+    assert not s3.exists('Uploads/Blobs/00/00/missing')
+    assert s3.size('Uploads/Blobs/00/00/missing') is None
+    with pytest.raises(FileNotFoundError):
+        s3.open('Uploads/Blobs/00/00/missing')
+    with pytest.raises(FileNotFoundError):
+        with s3.local_copy('Uploads/Blobs/00/00/missing'):
+            pass
+    assert s3.delete('Uploads/Blobs/00/00/missing') == 0
+
+
+def test_delete_returns_freed_bytes(s3):
+    s3.put_stream('Uploads/Blobs/11/22/gone', io.BytesIO(b'x' * 100))
+
+    assert s3.delete('Uploads/Blobs/11/22/gone') == 100
+    assert not s3.exists('Uploads/Blobs/11/22/gone')
+
+
+def test_list_keys_and_objects_strip_prefix(s3):
+    for key in ('Uploads/Blobs/aa/1', 'Uploads/Blobs/ab/2', 'Uploads/Avatars/3'):
+        s3.put_stream(key, io.BytesIO(b'abc'))
+
+    assert sorted(s3.list_keys('Uploads/Blobs/a')) == ['Uploads/Blobs/aa/1', 'Uploads/Blobs/ab/2']
+    objects = s3.list_objects('Uploads/Blobs')
+    assert sorted(key for key, _, _ in objects) == ['Uploads/Blobs/aa/1', 'Uploads/Blobs/ab/2']
+    assert all(size == 3 and mtime > 0 for _, size, mtime in objects)
+
+
+def test_download_url_is_presigned(s3):
+    s3.put_stream('Uploads/Blobs/33/44/report', io.BytesIO(b'relatorio'))
+
+    url = s3.download_url('Uploads/Blobs/33/44/report', 'attachment; filename="r.txt"', 'text/plain')
+
+    assert 'X-Amz-Signature=' in url and 'deeply/Uploads/Blobs/33/44/report' in url
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == b'relatorio'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="r.txt"'
+    assert response.headers['Content-Type'] == 'text/plain'
+
+
+@pytest.fixture
+def app(s3, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage_module, '_storage', s3)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'docs.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def _stage(tmp_path, data):
+    path = tmp_path / f"staged_{hashlib.sha256(data).hexdigest()[:8]}"
+    path.write_bytes(data)
+    return str(path), hashlib.sha256(data).hexdigest()
+
+
+def test_scan_removes_orphan_objects_from_rolled_back_uploads(app, s3, tmp_path):
+    from utils.doc_consistency import check_consistency
+
+    user = Team(name='A', email='a@example.com', password_hash='x')
+    project = Project(name='P')
+    db.session.add_all([user, project])
+    db.session.flush()
+    folder = DocFolder(name='root', project_id=project.id, created_by=user.id,
+                       path=os.path.join('Uploads', 'Projects', str(project.id)))
+    db.session.add(folder)
+    db.session.flush()
+    os.makedirs(folder.path)
+    document = Document(name='doc', folder_id=folder.id, project_id=project.id, created_by=user.id)
+    db.session.add(document)
+    db.session.flush()
+
+    kept, kept_sha = _stage(tmp_path, b'versao mantida')
+    db.session.add(DocumentVersion(document_id=document.id, version_number=1, file_name='a.txt',
+                                   file_path=store_blob(kept, kept_sha, 14), file_size=14,
+                                   uploaded_by=user.id, created_at=datetime.utcnow()))
+    db.session.commit()
+
+    # Envio desfeito: o objeto já estava no bucket quando a transação voltou
+    lost, lost_sha = _stage(tmp_path, b'envio desfeito')
+    store_blob(lost, lost_sha, 14)
+    db.session.rollback()
+    assert s3.exists(blob_path(lost_sha))
+    assert db.session.get(DocumentBlob, lost_sha) is None
+
+    report = check_consistency(grace_seconds=0)
+    assert report['counts'] == {'orphan_blobs': 1}
+    assert report['issues']['orphan_blobs'][0]['path'] == blob_path(lost_sha)
+
+    report = check_consistency(repair=True, grace_seconds=0)
+    assert report['repaired']['orphan_blobs'] == 1
+    assert not s3.exists(blob_path(lost_sha))
+    assert s3.exists(blob_path(kept_sha))
+    assert check_consistency(grace_seconds=0)['counts'] == {}
@@ -0,0 +1,219 @@
+"""
+Motor de medalhas (badges) da gamificação.
+
+As regras são declarativas (BADGE_RULES) e avaliadas de forma incremental:
+cada evento (sessão de trabalho do Pomodoro, kudo enviado/recebido, card
+concluído) atualiza apenas a linha de BadgeProgress de cada regra afetada.
+O custo por evento é constante, independente do tamanho do histórico.
+
+Uso típico, dentro da mesma transação que grava o evento:
+
+    awarded = record_event(user_id, 'work_session', log.start_time)
+    db.session.commit()
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from models.db import db, BadgeProgress, UserBadge
+from utils.logger import setup_logger
+
+logger = setup_logger('badges')
+
+# Tipos de regra:
+#   count  - contador acumulado; concede ao atingir 'threshold'
+#   weekly - contador por semana ISO; reinicia a cada semana
+#   streak - dias consecutivos com pelo menos um evento
+BADGE_RULES = [
+    {
+        'code': 'first_work_session',
+        'name': 'Primeiro Foco',
+        'description': 'Concluiu a primeira sessão de Deep Work',
+        'event': 'work_session',
+        'kind': 'count',
+        'threshold': 1,
+    },
+    {
+        'code': 'weekly_10_sessions',
+        'name': 'Semana Produtiva',
+        'description': '10 sessões de trabalho na mesma semana',
+        'event': 'work_session',
+        'kind': 'weekly',
+        'threshold': 10,
+    },
+    {
+        'code': 'streak_7_days',
+        'name': 'Constância',
+        'description': '7 dias seguidos com sessões de trabalho',
+        'event': 'work_session',
+        'kind': 'streak',
+        'threshold': 7,
+    },
+    {
+        'code': 'streak_30_days',
+        'name': 'Hábito de Ferro',
+        'description': '30 dias seguidos com sessões de trabalho',
+        'event': 'work_session',
+        'kind': 'streak',
+        'threshold': 30,
+    },
+    {
+        'code': 'first_kudos_received',
+        'name': 'Reconhecido',
+        'description': 'Recebeu o primeiro kudo',
+        'event': 'kudos_received',
+        'kind': 'count',
+        'threshold': 1,
+    },
+    {
+        'code': 'kudos_10_received',
+        'name': 'Referência do Time',
+        'description': 'Recebeu 10 kudos',
+        'event': 'kudos_received',
+        'kind': 'count',
+        'threshold': 10,
+    },
+    {
+        'code': 'first_kudos_sent',
+        'name': 'Generoso',
+        'description': 'Enviou o primeiro kudo',
+        'event': 'kudos_sent',
+        'kind': 'count',
+        'threshold': 1,
+    },
+    {
+        'code': 'first_card_completed',
+        'name': 'Mão na Massa',
+        'description': 'Concluiu o primeiro card',
+        'event': 'card_completed',
+        'kind': 'count',
+        'threshold': 1,
+    },
+    {
+        'code': 'cards_50_completed',
+        'name': 'Entregador',
+        'description': 'Concluiu 50 cards',
+        'event': 'card_completed',
+        'kind': 'count',
+        'threshold': 50,
+    },
+]
+
+RULES_BY_CODE = {rule['code']: rule for rule in BADGE_RULES}
+
+# Índice evento -> regras, para que cada evento toque apenas as regras relevantes
+_RULES_BY_EVENT = {}
+for _rule in BADGE_RULES:
+    _RULES_BY_EVENT.setdefault(_rule['event'], []).append(_rule)
+
+
+def _iso_week(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _apply_rule(rule, progress, day):
+    """Atualiza o estado de uma regra para um evento ocorrido em 'day'."""
+    kind = rule['kind']
+
+    if kind == 'count':
+        progress.count += 1
+
+    elif kind == 'weekly':
+        week = _iso_week(day)
+        if progress.period is None or week > progress.period:
+            progress.period = week
+            progress.count = 0
+        elif week < progress.period:
+            return  # Evento de uma semana já encerrada
+        progress.count += 1
+
+    elif kind == 'streak':
+        if progress.last_date is None or day > progress.last_date + timedelta(days=1):
+            progress.count = 1
+        elif day == progress.last_date + timedelta(days=1):
+            progress.count += 1
+        else:
+            return  # Mesmo dia ou evento atrasado: não altera a sequência
+        progress.last_date = day
+
+
+def record_event(user_id, event, when=None):
+    """
+    Registra um evento para o usuário e concede as medalhas atingidas.
+
+    Deve ser chamado antes do commit da operação que gerou o evento; o estado
+    é gravado em um savepoint para que uma falha aqui nunca desfaça o evento
+    original. Retorna a lista de regras (dicts) concedidas neste evento.
+    """
+    rules = _RULES_BY_EVENT.get(event)
+    if not user_id or not rules:
+        return []
+
+    when = when or datetime.utcnow()
+    day = when.date() if isinstance(when, datetime) else when
+    awarded = []
+
+    try:
+        with db.session.begin_nested():
+            for rule in rules:
+                progress = db.session.get(BadgeProgress, (user_id, rule['code']))
+                if progress is None:
+                    progress = BadgeProgress(user_id=user_id, badge_code=rule['code'], count=0)
+                    db.session.add(progress)
+                elif progress.count >= rule['threshold'] and rule['kind'] == 'count':
+                    continue  # Já conquistada; contadores acumulados não precisam avançar
+
+                _apply_rule(rule, progress, day)
+
+                # Só consulta as conquistas no momento em que o limite é cruzado
+                if progress.count == rule['threshold']:
+                    already = UserBadge.query.filter_by(
+                        user_id=user_id,
+                        badge_code=rule['code']
+                    ).first()
+                    if not already:
+                        db.session.add(UserBadge(user_id=user_id, badge_code=rule['code']))
+                        awarded.append(rule)
+    except IntegrityError:
+        # Outro request concedeu/criou o progresso em paralelo; o próximo evento recupera
+        logger.warning(f"Conflito ao atualizar medalhas do usuário {user_id} ({event})")
+        return []
+    except Exception as e:
+        logger.error(f"Erro ao avaliar medalhas do usuário {user_id} ({event}): {str(e)}")
+        return []
+
+    for rule in awarded:
+        logger.info(f"Medalha '{rule['code']}' concedida ao usuário {user_id}")
+    return awarded
+
+
+def badge_to_dict(rule, earned_at=None, progress=None):
+    """Serializa uma regra com o estado do usuário."""
+    data = {
+        'code': rule['code'],
+        'name': rule['name'],
+        'description': rule['description'],
+        'threshold': rule['threshold'],
+        'earned': earned_at is not None,
+        'earned_at': earned_at.isoformat() if earned_at else None,
+        'progress': min(progress.count, rule['threshold']) if progress else 0,
+    }
+    return data
+
+
+def get_user_badges(user_id):
+    """Catálogo completo de medalhas com o progresso do usuário (duas consultas)."""
+    earned = {
+        b.badge_code: b.earned_at
+        for b in UserBadge.query.filter_by(user_id=user_id).all()
+    }
+    progress = {
+        p.badge_code: p
+        for p in BadgeProgress.query.filter_by(user_id=user_id).all()
+    }
+    return [
+        badge_to_dict(rule, earned.get(rule['code']), progress.get(rule['code']))
+        for rule in BADGE_RULES
+    ]
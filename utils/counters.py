@@ -0,0 +1,58 @@
+"""
+Contadores mantidos no banco de dados.
+
+Upsert com incremento atômico ("INSERT ... ON CONFLICT DO UPDATE" no SQLite
+e PostgreSQL, "ON DUPLICATE KEY UPDATE" no MariaDB/MySQL), usado pelas
+tabelas de agregados para acumular valores sem ler a linha antes.
+"""
+
+from sqlalchemy import and_
+
+from models.db import db
+
+
+def upsert_increment(model, rows, keys, counters):
+    """
+    Insere as linhas ou soma os contadores às linhas já existentes.
+
+    Args:
+        model: modelo SQLAlchemy da tabela de agregados
+        rows: lista de dicts com as colunas de chave e os contadores
+        keys: nomes das colunas que formam a chave primária
+        counters: nomes das colunas que devem ser incrementadas
+    """
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={c: table.c[c] + stmt.excluded[c] for c in counters}
+        )
+        db.session.execute(stmt, rows)
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update(
+            {c: table.c[c] + stmt.inserted[c] for c in counters}
+        )
+        db.session.execute(stmt, rows)
+    else:
+        # Fallback genérico: UPDATE incremental e INSERT quando não existe
+        for row in rows:
+            condition = and_(*[table.c[k] == row[k] for k in keys])
+            result = db.session.execute(
+                table.update().where(condition).values(
+                    {c: table.c[c] + row[c] for c in counters}
+                )
+            )
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(**row))
@@ -0,0 +1,451 @@
+"""
+Verificação de consistência entre o disco (Uploads/) e o banco de documentos.
+
+As rotas alteram arquivos e linhas em etapas separadas (o arquivo é gravado
+antes do commit e apagado depois dele), então uma falha no meio do caminho
+deixa arquivos sem registro ou registros sem arquivo. check_consistency
+percorre Uploads/ em paralelo (um os.scandir por diretório, em threads),
+cruza o resultado com DocFolder, Document, DocumentVersion, DocumentBlob e
+DocumentUpload e relata:
+
+- missing_files: versões cujo arquivo não existe;
+- stale_paths: versões no formato antigo cujo arquivo foi encontrado na
+  pasta atual do documento (caminho desatualizado);
+- size_mismatch: arquivo com tamanho diferente do registrado;
+- stale_folder_paths: pastas cujo caminho não corresponde ao da pasta pai;
+- missing_dirs: pastas sem diretório no disco;
+- blob_refcount_drift: DocumentBlob.ref_count diferente do número de versões;
+- unreferenced_blobs: blobs com zero referências ainda não apagados;
+- orphan_blobs, orphan_files, orphan_dirs, orphan_staging e
+  orphan_derivatives: conteúdo no disco que nenhum registro referencia.
+
+Arquivos modificados há menos de ORPHAN_GRACE_SECONDS nunca são tratados como
+órfãos, pois podem pertencer a um envio em andamento. Com repair=True as
+correções são aplicadas em lotes (um commit por lote); arquivos só são
+apagados após o commit, e blobs somente por remove_blobs
+(utils/doc_storage.py), com a linha de DocumentBlob travada. Problemas sem
+correção automática (missing_files, size_mismatch) são apenas relatados.
+
+Com armazenamento remoto (STORAGE_BACKEND=s3) os blobs são conferidos pela
+listagem do bucket (tamanho e data de modificação de cada objeto), o que
+inclui os objetos enviados por store_blob em transações desfeitas.
+
+Execução: `flask docs-consistency-scan [--repair]`.
+"""
+
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.exc import IntegrityError
+
+from models.db import db, Document, DocumentVersion, DocumentBlob, DocumentUpload, DocFolder, Team
+from utils.doc_folders import rewrite_paths
+from utils.doc_storage import UPLOAD_BASE, BLOB_DIR, blob_sha, blob_path, get_project_path, remove_blobs
+from utils.doc_usage import MAX_REPORTED_ISSUES
+from utils.logger import setup_logger
+from utils.storage import get_storage
+
+logger = setup_logger('doc_consistency')
+
+SCAN_BATCH_SIZE = 500
+ORPHAN_GRACE_SECONDS = int(os.getenv('DOCS_ORPHAN_GRACE_MINUTES', 60)) * 60
+
+PROJECTS_DIR = os.path.join(UPLOAD_BASE, 'Projects')
+AVATAR_URL_PREFIX = '/media/avatars/'
+
+
+def _scan_dir(path):
+    """Conteúdo imediato de um diretório: (caminho, [(arquivo, tamanho, mtime)], [subdiretórios])"""
+    files, subdirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return path, files, subdirs
+
+
+def scan_tree(root, workers=8):
+    """
+    Percorre root com vários os.scandir em paralelo. Retorna
+    ({arquivo: (tamanho, mtime)}, {diretórios}), com caminhos normalizados.
+    """
+    files, dirs = {}, set()
+    if not os.path.isdir(root):
+        return files, dirs
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_dir, os.path.normpath(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, found, subdirs = future.result()
+                dirs.add(path)
+                for file_path, size, mtime in found:
+                    files[file_path] = (size, mtime)
+                for subdir in subdirs:
+                    pending.add(pool.submit(_scan_dir, subdir))
+    return files, dirs
+
+
+def _area(path):
+    """Primeiro componente do caminho dentro de Uploads/ (Projects, Blobs, ...)"""
+    return os.path.relpath(path, UPLOAD_BASE).split(os.sep, 1)[0]
+
+
+def _ancestors(path, stop):
+    """Diretórios de path (exclusive) até stop (inclusive)"""
+    result = []
+    parent = os.path.dirname(path)
+    while parent and parent != stop and len(parent) > len(stop):
+        result.append(parent)
+        parent = os.path.dirname(parent)
+    return result
+
+
+def _expected_folder_paths(folders):
+    """Caminho esperado de cada pasta: a raiz no diretório do projeto, as demais dentro da pasta pai"""
+    expected = {}
+
+    def resolve(folder_id):
+        if folder_id in expected:
+            return expected[folder_id]
+        chain = []
+        current = folder_id
+        while current is not None and current not in expected and current in folders:
+            chain.append(current)
+            current = folders[current]['parent_id']
+        for fid in reversed(chain):
+            folder = folders[fid]
+            parent_id = folder['parent_id']
+            if parent_id is None:
+                path = get_project_path(folder['project_id'])
+            elif parent_id in expected:
+                path = os.path.join(expected[parent_id], os.path.basename(folder['path']))
+            else:
+                # Pai inexistente: mantém o caminho gravado
+                path = folder['path']
+            expected[fid] = os.path.normpath(path)
+        return expected.get(folder_id)
+
+    for folder_id in folders:
+        resolve(folder_id)
+    return expected
+
+
+def _find_issues(files, dirs, grace_seconds):
+    """Cruza a listagem do disco com o banco; retorna {categoria: [problemas]}"""
+    issues = defaultdict(list)
+    now = time.time()
+
+    def is_orphan_candidate(path):
+        return now - files[path][1] >= grace_seconds
+
+    folders = {
+        folder_id: {'parent_id': parent_id, 'project_id': project_id, 'path': path}
+        for folder_id, parent_id, project_id, path in db.session.execute(
+            select(DocFolder.id, DocFolder.parent_id, DocFolder.project_id, DocFolder.path)
+        )
+    }
+
+    # Versões: existência, tamanho e caminhos desatualizados
+    referenced = set()
+    blob_refs = Counter()
+    blob_sizes = {}
+    checked = set()
+    query = select(DocumentVersion.id, DocumentVersion.document_id, DocumentVersion.file_path,
+                   DocumentVersion.file_size, Document.folder_id)\
+        .join(Document, Document.id == DocumentVersion.document_id)\
+        .execution_options(yield_per=SCAN_BATCH_SIZE)
+    for version_id, document_id, file_path, file_size, folder_id in db.session.execute(query):
+        path = os.path.normpath(file_path)
+        sha256 = blob_sha(file_path)
+        if sha256:
+            blob_refs[sha256] += 1
+            blob_sizes.setdefault(sha256, file_size)
+        referenced.add(path)
+
+        if path in files or (_area(path) == os.pardir and os.path.exists(path)):
+            if path not in checked and path in files and files[path][0] != file_size:
+                issues['size_mismatch'].append({'path': path, 'expected_size': file_size,
+                                                'actual_size': files[path][0]})
+            checked.add(path)
+            continue
+
+        folder = folders.get(folder_id)
+        candidate = None
+        if not sha256 and folder:
+            candidate = os.path.normpath(os.path.join(folder['path'], f"doc_{document_id}",
+                                                      os.path.basename(path)))
+        if candidate and candidate in files:
+            issues['stale_paths'].append({'version_id': version_id, 'path': path, 'found': candidate})
+            referenced.add(candidate)
+        else:
+            issues['missing_files'].append({'version_id': version_id, 'document_id': document_id,
+                                            'path': path})
+
+    # Blobs: contagem de referências e arquivos sem registro
+    blobs = dict(db.session.execute(select(DocumentBlob.sha256, DocumentBlob.ref_count)).all())
+    for sha256 in set(blobs) | set(blob_refs):
+        stored, actual = blobs.get(sha256), blob_refs.get(sha256, 0)
+        if stored != actual:
+            issues['blob_refcount_drift'].append({'sha256': sha256, 'stored': stored, 'actual': actual,
+                                                  'size': blob_sizes.get(sha256)})
+        elif actual == 0:
+            issues['unreferenced_blobs'].append({'sha256': sha256})
+
+    live_shas = set(blobs) | set(blob_refs)
+    upload_ids = set(db.session.scalars(select(DocumentUpload.id)).all())
+    avatar_shas = {
+        foto[len(AVATAR_URL_PREFIX):]
+        for foto in db.session.scalars(select(Team.foto).where(Team.foto.like(AVATAR_URL_PREFIX + '%')))
+    }
+
+    # Arquivos sem registro, por área de Uploads/
+    keep_dirs = set()
+    for path in files:
+        area = _area(path)
+        orphan = None
+        if area == 'Projects':
+            if path not in referenced:
+                orphan = 'orphan_files'
+        elif area == 'Blobs':
+            sha256 = blob_sha(path)
+            if not sha256 or sha256 not in live_shas:
+                orphan = 'orphan_blobs'
+        elif area == '.staging':
+            name = os.path.basename(path)
+            if not (name.endswith('.part') and name[:-len('.part')] in upload_ids):
+                orphan = 'orphan_staging'
+        elif area == 'Derivatives':
+            sha256 = os.path.basename(path).split('_', 1)[0]
+            if sha256 not in live_shas and sha256 not in avatar_shas:
+                orphan = 'orphan_derivatives'
+
+        if orphan and is_orphan_candidate(path):
+            issues[orphan].append({'path': path, 'size': files[path][0]})
+        elif area == 'Projects':
+            keep_dirs.update(_ancestors(path, PROJECTS_DIR))
+
+    # Pastas: caminho esperado e diretório no disco
+    expected = _expected_folder_paths(folders)
+    for folder_id, folder in folders.items():
+        path = os.path.normpath(folder['path'])
+        keep_dirs.add(path)
+        keep_dirs.update(_ancestors(path, PROJECTS_DIR))
+        if expected.get(folder_id) and expected[folder_id] != path:
+            issues['stale_folder_paths'].append({'folder_id': folder_id, 'path': path,
+                                                 'expected': expected[folder_id]})
+        elif path not in dirs:
+            issues['missing_dirs'].append({'folder_id': folder_id, 'path': path})
+
+    projects_dir = os.path.normpath(PROJECTS_DIR)
+    for path in sorted(dirs, key=len, reverse=True):
+        if _area(path) == 'Projects' and path != projects_dir and path not in keep_dirs:
+            issues['orphan_dirs'].append({'path': path})
+
+    return issues
+
+
+def _batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _remove_paths(paths):
+    """Apaga os arquivos; retorna os bytes liberados"""
+    freed = 0
+    for path in paths:
+        try:
+            freed += os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+    return freed
+
+
+def _repair_folder_paths(entries, batch_size):
+    """Corrige os caminhos a partir das pastas mais altas; rewrite_paths cobre as descendentes"""
+    stale = {entry['folder_id'] for entry in entries}
+    parents = dict(db.session.execute(
+        select(DocFolder.id, DocFolder.parent_id).where(DocFolder.id.in_(list(stale)))
+    ).all()) if stale else {}
+    top = [entry for entry in entries if parents.get(entry['folder_id']) not in stale]
+
+    repaired = 0
+    for batch in _batches(top, batch_size):
+        for entry in batch:
+            old_path, new_path = entry['path'], entry['expected']
+            if os.path.exists(old_path) and os.path.exists(new_path):
+                logger.warning(f"Pasta {entry['folder_id']}: {old_path} e {new_path} existem, não corrigida")
+                continue
+            if os.path.exists(old_path):
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.rename(old_path, new_path)
+            rewrite_paths(entry['folder_id'], old_path, new_path)
+            repaired += 1
+        db.session.commit()
+    return repaired
+
+
+def _repair_refcounts(entries, batch_size):
+    """
+    Regrava ref_count com a contagem atual do banco. Blobs sem referências
+    só têm a contagem zerada; o arquivo é apagado por remove_blobs, que
+    confere a contagem novamente com a linha travada.
+    """
+    unused = []
+    for batch in _batches(entries, batch_size):
+        paths = {blob_path(entry['sha256']): entry for entry in batch}
+        # A contagem gravada é lida antes das versões: se um envio mudar a
+        # linha entre as duas leituras, o UPDATE condicional abaixo não se aplica
+        stored = dict(db.session.execute(
+            select(DocumentBlob.sha256, DocumentBlob.ref_count)
+            .where(DocumentBlob.sha256.in_([e['sha256'] for e in batch]))
+        ).all())
+        actual = dict(db.session.execute(
+            select(DocumentVersion.file_path, func.count())
+            .where(DocumentVersion.file_path.in_(list(paths)))
+            .group_by(DocumentVersion.file_path)
+        ).all())
+
+        for path, entry in paths.items():
+            sha256, count = entry['sha256'], actual.get(path, 0)
+            if sha256 in stored:
+                if stored[sha256] != count:
+                    changed = db.session.execute(
+                        update(DocumentBlob)
+                        .where(DocumentBlob.sha256 == sha256, DocumentBlob.ref_count == stored[sha256])
+                        .values(ref_count=count).execution_options(synchronize_session=False)
+                    ).rowcount
+                    if not changed:
+                        continue
+                if count == 0:
+                    unused.append(path)
+            elif count:
+                size = entry['size'] if entry['size'] is not None else get_storage().size(path) or 0
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(DocumentBlob).values(sha256=sha256, size=size,
+                                                                        ref_count=count))
+                except IntegrityError:
+                    # Registrado por um envio depois da leitura
+                    pass
+        db.session.commit()
+
+    return remove_blobs(unused)
+
+
+def _remove_orphan_blobs(entries, batch_size):
+    """
+    Apaga blobs sem registro. Cada um é primeiro registrado com zero
+    referências, o que o sujeita à mesma trava de remove_blobs: um envio do
+    mesmo conteúdo em andamento impede o registro (e a remoção).
+    """
+    removed, freed = 0, 0
+    storage = get_storage()
+    for batch in _batches(entries, batch_size):
+        claimed = []
+        for entry in batch:
+            sha256 = blob_sha(entry['path'])
+            if not sha256:
+                freed += storage.delete(entry['path'])
+                removed += 1
+                continue
+            try:
+                with db.session.begin_nested():
+                    db.session.add(DocumentBlob(sha256=sha256, size=entry['size'] or 0, ref_count=0))
+                claimed.append(blob_path(sha256))
+            except IntegrityError:
+                # Registrado por um envio depois da varredura
+                pass
+        db.session.commit()
+        freed += remove_blobs(claimed)
+        removed += len(claimed)
+    return removed, freed
+
+
+def repair_issues(issues, batch_size=SCAN_BATCH_SIZE):
+    """Aplica as correções automáticas em lotes; retorna {categoria: corrigidos} e os bytes liberados"""
+    repaired = {}
+
+    repaired['stale_folder_paths'] = _repair_folder_paths(issues.get('stale_folder_paths', []), batch_size)
+
+    stale_paths = issues.get('stale_paths', [])
+    for batch in _batches(stale_paths, batch_size):
+        db.session.execute(update(DocumentVersion), [
+            {'id': entry['version_id'], 'file_path': entry['found']} for entry in batch
+        ])
+        db.session.commit()
+    repaired['stale_paths'] = len(stale_paths)
+
+    freed = _repair_refcounts(issues.get('blob_refcount_drift', []), batch_size)
+    repaired['blob_refcount_drift'] = len(issues.get('blob_refcount_drift', []))
+
+    unreferenced = [blob_path(entry['sha256']) for entry in issues.get('unreferenced_blobs', [])]
+    for batch in _batches(unreferenced, batch_size):
+        freed += remove_blobs(batch)
+    repaired['unreferenced_blobs'] = len(unreferenced)
+
+    repaired['orphan_blobs'], orphan_freed = _remove_orphan_blobs(issues.get('orphan_blobs', []), batch_size)
+    freed += orphan_freed
+
+    for category in ('orphan_files', 'orphan_staging', 'orphan_derivatives'):
+        entries = issues.get(category, [])
+        for batch in _batches(entries, batch_size):
+            freed += _remove_paths([entry['path'] for entry in batch])
+        repaired[category] = len(entries)
+
+    # Diretórios órfãos (mais profundos primeiro); os não vazios permanecem
+    removed_dirs = 0
+    for entry in issues.get('orphan_dirs', []):
+        try:
+            os.rmdir(entry['path'])
+            removed_dirs += 1
+        except OSError:
+            pass
+    repaired['orphan_dirs'] = removed_dirs
+
+    for entry in issues.get('missing_dirs', []):
+        os.makedirs(entry['path'], exist_ok=True)
+    repaired['missing_dirs'] = len(issues.get('missing_dirs', []))
+
+    return repaired, freed
+
+
+def check_consistency(repair=False, workers=8, batch_size=SCAN_BATCH_SIZE, grace_seconds=ORPHAN_GRACE_SECONDS):
+    """
+    Compara Uploads/ com o banco. Retorna um relatório com as contagens e até
+    MAX_REPORTED_ISSUES exemplos por categoria; com repair=True aplica as
+    correções automáticas.
+    """
+    started = time.time()
+    files, dirs = scan_tree(UPLOAD_BASE, workers)
+    storage = get_storage()
+    if not storage.local:
+        # Blobs no armazenamento remoto: a listagem do bucket faz o papel do disco
+        for key, size, mtime in storage.list_objects(BLOB_DIR):
+            files[os.path.normpath(key)] = (size, mtime)
+    issues = _find_issues(files, dirs, grace_seconds)
+
+    report = {
+        'scanned': {'files': len(files), 'dirs': len(dirs), 'seconds': round(time.time() - started, 2)},
+        'counts': {category: len(entries) for category, entries in issues.items() if entries},
+        'issues': {category: entries[:MAX_REPORTED_ISSUES] for category, entries in issues.items() if entries}
+    }
+    if repair and report['counts']:
+        report['repaired'], report['freed_bytes'] = repair_issues(issues, batch_size)
+        logger.info(f"Consistência de Uploads/: {report['counts']} -> corrigidos {report['repaired']}, "
+                    f"{report['freed_bytes']} bytes liberados")
+    return report
@@ -0,0 +1,111 @@
+"""
+Download de versões de documentos.
+
+- ETag forte a partir do SHA-256 do blob (ETag fraca de tamanho/mtime para
+  arquivos ainda no formato antigo), com resposta 304 para If-None-Match.
+- Requisições Range/If-Range (206) tratadas pelo send_file condicional.
+- Modo opcional de offload: o Python apenas autoriza e o servidor à frente
+  entrega o arquivo, configurado por DOCS_DOWNLOAD_OFFLOAD:
+    x-accel     nginx, com X-Accel-Redirect para DOCS_ACCEL_PREFIX + caminho
+                relativo a Uploads/ (location interna apontando para Uploads/)
+    x-sendfile  Apache/lighttpd, com X-Sendfile e o caminho absoluto
+- Armazenamento remoto (STORAGE_BACKEND=s3): redireciona (302) para uma URL
+  pré-assinada de curta duração; o bucket entrega o arquivo e trata Range.
+"""
+
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import request, send_file, make_response, redirect
+
+from utils.doc_storage import UPLOAD_BASE, blob_sha
+from utils.storage import get_storage
+
+OFFLOAD_MODE = os.getenv('DOCS_DOWNLOAD_OFFLOAD', '').lower()
+ACCEL_PREFIX = os.getenv('DOCS_ACCEL_PREFIX', '/protected-uploads/')
+CACHE_MAX_AGE = int(os.getenv('DOCS_CACHE_MAX_AGE', 0))
+
+
+def version_etag(version, abs_path):
+    """(etag, fraca?) da versão: SHA-256 do blob ou tamanho/mtime do arquivo antigo"""
+    sha256 = blob_sha(version.file_path)
+    if sha256:
+        return sha256, False
+    stat = os.stat(abs_path)
+    return f"{stat.st_size:x}-{int(stat.st_mtime):x}", True
+
+
+def _content_disposition(filename):
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+
+def _offload_response(version, abs_path, etag, weak):
+    response = make_response('')
+    response.headers['Content-Type'] = version.file_type or \
+        mimetypes.guess_type(version.file_name)[0] or 'application/octet-stream'
+    response.headers['Content-Disposition'] = _content_disposition(version.file_name)
+    response.set_etag(etag, weak=weak)
+
+    if OFFLOAD_MODE == 'x-accel':
+        relative = os.path.relpath(abs_path, os.path.abspath(UPLOAD_BASE)).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = ACCEL_PREFIX.rstrip('/') + '/' + quote(relative)
+    else:
+        response.headers['X-Sendfile'] = abs_path
+    return response
+
+
+def _presigned_response(version, storage):
+    sha256 = blob_sha(version.file_path)
+    if sha256 and request.if_none_match.contains(sha256):
+        response = make_response('', 304)
+        response.set_etag(sha256)
+    else:
+        url = storage.download_url(
+            version.file_path,
+            _content_disposition(version.file_name),
+            version.file_type or mimetypes.guess_type(version.file_name)[0]
+        )
+        response = redirect(url, 302)
+    # A URL expira: o redirecionamento não pode ser reaproveitado
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
+def send_document_version(version):
+    """Resposta de download da versão (200, 206, 302 ou 304), ou None se o arquivo não existir"""
+    abs_path = os.path.abspath(version.file_path)
+    if not os.path.exists(abs_path):
+        storage = get_storage()
+        if storage.local or not storage.exists(version.file_path):
+            return None
+        return _presigned_response(version, storage)
+
+    etag, weak = version_etag(version, abs_path)
+
+    if OFFLOAD_MODE in ('x-accel', 'x-sendfile'):
+        # O servidor à frente trata Range; o 304 é respondido aqui mesmo
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+            response.set_etag(etag, weak=weak)
+        else:
+            response = _offload_response(version, abs_path, etag, weak)
+    else:
+        # Blobs usam o SHA-256 como ETag; arquivos antigos, a ETag gerada pelo Werkzeug
+        response = send_file(
+            abs_path,
+            mimetype=version.file_type or None,
+            download_name=version.file_name,
+            as_attachment=True,
+            conditional=True,
+            etag=etag if not weak else True,
+            max_age=CACHE_MAX_AGE
+        )
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = f'private, max-age={CACHE_MAX_AGE}'
+    return response
@@ -0,0 +1,239 @@
+"""
+Hierarquia de pastas de documentos via closure table (DocFolderClosure).
+
+Cada pasta tem uma linha (ancestral, descendente, profundidade) para cada
+ancestral, inclusive ela mesma com profundidade 0. Assim subárvore,
+ancestrais (breadcrumbs) e "tem subpastas" são respondidos com uma consulta
+cada, e mover uma subárvore é feito com um DELETE e um INSERT ... SELECT.
+
+A pasta raiz de cada projeto é criada junto com o projeto (provision_project);
+projetos anteriores são preenchidos uma única vez pelo comando
+`flask docs-provision-projects` (provision_projects), nunca na inicialização.
+"""
+
+import os
+
+from sqlalchemy import select, insert, delete, update, func, literal
+from sqlalchemy.orm import aliased
+
+from models.db import db, DocFolder, DocFolderClosure, DocumentVersion, Project, Team
+from utils.doc_storage import get_project_path
+
+
+def add_folder(folder_id, parent_id=None):
+    """Registra uma pasta recém-criada (já com id) na closure table"""
+    db.session.execute(insert(DocFolderClosure).values(
+        ancestor_id=folder_id, descendant_id=folder_id, depth=0
+    ))
+    if parent_id:
+        db.session.execute(insert(DocFolderClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(DocFolderClosure.ancestor_id, literal(folder_id), DocFolderClosure.depth + 1)
+            .where(DocFolderClosure.descendant_id == parent_id)
+        ))
+
+
+def subtree_ids(folder_id):
+    """IDs da pasta e de todas as suas subpastas"""
+    return db.session.scalars(
+        select(DocFolderClosure.descendant_id).where(DocFolderClosure.ancestor_id == folder_id)
+    ).all()
+
+
+def get_subtree(folder_id):
+    """Pastas da subárvore com a profundidade relativa, em ordem de nível"""
+    return db.session.execute(
+        select(DocFolder, DocFolderClosure.depth)
+        .join(DocFolderClosure, DocFolderClosure.descendant_id == DocFolder.id)
+        .where(DocFolderClosure.ancestor_id == folder_id)
+        .order_by(DocFolderClosure.depth, DocFolder.name)
+    ).all()
+
+
+def get_ancestors(folder_id):
+    """Caminho da raiz até a pasta (inclusive), para breadcrumbs"""
+    return db.session.scalars(
+        select(DocFolder)
+        .join(DocFolderClosure, DocFolderClosure.ancestor_id == DocFolder.id)
+        .where(DocFolderClosure.descendant_id == folder_id)
+        .order_by(DocFolderClosure.depth.desc())
+    ).all()
+
+
+def folders_with_children(folder_ids):
+    """Subconjunto de folder_ids que possui subpastas"""
+    if not folder_ids:
+        return set()
+    return set(db.session.scalars(
+        select(DocFolderClosure.ancestor_id).distinct()
+        .where(DocFolderClosure.ancestor_id.in_(list(folder_ids)), DocFolderClosure.depth == 1)
+    ).all())
+
+
+def is_descendant(folder_id, ancestor_id):
+    return db.session.query(DocFolderClosure.depth).filter_by(
+        ancestor_id=ancestor_id, descendant_id=folder_id
+    ).first() is not None
+
+
+def remove_subtree(folder_id):
+    """Remove da closure table as linhas da subárvore (antes de excluir as pastas)"""
+    ids = subtree_ids(folder_id)
+    if ids:
+        db.session.execute(
+            delete(DocFolderClosure)
+            .where(DocFolderClosure.descendant_id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+    return ids
+
+
+def move_subtree(folder_id, new_parent_id):
+    """Religa a subárvore de folder_id sob new_parent_id"""
+    ids = subtree_ids(folder_id)
+
+    # Desliga a subárvore dos ancestrais antigos
+    db.session.execute(
+        delete(DocFolderClosure)
+        .where(DocFolderClosure.descendant_id.in_(ids),
+               DocFolderClosure.ancestor_id.notin_(ids))
+        .execution_options(synchronize_session=False)
+    )
+
+    # Liga cada ancestral do novo pai a cada pasta da subárvore
+    above = aliased(DocFolderClosure)
+    below = aliased(DocFolderClosure)
+    db.session.execute(insert(DocFolderClosure).from_select(
+        ['ancestor_id', 'descendant_id', 'depth'],
+        select(above.ancestor_id, below.descendant_id, above.depth + below.depth + 1)
+        .select_from(above)
+        .join(below, below.ancestor_id == folder_id)
+        .where(above.descendant_id == new_parent_id)
+    ))
+    db.session.execute(
+        update(DocFolder).where(DocFolder.id == folder_id).values(parent_id=new_parent_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rewrite_paths(folder_id, old_path, new_path):
+    """
+    Atualiza o caminho físico da pasta, das subpastas e dos arquivos de versões
+    no formato antigo com um UPDATE por tabela (troca do prefixo old_path).
+    """
+    if old_path == new_path:
+        return
+
+    prefix_length = len(old_path)
+    db.session.execute(
+        update(DocFolder)
+        .where(DocFolder.id.in_(select(DocFolderClosure.descendant_id)
+                                .where(DocFolderClosure.ancestor_id == folder_id)
+                                .scalar_subquery()))
+        .values(path=literal(new_path) + func.substr(DocFolder.path, prefix_length + 1))
+        .execution_options(synchronize_session=False)
+    )
+
+    old_prefix = old_path + os.sep
+    db.session.execute(
+        update(DocumentVersion)
+        .where(func.substr(DocumentVersion.file_path, 1, len(old_prefix)) == old_prefix)
+        .values(file_path=literal(new_path) + func.substr(DocumentVersion.file_path, prefix_length + 1))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_closure():
+    """Reconstrói a closure table a partir de DocFolder.parent_id (um INSERT por nível)"""
+    db.session.execute(delete(DocFolderClosure))
+    db.session.execute(insert(DocFolderClosure).from_select(
+        ['ancestor_id', 'descendant_id', 'depth'],
+        select(DocFolder.id, DocFolder.id, literal(0))
+    ))
+
+    depth = 1
+    while True:
+        result = db.session.execute(insert(DocFolderClosure).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(DocFolderClosure.ancestor_id, DocFolder.id, literal(depth))
+            .select_from(DocFolder)
+            .join(DocFolderClosure, DocFolderClosure.descendant_id == DocFolder.parent_id)
+            .where(DocFolderClosure.depth == depth - 1)
+        ))
+        if not result.rowcount:
+            break
+        depth += 1
+    return depth
+
+
+def ensure_closure():
+    """Popula a closure table na primeira execução com pastas já existentes"""
+    has_closure = db.session.query(DocFolderClosure.ancestor_id).first() is not None
+    has_folders = db.session.query(DocFolder.id).first() is not None
+    if has_folders and not has_closure:
+        rebuild_closure()
+        db.session.commit()
+
+
+def _default_owner():
+    """Responsável pelas pastas raiz criadas sem usuário na sessão: o primeiro administrador"""
+    return db.session.scalar(select(Team.id).order_by(Team.is_admin.desc(), Team.id).limit(1))
+
+
+def _lock_project(project_id):
+    """
+    Trava a linha do projeto até o fim da transação. Um UPDATE sem efeito
+    trava a linha no MySQL/PostgreSQL e obtém a trava de escrita no SQLite,
+    onde SELECT ... FOR UPDATE não existe.
+    """
+    db.session.execute(
+        update(Project).where(Project.id == project_id).values(name=Project.name)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def provision_project(project_id, created_by=None):
+    """
+    Cria a pasta raiz e o diretório do projeto, se ainda não existirem.
+    Participa da transação atual; retorna a pasta raiz (None sem usuários).
+
+    Não há restrição única para "uma raiz por projeto" (parent_id nulo), então
+    a verificação é feita com o projeto travado: processos simultâneos
+    esperam a transação um do outro e não criam raízes duplicadas.
+    """
+    _lock_project(project_id)
+    root = DocFolder.query.filter_by(project_id=project_id, parent_id=None).first()
+    if root is None:
+        created_by = created_by or _default_owner()
+        if created_by is None:
+            return None
+        root = DocFolder(
+            name=f"Projeto {project_id}",
+            project_id=project_id,
+            parent_id=None,
+            created_by=created_by,
+            path=get_project_path(project_id)
+        )
+        db.session.add(root)
+        db.session.flush()
+        add_folder(root.id)
+    os.makedirs(root.path, exist_ok=True)
+    return root
+
+
+def projects_without_root():
+    return db.session.scalars(
+        select(Project.id).where(~select(DocFolder.id).where(
+            DocFolder.project_id == Project.id, DocFolder.parent_id.is_(None)
+        ).exists()).order_by(Project.id)
+    ).all()
+
+
+def provision_projects(created_by=None):
+    """Cria a pasta raiz dos projetos que ainda não têm; retorna os ids provisionados"""
+    provisioned = []
+    for project_id in projects_without_root():
+        if provision_project(project_id, created_by) is not None:
+            provisioned.append(project_id)
+    db.session.commit()
+    return provisioned
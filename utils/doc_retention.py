@@ -0,0 +1,187 @@
+"""
+Retenção de versões de documentos e compactação do armazenamento.
+
+Cada projeto pode ter uma DocRetentionPolicy. A compactação seleciona as
+versões que nenhuma regra mantém (ROW_NUMBER por documento, no banco) e as
+remove em lotes: cada lote libera os blobs, atualiza os contadores de uso e
+apaga as linhas em uma transação; os arquivos só são apagados após o commit.
+A versão mais recente de um documento nunca é removida.
+
+Execução agendada: `flask docs-compact` (ex.: diariamente via cron), ou sob
+demanda pela API, que roda a tarefa em segundo plano (utils/jobs.py).
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete, func, and_, or_, true
+
+from models.db import (db, Document, DocumentVersion, DocumentText, DocumentBlob, DocRetentionPolicy,
+                       DocCompactionRun)
+from utils.doc_storage import release_blobs, remove_blobs, remove_files, blob_sha
+from utils.doc_usage import record_usage
+from utils.logger import setup_logger
+
+logger = setup_logger('doc_retention')
+
+COMPACTION_BATCH_SIZE = 500
+
+
+def _ranked_versions(project_id):
+    """Versões do projeto com a posição (1 = mais recente) e o primeiro número de versão"""
+    return select(
+        DocumentVersion.id,
+        DocumentVersion.version_number,
+        DocumentVersion.file_path,
+        DocumentVersion.file_size,
+        DocumentVersion.created_at,
+        Document.folder_id,
+        func.row_number().over(
+            partition_by=DocumentVersion.document_id,
+            order_by=DocumentVersion.version_number.desc()
+        ).label('position'),
+        func.min(DocumentVersion.version_number).over(
+            partition_by=DocumentVersion.document_id
+        ).label('first_number')
+    ).join(Document, Document.id == DocumentVersion.document_id)\
+     .where(Document.project_id == project_id).subquery()
+
+
+def expired_versions(policy):
+    """Consulta das versões que a política permite remover"""
+    ranked = _ranked_versions(policy.project_id)
+    if policy.keep_last is None and policy.keep_days is None:
+        return select(ranked).where(~true())
+
+    conditions = [ranked.c.position > 1]
+    if policy.keep_last is not None:
+        conditions.append(ranked.c.position > policy.keep_last)
+    if policy.keep_days is not None:
+        conditions.append(ranked.c.created_at < datetime.utcnow() - timedelta(days=policy.keep_days))
+    if policy.keep_first:
+        conditions.append(ranked.c.version_number != ranked.c.first_number)
+    return select(ranked).where(and_(*conditions))
+
+
+def estimate_compaction(policy):
+    """(versões, bytes lógicos, bytes recuperáveis) sem remover nada"""
+    expired = expired_versions(policy).subquery()
+    versions, logical = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(expired.c.file_size), 0))
+    ).one()
+
+    # Um blob só é liberado se todas as suas referências estiverem entre as removidas
+    per_path = db.session.execute(
+        select(expired.c.file_path, func.count(), func.max(expired.c.file_size))
+        .group_by(expired.c.file_path)
+    ).all()
+    reclaimable = 0
+    blob_refs = {}
+    for file_path, count, size in per_path:
+        sha256 = blob_sha(file_path)
+        if sha256:
+            blob_refs[sha256] = (count, size)
+        else:
+            reclaimable += size
+    if blob_refs:
+        for sha256, ref_count in db.session.execute(
+            select(DocumentBlob.sha256, DocumentBlob.ref_count).where(DocumentBlob.sha256.in_(list(blob_refs)))
+        ):
+            count, size = blob_refs[sha256]
+            if ref_count <= count:
+                reclaimable += size
+    return versions, int(logical), reclaimable
+
+
+def _delete_batch(project_id, rows):
+    """Remove um lote de versões; retorna (bytes lógicos, bytes liberados no disco)"""
+    ids = [row.id for row in rows]
+    orphan_blobs = release_blobs([row.file_path for row in rows])
+    legacy_files = [row.file_path for row in rows if not blob_sha(row.file_path)]
+
+    by_folder = defaultdict(lambda: [0, 0])
+    for row in rows:
+        by_folder[row.folder_id][0] += row.file_size
+        by_folder[row.folder_id][1] += 1
+    for folder_id, (size, count) in by_folder.items():
+        record_usage(project_id, folder_id, -size, 0, -count)
+
+    db.session.execute(delete(DocumentText).where(DocumentText.version_id.in_(ids))
+                       .execution_options(synchronize_session=False))
+    db.session.execute(delete(DocumentVersion).where(DocumentVersion.id.in_(ids))
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+
+    # Arquivos apagados somente após o commit (remove_blobs também apaga as miniaturas)
+    reclaimed = remove_blobs(orphan_blobs) + remove_files(legacy_files)
+    return sum(row.file_size for row in rows), reclaimed
+
+
+def compact_project(project_id, dry_run=False, batch_size=COMPACTION_BATCH_SIZE, run=None):
+    """
+    Aplica a política de retenção do projeto. Retorna o DocCompactionRun com
+    as versões removidas e os bytes recuperados (estimados se dry_run).
+    """
+    if run is None:
+        run = DocCompactionRun(project_id=project_id, dry_run=dry_run)
+        db.session.add(run)
+    run.status = 'running'
+    run.started_at = datetime.utcnow()
+    db.session.commit()
+    run_id = run.id
+
+    try:
+        policy = db.session.get(DocRetentionPolicy, project_id)
+        if policy is None:
+            versions, logical, reclaimed = 0, 0, 0
+        elif dry_run:
+            versions, logical, reclaimed = estimate_compaction(policy)
+        else:
+            versions, logical, reclaimed = 0, 0, 0
+            while True:
+                rows = db.session.execute(
+                    expired_versions(policy).order_by('id').limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                batch_logical, batch_reclaimed = _delete_batch(project_id, rows)
+                versions += len(rows)
+                logical += batch_logical
+                reclaimed += batch_reclaimed
+                policy = db.session.get(DocRetentionPolicy, project_id)
+                if policy is None:
+                    break
+
+        run = db.session.get(DocCompactionRun, run_id)
+        run.versions_deleted = versions
+        run.logical_bytes = logical
+        run.reclaimed_bytes = reclaimed
+        run.status = 'completed'
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info(f"Compactação do projeto {project_id}{' (simulação)' if dry_run else ''}: "
+                    f"{versions} versões, {logical} bytes lógicos, {reclaimed} bytes recuperados")
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Falha na compactação do projeto {project_id}")
+        run = db.session.get(DocCompactionRun, run_id)
+        run.status = 'failed'
+        run.error_message = str(e)
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+    return run
+
+
+def run_compaction_job(run_id):
+    """Tarefa em segundo plano (submit_job) para uma execução já registrada"""
+    run = db.session.get(DocCompactionRun, run_id)
+    if run is not None:
+        compact_project(run.project_id, dry_run=run.dry_run, run=run)
+
+
+def projects_with_policy():
+    return db.session.scalars(
+        select(DocRetentionPolicy.project_id).where(
+            or_(DocRetentionPolicy.keep_last.isnot(None), DocRetentionPolicy.keep_days.isnot(None))
+        )
+    ).all()
@@ -0,0 +1,238 @@
+"""
+Armazenamento físico dos arquivos do gerenciador de documentos.
+
+Concentra os caminhos usados pelas rotas de documentos (routes/docs.py e
+routes/doc_uploads.py): a base Uploads/, a área de staging dos envios em
+partes e o repositório de blobs endereçado por conteúdo.
+
+Cada versão aponta (DocumentVersion.file_path) para um blob em
+Uploads/Blobs/<aa>/<bb>/<sha256>. Conteúdos idênticos são gravados uma única
+vez e a tabela DocumentBlob conta as referências; o arquivo só é removido
+quando a contagem chega a zero. Os blobs são gravados e apagados pelo driver
+de utils/storage.py (disco local ou S3); o staging é sempre local.
+
+A linha de DocumentBlob funciona como trava do arquivo entre processos:
+
+- store_blob registra (ou incrementa) a linha antes de conferir e gravar o
+  arquivo, dentro da transação de quem envia;
+- release_blobs apenas decrementa as contagens; a linha fica com zero;
+- remove_blobs apaga, em uma transação por blob, a linha com a condição
+  ref_count <= 0, apaga o arquivo e só então confirma. Um envio simultâneo
+  do mesmo conteúdo ou já incrementou a linha (e a remoção não acontece),
+  ou espera a trava da linha e, ao não encontrá-la, grava o arquivo de novo.
+
+store_blob coloca o arquivo no lugar antes do commit; se a transação for
+desfeita, o arquivo fica sem registro e é removido pela verificação de
+consistência (flask docs-consistency-scan --repair, utils/doc_consistency.py).
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from collections import Counter
+
+from sqlalchemy import update, delete, select, inspect, text, BigInteger
+from sqlalchemy.exc import IntegrityError
+
+from utils.logger import setup_logger
+from utils.storage import get_storage
+
+logger = setup_logger('doc_storage')
+
+UPLOAD_BASE = 'Uploads'
+STAGING_DIR = os.path.join(UPLOAD_BASE, '.staging')
+BLOB_DIR = os.path.join(UPLOAD_BASE, 'Blobs')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def get_project_path(project_id):
+    return os.path.join(UPLOAD_BASE, 'Projects', str(project_id))
+
+
+def staging_path(upload_id):
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    return os.path.join(STAGING_DIR, f"{upload_id}.part")
+
+
+def file_sha256(path, limit=None, hasher=None):
+    """SHA-256 de um arquivo (ou dos primeiros `limit` bytes), lido em blocos"""
+    hasher = hasher or hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            size = HASH_CHUNK_SIZE if remaining is None else min(HASH_CHUNK_SIZE, remaining)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return hasher
+
+
+def blob_path(sha256):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def blob_sha(file_path):
+    """SHA-256 de um caminho de blob, ou None se for um arquivo no formato antigo"""
+    if not file_path:
+        return None
+    name = os.path.basename(file_path)
+    if _SHA256_RE.match(name) and os.path.normpath(file_path) == os.path.normpath(blob_path(name)):
+        return name
+    return None
+
+
+def save_to_staging(stream):
+    """Grava um stream (ex.: FileStorage.stream) no staging calculando o SHA-256"""
+    path = staging_path(f"upload_{uuid.uuid4()}")
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            hasher.update(chunk)
+            size += len(chunk)
+    return path, hasher.hexdigest(), size
+
+
+def ensure_size_columns():
+    """
+    Amplia document_version.file_size para BIGINT em bancos criados quando a
+    coluna era INTEGER (create_all não altera tabelas existentes). No SQLite
+    INTEGER já tem 64 bits. Idempotente.
+    """
+    from models.db import db
+
+    dialect = db.engine.dialect.name
+    if dialect not in ('mysql', 'postgresql'):
+        return
+    columns = {c['name']: c['type'] for c in inspect(db.engine).get_columns('document_version')}
+    if isinstance(columns.get('file_size'), BigInteger):
+        return
+    if dialect == 'mysql':
+        db.session.execute(text("ALTER TABLE document_version MODIFY file_size BIGINT NOT NULL"))
+    else:
+        db.session.execute(text("ALTER TABLE document_version ALTER COLUMN file_size TYPE BIGINT"))
+    db.session.commit()
+
+
+def _increment_blob(sha256, amount=1):
+    from models.db import db, DocumentBlob
+    result = db.session.execute(
+        update(DocumentBlob)
+        .where(DocumentBlob.sha256 == sha256)
+        .values(ref_count=DocumentBlob.ref_count + amount)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def store_blob(src_path, sha256, size):
+    """
+    Incorpora um arquivo já gravado (staging) ao repositório de blobs e
+    retorna o caminho do blob. Se o conteúdo já existe, apenas incrementa a
+    contagem de referências e descarta a cópia. Participa da transação atual;
+    o arquivo é gravado antes do commit (ver o cabeçalho do módulo).
+    """
+    from models.db import db, DocumentBlob
+
+    path = blob_path(sha256)
+    storage = get_storage()
+
+    # Registra a referência antes de olhar o arquivo: com a linha travada
+    # nesta transação, remove_blobs não apaga o arquivo em paralelo
+    if not _increment_blob(sha256):
+        try:
+            with db.session.begin_nested():
+                db.session.add(DocumentBlob(sha256=sha256, size=size, ref_count=1))
+        except IntegrityError:
+            # Outro envio registrou o mesmo conteúdo ao mesmo tempo
+            _increment_blob(sha256)
+
+    if storage.exists(path):
+        os.remove(src_path)
+    else:
+        # Conteúdo novo, ou blob registrado mas sem arquivo: grava o recebido
+        storage.put_file(path, src_path)
+    return path
+
+
+def release_blobs(file_paths):
+    """
+    Decrementa as referências dos blobs usados pelos caminhos informados.
+    Retorna os blobs que ficaram sem referências; eles são apagados após o
+    commit por remove_blobs, que confere a contagem novamente.
+    """
+    from models.db import db, DocumentBlob
+
+    counts = Counter(sha for sha in map(blob_sha, file_paths) if sha)
+    if not counts:
+        return []
+
+    for sha256, amount in counts.items():
+        _increment_blob(sha256, -amount)
+
+    unused = db.session.scalars(
+        select(DocumentBlob.sha256).where(
+            DocumentBlob.sha256.in_(list(counts)),
+            DocumentBlob.ref_count <= 0
+        )
+    ).all()
+    return [blob_path(sha256) for sha256 in unused]
+
+
+def remove_blobs(paths):
+    """
+    Apaga os blobs que continuam sem referências (e suas miniaturas); retorna
+    os bytes liberados. Deve ser chamado fora de outra transação, após o
+    commit que liberou as referências: confirma uma transação por blob.
+    """
+    from models.db import db, DocumentBlob
+    from utils.thumbnails import remove_derivatives
+
+    storage = get_storage()
+    freed = 0
+    for path in paths:
+        sha256 = blob_sha(path)
+        if not sha256:
+            continue
+        try:
+            removed = db.session.execute(
+                delete(DocumentBlob)
+                .where(DocumentBlob.sha256 == sha256, DocumentBlob.ref_count <= 0)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if removed:
+                # Apagado antes do commit, com a linha ainda travada
+                freed += storage.delete(path)
+            db.session.commit()
+        except Exception as e:
+            # A linha continua com zero referências e é removida na próxima verificação
+            db.session.rollback()
+            logger.warning(f"Não foi possível remover o blob {sha256}: {e}")
+            continue
+        if removed:
+            freed += remove_derivatives(sha256)
+    return freed
+
+
+def remove_files(paths):
+    """Apaga arquivos locais (staging e formato antigo); retorna os bytes liberados"""
+    freed = 0
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+                os.remove(path)
+                freed += size
+        except OSError:
+            pass
+    return freed
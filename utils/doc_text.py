@@ -0,0 +1,401 @@
+"""
+Extração do texto de versões de documentos para a busca de conteúdo.
+
+Após o envio, cada versão é agendada em um pool de threads (TEXT_WORKERS)
+que aciona um pool de processos do mesmo tamanho, onde PDF (PyMuPDF), DOCX
+(XML do pacote, sem dependências), XLSX (openpyxl) e texto puro são lidos.
+Cada arquivo tem tempo máximo (TEXT_EXTRACT_TIMEOUT): se estourar, o pool
+de processos é recriado, matando a extração travada. Arquivos acima de
+TEXT_MAX_SOURCE_MB são ignorados e o texto é limitado a TEXT_MAX_CHARS.
+
+O texto fica em DocumentText (uma linha por versão) e é indexado conforme o
+banco: FTS5 com gatilhos no SQLite, índice FULLTEXT no MariaDB/MySQL e LIKE
+nos demais.
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.etree.ElementTree import iterparse
+
+from flask import current_app
+from sqlalchemy import select, update, or_, and_, case, func, text, inspect
+
+from utils.jobs import in_app_context
+from utils.logger import setup_logger
+from utils.storage import local_file
+
+logger = setup_logger('doc_text')
+
+PLAIN_EXTENSIONS = {'.txt', '.md', '.markdown', '.csv', '.log'}
+EXTRACTORS_BY_EXTENSION = {'.pdf': 'pdf', '.docx': 'docx', '.xlsx': 'xlsx', '.xlsm': 'xlsx'}
+
+WORKERS = int(os.getenv('TEXT_WORKERS', 2))
+EXTRACT_TIMEOUT = int(os.getenv('TEXT_EXTRACT_TIMEOUT', 60))
+MAX_SOURCE_SIZE = int(os.getenv('TEXT_MAX_SOURCE_MB', 50)) * 1024 * 1024
+MAX_TEXT_CHARS = int(os.getenv('TEXT_MAX_CHARS', 1_000_000))
+# Limite do XML descompactado de um DOCX (proteção contra "zip bombs")
+MAX_DOCX_XML_SIZE = 200 * 1024 * 1024
+
+FTS_TABLE = 'document_text_fts'
+SNIPPET_LENGTH = 240
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_pool = None
+_pool_generation = 0
+_pool_lock = threading.Lock()
+_dispatch = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='deeply-text')
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def text_kind(filename):
+    """Extrator usado para o arquivo ('plain', 'pdf', 'docx', 'xlsx') ou None"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in PLAIN_EXTENSIONS:
+        return 'plain'
+    return EXTRACTORS_BY_EXTENSION.get(ext)
+
+
+# ---------------------------------------------------------------------------
+# Extratores (executados nos processos do pool, sem acesso ao banco)
+# ---------------------------------------------------------------------------
+
+class _TextBuffer:
+    """Acumula trechos de texto até o limite de caracteres"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+        self.truncated = False
+
+    def add(self, value):
+        """Acrescenta um trecho; retorna False quando o limite foi atingido"""
+        if self.truncated:
+            return False
+        if self.size + len(value) > self.limit:
+            value = value[:self.limit - self.size]
+            self.truncated = True
+        self.parts.append(value)
+        self.size += len(value)
+        return not self.truncated
+
+    def result(self):
+        content = ''.join(self.parts).replace('\x00', '')
+        content = re.sub(r'\n{3,}', '\n\n', content)
+        return content.strip(), self.truncated
+
+
+def _extract_plain(path, buffer):
+    with open(path, 'rb') as f:
+        raw = f.read(buffer.limit * 4 + 1)
+    for encoding in ('utf-8-sig', 'cp1252'):
+        try:
+            buffer.add(raw.decode(encoding))
+            return
+        except UnicodeDecodeError:
+            continue
+    buffer.add(raw.decode('latin-1'))
+
+
+def _extract_pdf(path, buffer):
+    try:
+        import pymupdf as fitz
+    except ImportError:
+        import fitz  # PyMuPDF < 1.24
+    with fitz.open(path) as pdf:
+        for page in pdf:
+            if not buffer.add(page.get_text() + '\n'):
+                break
+
+
+def _extract_docx(path, buffer):
+    with zipfile.ZipFile(path) as package:
+        info = package.getinfo('word/document.xml')
+        if info.file_size > MAX_DOCX_XML_SIZE:
+            raise ValueError('Conteúdo do DOCX grande demais')
+        with package.open(info) as xml:
+            for _, element in iterparse(xml, events=('end',)):
+                tag = element.tag
+                if tag == _WORD_NS + 't':
+                    ok = buffer.add(element.text or '')
+                elif tag == _WORD_NS + 'tab':
+                    ok = buffer.add('\t')
+                elif tag in (_WORD_NS + 'br', _WORD_NS + 'p'):
+                    ok = buffer.add('\n')
+                else:
+                    continue
+                if tag == _WORD_NS + 'p':
+                    element.clear()
+                if not ok:
+                    break
+
+
+def _extract_xlsx(path, buffer):
+    from openpyxl import load_workbook
+    # Arquivo aberto aqui: blobs não têm extensão, que o openpyxl exige em caminhos
+    with open(path, 'rb') as f:
+        workbook = load_workbook(f, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                if not buffer.add(f"{sheet.title}\n"):
+                    return
+                for row in sheet.iter_rows(values_only=True):
+                    values = [str(value) for value in row if value is not None and value != '']
+                    if values and not buffer.add('\t'.join(values) + '\n'):
+                        return
+        finally:
+            workbook.close()
+
+
+_EXTRACTORS = {
+    'plain': _extract_plain,
+    'pdf': _extract_pdf,
+    'docx': _extract_docx,
+    'xlsx': _extract_xlsx
+}
+
+
+def extract_text(path, kind, limit=MAX_TEXT_CHARS):
+    """(texto, truncado?) do arquivo"""
+    buffer = _TextBuffer(limit)
+    _EXTRACTORS[kind](path, buffer)
+    return buffer.result()
+
+
+# ---------------------------------------------------------------------------
+# Pool de processos com tempo máximo por arquivo
+# ---------------------------------------------------------------------------
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: processos limpos, sem herdar threads e conexões do servidor
+            _pool = multiprocessing.get_context('spawn').Pool(processes=WORKERS, maxtasksperchild=200)
+        return _pool, _pool_generation
+
+
+def _terminate_pool(generation):
+    """Mata o pool se ainda for o da geração informada (outra thread pode já tê-lo trocado)"""
+    global _pool, _pool_generation
+    with _pool_lock:
+        if _pool_generation != generation or _pool is None:
+            return False
+        pool, _pool = _pool, None
+        _pool_generation += 1
+    pool.terminate()
+    return True
+
+
+def run_extraction(path, kind):
+    """
+    Extrai o texto em um processo do pool. Como cada thread de _dispatch tem
+    no máximo uma tarefa no pool, o tempo de espera é o da própria extração.
+    """
+    for _ in range(2):
+        pool, generation = _get_pool()
+        result = pool.apply_async(extract_text, (os.path.abspath(path), kind))
+        try:
+            return result.get(timeout=EXTRACT_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            if _terminate_pool(generation):
+                raise ExtractionTimeout(f"Extração excedeu {EXTRACT_TIMEOUT}s")
+            # O pool foi recriado por causa de outra extração: tenta de novo
+    raise ExtractionTimeout(f"Extração excedeu {EXTRACT_TIMEOUT}s")
+
+
+# ---------------------------------------------------------------------------
+# Tarefas (app context) e agendamento
+# ---------------------------------------------------------------------------
+
+def extract_version_text(version_id):
+    """Extrai e grava o texto de uma versão (roda em segundo plano)"""
+    from models.db import db, DocumentVersion, DocumentText
+
+    version = db.session.get(DocumentVersion, version_id)
+    if version is None:
+        return None
+
+    record = version.text
+    if record is None:
+        record = DocumentText(version_id=version.id)
+        db.session.add(record)
+    record.status = 'pending'
+    record.error_message = None
+    kind = text_kind(version.file_name)
+    file_path, file_size = version.file_path, version.file_size
+
+    # Mesmo blob já extraído em outra versão: reaproveita o texto
+    existing = None
+    if kind:
+        existing = db.session.execute(
+            select(DocumentText.content, DocumentText.truncated)
+            .join(DocumentVersion, DocumentVersion.id == DocumentText.version_id)
+            .where(DocumentVersion.file_path == file_path,
+                   DocumentVersion.id != version.id,
+                   DocumentText.status == 'done')
+            .limit(1)
+        ).first()
+    db.session.commit()  # Libera a conexão durante a extração
+
+    content, truncated, status, error = None, False, 'done', None
+    if kind is None:
+        status, error = 'skipped', 'Tipo de arquivo não suportado'
+    elif existing is not None:
+        content, truncated = existing
+    elif file_size > MAX_SOURCE_SIZE:
+        status, error = 'skipped', 'Arquivo maior que o limite para extração'
+    else:
+        try:
+            with local_file(file_path) as path:
+                content, truncated = run_extraction(path, kind)
+        except FileNotFoundError:
+            status, error = 'failed', 'Arquivo não encontrado'
+        except ExtractionTimeout as e:
+            status, error = 'failed', str(e)
+        except Exception as e:
+            status, error = 'failed', f"{type(e).__name__}: {e}"[:255]
+
+    # UPDATE condicional: a versão pode ter sido excluída durante a extração
+    result = db.session.execute(
+        update(DocumentText)
+        .where(DocumentText.version_id == version_id)
+        .values(status=status, content=content, char_count=len(content or ''), truncated=truncated,
+                error_message=error, extracted_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return status if result.rowcount else None
+
+
+def submit_extraction(app, version_id):
+    return _dispatch.submit(in_app_context(app, extract_version_text, version_id))
+
+
+def schedule_text_extraction(*versions):
+    """Agenda a extração do texto de versões recém-gravadas (chamar após o commit)"""
+    try:
+        app = current_app._get_current_object()
+        for version in versions:
+            submit_extraction(app, version.id)
+    except Exception as e:
+        # A indexação nunca deve derrubar o envio
+        logger.warning(f"Não foi possível agendar a extração de texto: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Índice e busca
+# ---------------------------------------------------------------------------
+
+def ensure_text_index():
+    """Cria o índice de texto completo conforme o banco (idempotente)"""
+    from models.db import db
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first()
+        if exists:
+            return
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"content, content='document_text', content_rowid='version_id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        ))
+        # Gatilhos mantêm o índice sincronizado com document_text
+        db.session.execute(text(
+            f"CREATE TRIGGER document_text_ai AFTER INSERT ON document_text BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.version_id, new.content); END"
+        ))
+        db.session.execute(text(
+            f"CREATE TRIGGER document_text_ad AFTER DELETE ON document_text BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) "
+            f"VALUES ('delete', old.version_id, old.content); END"
+        ))
+        db.session.execute(text(
+            f"CREATE TRIGGER document_text_au AFTER UPDATE OF content ON document_text BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) "
+            f"VALUES ('delete', old.version_id, old.content); "
+            f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.version_id, new.content); END"
+        ))
+        db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        db.session.commit()
+    elif dialect == 'mysql':
+        indexes = inspect(db.engine).get_indexes('document_text')
+        if not any(index['name'] == 'ft_document_text_content' for index in indexes):
+            db.session.execute(text(
+                "ALTER TABLE document_text ADD FULLTEXT INDEX ft_document_text_content (content)"
+            ))
+            db.session.commit()
+
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())[:10]
+
+
+def _content_condition(terms):
+    """Condição de busca em DocumentText.content para o banco em uso"""
+    from models.db import db, DocumentText
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        return DocumentText.version_id.in_(
+            text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match")
+            .bindparams(match=match)
+            .columns(rowid=db.Integer)
+        )
+    if dialect == 'mysql':
+        match = ' '.join(f'+{term}' for term in terms) + '*'
+        return text("MATCH (document_text.content) AGAINST (:match IN BOOLEAN MODE)").bindparams(match=match)
+    return and_(*[func.lower(DocumentText.content).contains(term, autoescape=True) for term in terms])
+
+
+def search_project_documents(project_id, query, limit=50):
+    """
+    Documentos do projeto cujo conteúdo (qualquer versão) ou nome casa com a
+    busca. Retorna (documento, versão que casou ou None, trecho) por documento.
+    """
+    from models.db import db, Document, DocumentVersion, DocumentText
+
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    name_condition = and_(*[func.lower(Document.name).contains(term, autoescape=True) for term in terms])
+    content_condition = and_(DocumentText.status == 'done', _content_condition(terms))
+
+    # Trecho em torno da primeira ocorrência do primeiro termo
+    position = func.instr(func.lower(DocumentText.content), terms[0]) \
+        if db.engine.dialect.name != 'postgresql' else func.strpos(func.lower(DocumentText.content), terms[0])
+    start = case((position > SNIPPET_LENGTH // 3, position - SNIPPET_LENGTH // 3), else_=1)
+    snippet = case((content_condition, func.substr(DocumentText.content, start, SNIPPET_LENGTH)), else_=None)
+
+    rows = db.session.execute(
+        select(Document, DocumentVersion, snippet.label('snippet'))
+        .join(DocumentVersion, DocumentVersion.document_id == Document.id)
+        .outerjoin(DocumentText, DocumentText.version_id == DocumentVersion.id)
+        .where(Document.project_id == project_id, or_(content_condition, name_condition))
+        .order_by(Document.updated_at.desc(), Document.id, DocumentVersion.version_number.desc())
+        .limit(limit * 5)
+    ).all()
+
+    results = {}
+    for document, version, excerpt in rows:
+        current = results.get(document.id)
+        if current is None:
+            results[document.id] = [document, version if excerpt else None, excerpt]
+        elif current[2] is None and excerpt:
+            current[1], current[2] = version, excerpt
+    return [tuple(result) for result in results.values()][:limit]
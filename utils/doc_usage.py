@@ -0,0 +1,271 @@
+"""
+Contadores de uso de armazenamento dos documentos, por projeto e por pasta.
+
+As rotas de envio, nova versão, exclusão e movimentação aplicam deltas aos
+contadores na mesma transação da alteração (record_usage), de modo que a
+consulta de uso e a verificação de cota no envio leem uma única linha.
+Pastas acumulam a subárvore inteira: o delta é aplicado à pasta e a todos
+os ancestrais, obtidos da closure table.
+
+reconcile_usage recalcula os totais a partir do banco, confere em paralelo
+os arquivos das versões no disco e, com fix=True, regrava os contadores.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, insert, func
+from sqlalchemy.exc import IntegrityError
+
+from models.db import (db, Document, DocumentVersion, DocFolderClosure, DocFolder, Project,
+                       ProjectStorage, FolderStorage)
+from utils.storage import file_size
+
+DEFAULT_QUOTA_BYTES = int(os.getenv('DOCS_PROJECT_QUOTA_MB', 0)) * 1024 * 1024
+RECONCILE_BATCH_SIZE = 2000
+MAX_REPORTED_ISSUES = 100
+
+
+def _bump(model, key, ids, size, files, versions):
+    """Soma os deltas às linhas de ids, criando as que ainda não existem"""
+    ids = list(ids)
+    if not ids or not (size or files or versions):
+        return
+
+    result = db.session.execute(
+        update(model).where(key.in_(ids))
+        .values(bytes=model.bytes + size, files=model.files + files,
+                versions=model.versions + versions, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == len(ids):
+        return
+
+    existing = set(db.session.scalars(select(key).where(key.in_(ids))).all())
+    for missing in (i for i in ids if i not in existing):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model).values(**{
+                    key.key: missing, 'bytes': size, 'files': files, 'versions': versions,
+                    'updated_at': datetime.utcnow()
+                }))
+        except IntegrityError:
+            # Criada por outra requisição ao mesmo tempo
+            _bump(model, key, [missing], size, files, versions)
+
+
+def record_usage(project_id=None, folder_id=None, size=0, files=0, versions=0):
+    """Aplica deltas ao projeto e à pasta (com seus ancestrais). Participa da transação atual."""
+    if folder_id:
+        ancestors = db.session.scalars(
+            select(DocFolderClosure.ancestor_id).where(DocFolderClosure.descendant_id == folder_id)
+        ).all()
+        _bump(FolderStorage, FolderStorage.folder_id, ancestors, size, files, versions)
+    if project_id:
+        _bump(ProjectStorage, ProjectStorage.project_id, [project_id], size, files, versions)
+
+
+def subtree_totals(folder_id):
+    """(bytes, documentos, versões) da pasta e subpastas, calculados a partir das versões"""
+    size, files, versions = db.session.execute(
+        select(func.coalesce(func.sum(DocumentVersion.file_size), 0),
+               func.count(func.distinct(Document.id)),
+               func.count(DocumentVersion.id))
+        .select_from(Document)
+        .join(DocumentVersion, DocumentVersion.document_id == Document.id)
+        .where(Document.folder_id.in_(
+            select(DocFolderClosure.descendant_id).where(DocFolderClosure.ancestor_id == folder_id)
+        ))
+    ).one()
+    return int(size), files, versions
+
+
+def forget_folders(folder_ids):
+    """Remove os contadores de pastas excluídas"""
+    if folder_ids:
+        db.session.execute(
+            delete(FolderStorage).where(FolderStorage.folder_id.in_(list(folder_ids)))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def usage_dict(row):
+    if row is None:
+        return {'bytes': 0, 'files': 0, 'versions': 0}
+    return {'bytes': row.bytes, 'files': row.files, 'versions': row.versions}
+
+
+def project_quota(row):
+    if row is not None and row.quota_bytes is not None:
+        return row.quota_bytes
+    return DEFAULT_QUOTA_BYTES
+
+
+def project_usage(project_id):
+    row = db.session.get(ProjectStorage, project_id)
+    data = usage_dict(row)
+    quota = project_quota(row)
+    data['quota_bytes'] = quota or None
+    data['available_bytes'] = max(quota - data['bytes'], 0) if quota else None
+    return data
+
+
+def quota_error(project_id, incoming_bytes):
+    """Mensagem de erro se o envio ultrapassar a cota do projeto (leitura de uma linha)"""
+    row = db.session.get(ProjectStorage, project_id)
+    quota = project_quota(row)
+    used = row.bytes if row else 0
+    if quota and used + incoming_bytes > quota:
+        return (f"Cota de armazenamento do projeto excedida: "
+                f"{used} de {quota} bytes usados, envio de {incoming_bytes} bytes")
+    return None
+
+
+def expected_usage():
+    """Totais por projeto e por pasta (subárvore) calculados a partir das versões"""
+    projects = {
+        project_id: (int(size), files, versions)
+        for project_id, size, files, versions in db.session.execute(
+            select(Document.project_id,
+                   func.coalesce(func.sum(DocumentVersion.file_size), 0),
+                   func.count(func.distinct(Document.id)),
+                   func.count(DocumentVersion.id))
+            .join(DocumentVersion, DocumentVersion.document_id == Document.id)
+            .group_by(Document.project_id)
+        )
+    }
+    folders = {
+        folder_id: (int(size), files, versions)
+        for folder_id, size, files, versions in db.session.execute(
+            select(DocFolderClosure.ancestor_id,
+                   func.coalesce(func.sum(DocumentVersion.file_size), 0),
+                   func.count(func.distinct(Document.id)),
+                   func.count(DocumentVersion.id))
+            .select_from(DocFolderClosure)
+            .join(Document, Document.folder_id == DocFolderClosure.descendant_id)
+            .join(DocumentVersion, DocumentVersion.document_id == Document.id)
+            .group_by(DocFolderClosure.ancestor_id)
+        )
+    }
+    return projects, folders
+
+
+def _diff(model, key, expected, valid_ids):
+    """Linhas divergentes: (id, gravado, esperado)"""
+    stored = {
+        row_id: (int(size), files, versions)
+        for row_id, size, files, versions in db.session.execute(
+            select(key, model.bytes, model.files, model.versions)
+        )
+    }
+    drift = []
+    for row_id in set(stored) | set(expected):
+        if row_id not in valid_ids:
+            if row_id in stored:
+                drift.append((row_id, stored[row_id], None))
+            continue
+        current = stored.get(row_id, (0, 0, 0))
+        wanted = expected.get(row_id, (0, 0, 0))
+        if current != wanted:
+            drift.append((row_id, current, wanted))
+    return drift
+
+
+def _check_file(entry):
+    path, size = entry
+    actual = file_size(path)
+    if actual is None:
+        return path, 'missing', size, None
+    if actual != size:
+        return path, 'size_mismatch', size, actual
+    return None
+
+
+def check_files(workers=8):
+    """Confere em paralelo existência e tamanho dos arquivos de todas as versões (disco ou armazenamento)"""
+    issues = []
+    counts = {'checked': 0, 'missing': 0, 'size_mismatch': 0}
+    query = select(DocumentVersion.file_path, DocumentVersion.file_size).distinct() \
+        .execution_options(yield_per=RECONCILE_BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for partition in db.session.execute(query).partitions():
+            for problem in pool.map(_check_file, [tuple(row) for row in partition]):
+                counts['checked'] += 1
+                if problem:
+                    counts[problem[1]] += 1
+                    if len(issues) < MAX_REPORTED_ISSUES:
+                        issues.append({'path': problem[0], 'issue': problem[1],
+                                       'expected_size': problem[2], 'actual_size': problem[3]})
+    return counts, issues
+
+
+def rebuild_usage(projects=None, folders=None):
+    """Regrava todos os contadores (preservando as cotas). Participa da transação atual."""
+    if projects is None or folders is None:
+        projects, folders = expected_usage()
+    now = datetime.utcnow()
+
+    valid_projects = set(db.session.scalars(select(Project.id)).all())
+    quotas = dict(db.session.execute(
+        select(ProjectStorage.project_id, ProjectStorage.quota_bytes)
+        .where(ProjectStorage.quota_bytes.isnot(None))
+    ).all())
+    db.session.execute(delete(ProjectStorage))
+    project_rows = [
+        {'project_id': project_id, 'bytes': size, 'files': files, 'versions': versions,
+         'quota_bytes': quotas.get(project_id), 'updated_at': now}
+        for project_id, (size, files, versions) in projects.items() if project_id in valid_projects
+    ] + [
+        {'project_id': project_id, 'bytes': 0, 'files': 0, 'versions': 0,
+         'quota_bytes': quota, 'updated_at': now}
+        for project_id, quota in quotas.items() if project_id in valid_projects and project_id not in projects
+    ]
+    if project_rows:
+        db.session.execute(insert(ProjectStorage), project_rows)
+
+    db.session.execute(delete(FolderStorage))
+    folder_rows = [
+        {'folder_id': folder_id, 'bytes': size, 'files': files, 'versions': versions, 'updated_at': now}
+        for folder_id, (size, files, versions) in folders.items()
+    ]
+    if folder_rows:
+        db.session.execute(insert(FolderStorage), folder_rows)
+
+
+def reconcile_usage(fix=False, workers=8, check_disk=True):
+    """
+    Compara os contadores com os totais reais e confere os arquivos no disco.
+    Retorna um relatório; com fix=True os contadores são regravados.
+    """
+    projects, folders = expected_usage()
+    valid_projects = set(db.session.scalars(select(Project.id)).all())
+    valid_folders = set(db.session.scalars(select(DocFolder.id)).all())
+
+    report = {
+        'projects_drift': [
+            {'project_id': i, 'stored': s, 'expected': e}
+            for i, s, e in _diff(ProjectStorage, ProjectStorage.project_id, projects, valid_projects)
+        ],
+        'folders_drift': [
+            {'folder_id': i, 'stored': s, 'expected': e}
+            for i, s, e in _diff(FolderStorage, FolderStorage.folder_id, folders, valid_folders)
+        ]
+    }
+    if check_disk:
+        report['files'], report['file_issues'] = check_files(workers)
+
+    if fix and (report['projects_drift'] or report['folders_drift']):
+        rebuild_usage(projects, folders)
+        db.session.commit()
+        report['fixed'] = True
+    return report
+
+
+def ensure_usage():
+    """Calcula os contadores na primeira execução com documentos já existentes"""
+    has_usage = db.session.query(ProjectStorage.project_id).first() is not None
+    has_documents = db.session.query(Document.id).first() is not None
+    if has_documents and not has_usage:
+        rebuild_usage()
+        db.session.commit()
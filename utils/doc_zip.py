@@ -0,0 +1,119 @@
+"""
+ZIP em streaming para download de pastas e seleções de documentos.
+
+O arquivo é gerado sob demanda, sem arquivo temporário: o ZipFile escreve em
+um buffer não posicionável (usa data descriptors) que é esvaziado a cada
+bloco enviado, então a memória fica constante mesmo para pastas de vários GB.
+Tipos já comprimidos vão como ZIP_STORED; os demais com deflate.
+"""
+
+import os
+import zipfile
+from contextlib import closing
+from datetime import datetime
+
+from flask import Response, stream_with_context
+
+from utils.storage import open_file
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# Extensões cujo conteúdo já é comprimido (deflate só gastaria CPU)
+COMPRESSED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.aac', '.ogg', '.flac', '.m4a',
+    '.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.pdf', '.jar', '.apk'
+}
+
+
+class _StreamBuffer:
+    """Destino não posicionável do ZipFile; acumula bytes até serem consumidos"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def compression_for(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return zipfile.ZIP_STORED if ext in COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def unique_arcname(arcname, used):
+    """Evita nomes repetidos no ZIP acrescentando ' (2)', ' (3)'..."""
+    if arcname not in used:
+        used.add(arcname)
+        return arcname
+    base, ext = os.path.splitext(arcname)
+    n = 2
+    while f"{base} ({n}){ext}" in used:
+        n += 1
+    arcname = f"{base} ({n}){ext}"
+    used.add(arcname)
+    return arcname
+
+
+def iter_zip(entries):
+    """
+    Gera os bytes do ZIP. entries: iterável de (nome no ZIP, caminho, datetime).
+    Os arquivos são lidos do disco ou do armazenamento remoto; os ausentes
+    são ignorados.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as zf:
+        for arcname, path, modified in entries:
+            try:
+                source = open_file(path)
+            except FileNotFoundError:
+                continue
+
+            info = zipfile.ZipInfo(arcname, date_time=(modified or datetime.utcnow()).timetuple()[:6])
+            info.compress_type = compression_for(arcname)
+            info.external_attr = 0o644 << 16
+
+            with closing(source) as src, zf.open(info, 'w', force_zip64=True) as dest:
+                while True:
+                    chunk = src.read(ZIP_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Diretório central
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def zip_response(entries, filename):
+    """Resposta HTTP com o ZIP em streaming"""
+    return Response(
+        stream_with_context(iter_zip(entries)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,318 @@
+"""
+Exportação de projetos e do workspace em streaming.
+
+O Excel é gerado com o modo write-only do openpyxl, carregando os cards
+fase a fase em lotes (yield_per) com usuários e tags pré-carregados, e
+enviado ao cliente a partir de um SpooledTemporaryFile: fica em memória
+até SPOOL_MAX_SIZE e passa para um arquivo temporário anônimo acima disso,
+que é descartado ao fechar a resposta. Nada é gravado em UPLOAD_FOLDER.
+
+Os formatos CSV e NDJSON (para consumo por BI) são gerados linha a linha
+com cursor no servidor (yield_per), com memória constante mesmo em dumps
+de vários GB, e aceitam o filtro incremental 'updated_since'.
+"""
+
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime
+
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload, load_only, noload
+
+from models.db import (db, KanbanCard, Phase, Team, Tag, Message, Channel, Kudos,
+                       PomodoroLog, card_users, card_tags)
+
+EXPORT_HEADERS = [
+    'Phase', 'Card Title', 'Description', 'Time Estimate',
+    'Start Date', 'Due Date', 'Users', 'Tags',
+    'Comments', 'Percentage'
+]
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+MAX_COLUMN_WIDTH = 50
+
+
+def iter_project_cards(project_id):
+    """Percorre (fase, card) fase a fase, em lotes, com usuários e tags pré-carregados."""
+    phases = Phase.query.filter_by(project_id=project_id).order_by(Phase.order).all()
+    for phase in phases:
+        stmt = select(KanbanCard).filter_by(phase_id=phase.id)\
+            .order_by(KanbanCard.created_at, KanbanCard.id)\
+            .options(
+                selectinload(KanbanCard.users).options(
+                    load_only(Team.id, Team.email),
+                    noload(Team.project_access)
+                ),
+                selectinload(KanbanCard.tags).load_only(Tag.id, Tag.name),
+                noload(KanbanCard.phase),
+                noload(KanbanCard.team)
+            )\
+            .execution_options(yield_per=BATCH_SIZE)
+        for card in db.session.scalars(stmt):
+            yield phase, card
+
+
+def card_to_row(phase, card):
+    return [
+        phase.name,
+        card.title,
+        card.description,
+        card.tempo,
+        card.start_date.strftime('%Y-%m-%d') if card.start_date else '',
+        card.deadline.strftime('%Y-%m-%d') if card.deadline else '',
+        ";".join(user.email for user in card.users),
+        ";".join(tag.name for tag in card.tags),
+        card.comments or '',
+        card.percentage
+    ]
+
+
+def _column_widths(project_id):
+    """
+    Largura das colunas a partir de agregados no banco.
+
+    Planilhas write-only precisam declarar as larguras antes da primeira
+    linha, então os tamanhos máximos vêm de uma consulta agregada em vez de
+    uma segunda passada sobre as células.
+    """
+    lengths = db.session.query(
+        func.max(func.length(Phase.name)),
+        func.max(func.length(KanbanCard.title)),
+        func.max(func.length(KanbanCard.description)),
+        func.max(func.length(KanbanCard.tempo)),
+        func.max(func.length(KanbanCard.comments))
+    ).join(Phase, KanbanCard.phase_id == Phase.id)\
+        .filter(KanbanCard.project_id == project_id).one()
+
+    users_per_card = db.session.query(
+        (func.sum(func.length(Team.email)) + func.count(Team.id)).label('size')
+    ).select_from(card_users)\
+        .join(Team, Team.id == card_users.c.team_id)\
+        .join(KanbanCard, KanbanCard.id == card_users.c.card_id)\
+        .filter(KanbanCard.project_id == project_id)\
+        .group_by(card_users.c.card_id).subquery()
+    tags_per_card = db.session.query(
+        (func.sum(func.length(Tag.name)) + func.count(Tag.id)).label('size')
+    ).select_from(card_tags)\
+        .join(Tag, Tag.id == card_tags.c.tag_id)\
+        .join(KanbanCard, KanbanCard.id == card_tags.c.card_id)\
+        .filter(KanbanCard.project_id == project_id)\
+        .group_by(card_tags.c.card_id).subquery()
+    users_len = db.session.query(func.max(users_per_card.c.size)).scalar()
+    tags_len = db.session.query(func.max(tags_per_card.c.size)).scalar()
+
+    data_lengths = [
+        lengths[0], lengths[1], lengths[2], lengths[3],
+        10, 10,                  # datas no formato YYYY-MM-DD
+        users_len, tags_len,
+        lengths[4], 3
+    ]
+    return [
+        min(max(len(header), value or 0) + 2, MAX_COLUMN_WIDTH)
+        for header, value in zip(EXPORT_HEADERS, data_lengths)
+    ]
+
+
+def build_project_workbook(project_id, output):
+    """Grava o Excel do projeto em 'output' (arquivo ou buffer com seek)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Project Export")
+
+    for index, width in enumerate(_column_widths(project_id)):
+        ws.column_dimensions[get_column_letter(index + 1)].width = width
+
+    ws.append(EXPORT_HEADERS)
+    for phase, card in iter_project_cards(project_id):
+        ws.append(card_to_row(phase, card))
+
+    wb.save(output)
+
+
+def stream_file_response(buffer, filename, mimetype):
+    """Envia o conteúdo do buffer em blocos e o fecha ao final da resposta."""
+    size = buffer.tell()
+    buffer.seek(0)
+
+    def generate():
+        try:
+            while True:
+                chunk = buffer.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            buffer.close()
+
+    response = Response(generate(), mimetype=mimetype, direct_passthrough=True)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Content-Length'] = str(size)
+    response.call_on_close(buffer.close)
+    return response
+
+
+def export_project_xlsx(project_id, filename):
+    """Gera o Excel do projeto em um buffer temporário e o envia em streaming."""
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        build_project_workbook(project_id, buffer)
+    except Exception:
+        buffer.close()
+        raise
+    return stream_file_response(buffer, filename, XLSX_MIMETYPE)
+
+
+# Formatos de dump incremental
+STREAM_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+STREAM_ROWS_PER_CHUNK = 500
+
+# Entidades exportáveis: colunas, coluna de alteração (para updated_since),
+# e como restringir ao projeto (None = apenas no dump do workspace).
+# Cards, fases e tags só têm data de criação (edições não a alteram) e as
+# associações não têm data: essas entidades são sempre exportadas por
+# completo e recusam updated_since, que deixaria alterações de fora.
+EXPORT_ENTITIES = {
+    'cards': {
+        'columns': lambda: [KanbanCard.id, KanbanCard.title, KanbanCard.description,
+                            KanbanCard.tempo, KanbanCard.deadline, KanbanCard.start_date,
+                            KanbanCard.percentage, KanbanCard.comments, KanbanCard.phase_id,
+                            KanbanCard.team_id, KanbanCard.project_id, KanbanCard.created_at],
+        'changed': None,
+        'project': lambda stmt, project_id: stmt.where(KanbanCard.project_id == project_id),
+        'order_by': lambda: KanbanCard.id
+    },
+    'phases': {
+        'columns': lambda: [Phase.id, Phase.name, Phase.order, Phase.project_id, Phase.created_at],
+        'changed': None,
+        'project': lambda stmt, project_id: stmt.where(Phase.project_id == project_id),
+        'order_by': lambda: Phase.id
+    },
+    'tags': {
+        'columns': lambda: [Tag.id, Tag.name, Tag.color, Tag.created_at],
+        'changed': None,
+        'project': lambda stmt, project_id: stmt.where(Tag.id.in_(
+            select(card_tags.c.tag_id)
+            .join(KanbanCard, KanbanCard.id == card_tags.c.card_id)
+            .where(KanbanCard.project_id == project_id)
+        )),
+        'order_by': lambda: Tag.id
+    },
+    'assignments': {
+        'columns': lambda: [card_users.c.card_id, card_users.c.team_id.label('user_id')],
+        'changed': None,
+        'project': lambda stmt, project_id: stmt
+            .join(KanbanCard, KanbanCard.id == card_users.c.card_id)
+            .where(KanbanCard.project_id == project_id),
+        'order_by': lambda: card_users.c.card_id
+    },
+    'card_tags': {
+        'columns': lambda: [card_tags.c.card_id, card_tags.c.tag_id],
+        'changed': None,
+        'project': lambda stmt, project_id: stmt
+            .join(KanbanCard, KanbanCard.id == card_tags.c.card_id)
+            .where(KanbanCard.project_id == project_id),
+        'order_by': lambda: card_tags.c.card_id
+    },
+    'messages': {
+        'columns': lambda: [Message.id, Message.content, Message.channel_id, Message.user_id,
+                            Message.created_at, Message.updated_at],
+        'changed': lambda: func.coalesce(Message.updated_at, Message.created_at),
+        'project': lambda stmt, project_id: stmt
+            .join(Channel, Channel.id == Message.channel_id)
+            .where(Channel.project_id == project_id),
+        'order_by': lambda: Message.id
+    },
+    'kudos': {
+        'columns': lambda: [Kudos.id, Kudos.sender_id, Kudos.receiver_id, Kudos.category,
+                            Kudos.type, Kudos.message, Kudos.created_at],
+        'changed': lambda: Kudos.created_at,
+        'project': None,
+        'order_by': lambda: Kudos.id
+    },
+    'pomodoro': {
+        'columns': lambda: [PomodoroLog.id, PomodoroLog.user_id, PomodoroLog.start_time,
+                            PomodoroLog.end_time, PomodoroLog.duration, PomodoroLog.timer_type,
+                            PomodoroLog.completed],
+        'changed': lambda: PomodoroLog.end_time,
+        'project': None,
+        'order_by': lambda: PomodoroLog.id
+    }
+}
+
+
+def build_entity_query(entity, project_id=None, updated_since=None):
+    """Monta o SELECT de uma entidade; ValueError se a combinação não for suportada."""
+    spec = EXPORT_ENTITIES.get(entity)
+    if spec is None:
+        raise ValueError(f"Entidade desconhecida: {entity}")
+
+    stmt = select(*spec['columns']())
+    if project_id is not None:
+        if spec['project'] is None:
+            raise ValueError(f"'{entity}' só pode ser exportado no dump do workspace")
+        stmt = spec['project'](stmt, project_id)
+    if updated_since is not None:
+        if spec['changed'] is None:
+            raise ValueError(f"'{entity}' não tem data de alteração para updated_since")
+        stmt = stmt.where(spec['changed']() >= updated_since)
+
+    return stmt.order_by(spec['order_by']()).execution_options(yield_per=BATCH_SIZE)
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _iter_csv(result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    for rows in result.partitions(STREAM_ROWS_PER_CHUNK):
+        for row in rows:
+            writer.writerow(['' if v is None else _json_value(v) for v in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _iter_ndjson(result):
+    keys = list(result.keys())
+    for rows in result.partitions(STREAM_ROWS_PER_CHUNK):
+        yield ''.join(
+            json.dumps(dict(zip(keys, map(_json_value, row))), ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+def stream_entity_response(entity, fmt, filename, project_id=None, updated_since=None):
+    """Resposta Flask em streaming (CSV ou NDJSON) de uma entidade."""
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"Formato não suportado: {fmt}")
+    stmt = build_entity_query(entity, project_id, updated_since)
+
+    def generate():
+        result = db.session.execute(stmt)
+        try:
+            rows = _iter_csv(result) if fmt == 'csv' else _iter_ndjson(result)
+            for chunk in rows:
+                if chunk:
+                    yield chunk.encode('utf-8')
+        finally:
+            result.close()
+
+    response = Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
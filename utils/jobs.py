@@ -0,0 +1,54 @@
+"""
+Execução de tarefas em segundo plano dentro do processo.
+
+Um ThreadPoolExecutor compartilhado roda tarefas longas (importações,
+processamento de arquivos) fora do ciclo da requisição HTTP, evitando o
+timeout dos workers do gunicorn. Cada tarefa roda em seu próprio app context
+e a sessão do banco é descartada ao final.
+
+O número de threads é configurável por JOB_WORKERS (padrão 2).
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.logger import setup_logger
+
+logger = setup_logger('jobs')
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('JOB_WORKERS', 2)),
+                thread_name_prefix='deeply-job'
+            )
+        return _executor
+
+
+def in_app_context(app, fn, *args, **kwargs):
+    """Callable que executa fn(*args, **kwargs) com app context e sessão próprios."""
+    from models.db import db
+
+    def runner():
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                logger.exception(f"Falha na tarefa em segundo plano {getattr(fn, '__name__', fn)}")
+                raise
+            finally:
+                db.session.remove()
+
+    return runner
+
+
+def submit_job(app, fn, *args, **kwargs):
+    """Agenda fn(*args, **kwargs) em segundo plano, com app context e sessão próprios."""
+    return get_executor().submit(in_app_context(app, fn, *args, **kwargs))
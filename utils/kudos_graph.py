@@ -0,0 +1,153 @@
+"""
+Análise do grafo social de kudos ("quem reconhece quem").
+
+Monta uma matriz esparsa remetente x destinatário (SciPy) a partir de uma
+única consulta agregada em Kudos e calcula graus, centralidade (PageRank),
+fluxo entre departamentos (Team.departamento) e membros isolados.
+
+O resultado fica em cache no processo e é invalidado quando um novo kudo é
+criado (invalidate_cache) ou quando outro worker grava kudos/usuários
+(impressão digital com os maiores ids das tabelas).
+"""
+
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func
+
+from models.db import db, Kudos, Team
+
+# Tempo máximo de vida do cache, para refletir mudanças de departamento
+CACHE_TTL_SECONDS = 600
+TOP_N = 10
+NO_DEPARTMENT = 'Sem departamento'
+
+_cache = {'fingerprint': None, 'computed_at': 0, 'result': None}
+_cache_lock = threading.Lock()
+
+
+def invalidate_cache():
+    """Descarta o resultado em cache (chamado ao criar um kudo)."""
+    with _cache_lock:
+        _cache['result'] = None
+
+
+def _fingerprint():
+    return db.session.query(
+        db.session.query(func.max(Kudos.id)).scalar_subquery(),
+        db.session.query(func.max(Team.id)).scalar_subquery()
+    ).one()
+
+
+def _pagerank(adjacency, damping=0.85, tol=1e-8, max_iter=100):
+    """PageRank por iteração de potência sobre a matriz esparsa (linhas = remetentes)."""
+    n = adjacency.shape[0]
+    if n == 0:
+        return np.zeros(0)
+
+    out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inv_out = np.zeros(n)
+    inv_out[~dangling] = 1.0 / out_weight[~dangling]
+    transition = sparse.diags(inv_out) @ adjacency  # normaliza cada linha
+
+    rank = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        previous = rank
+        rank = damping * (transition.T @ rank + rank[dangling].sum() / n) + (1 - damping) / n
+        if np.abs(rank - previous).sum() < tol:
+            break
+    return rank
+
+
+def _compute():
+    users = db.session.query(Team.id, Team.name, Team.departamento).order_by(Team.id).all()
+    edges = db.session.query(
+        Kudos.sender_id,
+        Kudos.receiver_id,
+        func.count(Kudos.id)
+    ).group_by(Kudos.sender_id, Kudos.receiver_id).all()
+
+    n = len(users)
+    index = {user.id: i for i, user in enumerate(users)}
+    edges = [e for e in edges if e[0] in index and e[1] in index]
+
+    rows = np.fromiter((index[e[0]] for e in edges), dtype=np.int64, count=len(edges))
+    cols = np.fromiter((index[e[1]] for e in edges), dtype=np.int64, count=len(edges))
+    weights = np.fromiter((e[2] for e in edges), dtype=np.float64, count=len(edges))
+    adjacency = sparse.csr_matrix((weights, (rows, cols)), shape=(n, n))
+
+    sent = np.asarray(adjacency.sum(axis=1)).ravel()
+    received = np.asarray(adjacency.sum(axis=0)).ravel()
+    binary = (adjacency > 0).astype(np.int64)
+    distinct_receivers = np.asarray(binary.sum(axis=1)).ravel()
+    distinct_senders = np.asarray(binary.sum(axis=0)).ravel()
+    centrality = _pagerank(adjacency)
+
+    # Fluxo entre departamentos: D^T * A * D, com D a matriz indicadora usuário x departamento
+    departments = sorted({u.departamento or NO_DEPARTMENT for u in users})
+    dept_index = {name: i for i, name in enumerate(departments)}
+    membership = sparse.csr_matrix(
+        (np.ones(n), (np.arange(n), [dept_index[u.departamento or NO_DEPARTMENT] for u in users])),
+        shape=(n, len(departments))
+    )
+    flow = (membership.T @ adjacency @ membership).tocoo()
+
+    def person(i):
+        return {
+            'id': users[i].id,
+            'name': users[i].name,
+            'departamento': users[i].departamento,
+            'sent': int(sent[i]),
+            'received': int(received[i]),
+            'distinct_receivers': int(distinct_receivers[i]),
+            'distinct_senders': int(distinct_senders[i]),
+            'centrality': round(float(centrality[i]), 6)
+        }
+
+    def top(values):
+        order = np.argsort(-values, kind='stable')[:TOP_N]
+        return [person(i) for i in order.tolist() if values[i] > 0]
+
+    active = (sent + received) > 0
+    isolated = np.flatnonzero(~active)
+
+    return {
+        'total_kudos': int(weights.sum()),
+        'total_members': n,
+        'top_recognizers': top(sent),
+        'top_recipients': top(received),
+        'most_central': top(np.where(active, centrality, 0)),
+        'department_flow': sorted([
+            {
+                'from': departments[r],
+                'to': departments[c],
+                'count': int(v),
+                'cross_department': bool(r != c)
+            } for r, c, v in zip(flow.row.tolist(), flow.col.tolist(), flow.data.tolist()) if v > 0
+        ], key=lambda item: -item['count']),
+        'isolated_members': [
+            {'id': users[i].id, 'name': users[i].name, 'departamento': users[i].departamento}
+            for i in isolated.tolist()
+        ]
+    }
+
+
+def get_kudos_graph():
+    """Retorna as métricas do grafo de kudos, recalculando apenas quando necessário."""
+    fingerprint = tuple(_fingerprint())
+    now = time.time()
+    with _cache_lock:
+        if (_cache['result'] is not None
+                and _cache['fingerprint'] == fingerprint
+                and now - _cache['computed_at'] < CACHE_TTL_SECONDS):
+            return _cache['result']
+
+    result = _compute()
+    result['computed_at'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))
+
+    with _cache_lock:
+        _cache.update(fingerprint=fingerprint, computed_at=now, result=result)
+    return result
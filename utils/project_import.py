@@ -0,0 +1,412 @@
+"""
+Importação de projetos a partir de Excel em lote.
+
+A planilha é lida em modo read-only (streaming). Usuários, tags, fases e
+cards existentes do projeto são resolvidos com poucas consultas no início;
+depois as linhas são aplicadas em lotes com INSERT/UPDATE em massa e as
+associações (usuários e tags) são regravadas com DELETE ... IN + INSERT em
+massa, tudo dentro de uma única transação.
+
+Formato esperado (o mesmo gerado pela exportação):
+    Phase, Card Title, Description, Time Estimate, Start Date, Due Date,
+    Users, Tags, Comments, Percentage
+
+As importações enviadas pela interface rodam em segundo plano como
+ImportJob (run_import_job), com progresso consultável e relatório de erros
+gravado em disco.
+"""
+
+import csv
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from openpyxl import load_workbook
+from sqlalchemy import insert, update, delete, select
+
+from models.db import db, KanbanCard, Phase, Team, Tag, ImportJob, card_users, card_tags
+from utils.logger import setup_logger
+
+logger = setup_logger('project_import')
+
+REQUIRED_HEADERS = ['Phase', 'Card Title']
+BATCH_SIZE = 2000
+# Tamanhos das colunas de KanbanCard: valores maiores são erro da linha (não
+# são truncados, o título é a chave para encontrar o card existente)
+TITLE_MAX_LENGTH = KanbanCard.__table__.c.title.type.length
+TEMPO_MAX_LENGTH = KanbanCard.__table__.c.tempo.type.length
+
+
+def parse_excel_date(date_value):
+    """Converte uma data do Excel para datetime"""
+    if not date_value:
+        return None
+
+    if isinstance(date_value, datetime):
+        return date_value
+
+    # Tenta converter string para data em diferentes formatos
+    if isinstance(date_value, str):
+        for fmt in ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y']:
+            try:
+                return datetime.strptime(date_value.strip(), fmt)
+            except ValueError:
+                continue
+        return None
+
+    # Se for um número do Excel (número de dias desde 1900)
+    if isinstance(date_value, (int, float)):
+        return datetime(1899, 12, 30) + timedelta(days=int(date_value))
+
+    return None
+
+
+def _split(value):
+    if not value:
+        return []
+    return [item.strip() for item in str(value).split(';') if item.strip()]
+
+
+class ImportResult:
+    """Resultado da importação, com erros e avisos por linha."""
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+        self.warnings = []
+        self.started_at = time.time()
+
+    def error(self, row, message):
+        self.errors.append({'row': row, 'message': message})
+
+    def warning(self, row, message):
+        self.warnings.append({'row': row, 'message': message})
+
+    def log_lines(self):
+        """Linhas no formato do antigo log de erros em texto"""
+        lines = [f"Error in row {e['row']}: {e['message']}" for e in self.errors]
+        lines += [f"Warning (row {w['row']}): {w['message']}" for w in self.warnings]
+        return lines
+
+    def to_dict(self):
+        elapsed = time.time() - self.started_at
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'error_count': len(self.errors),
+            'warning_count': len(self.warnings),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.processed / elapsed, 1) if elapsed else None
+        }
+
+
+class ProjectImporter:
+    """
+    Aplica as linhas de uma planilha a um projeto.
+
+    progress: callable opcional chamado com o ImportResult após cada lote.
+    """
+
+    def __init__(self, project_id, progress=None, batch_size=BATCH_SIZE):
+        self.project_id = project_id
+        self.progress = progress
+        self.batch_size = batch_size
+        self.result = ImportResult()
+
+        # Pré-carregamento das tabelas de referência (uma consulta cada)
+        self.phases = {
+            name.strip(): phase_id for phase_id, name in db.session.execute(
+                select(Phase.id, Phase.name).where(Phase.project_id == project_id)
+            )
+        }
+        self.users = {
+            email.strip().lower(): user_id for user_id, email in db.session.execute(
+                select(Team.id, Team.email)
+            ) if email
+        }
+        self.tags = {
+            name.strip().lower(): tag_id for tag_id, name in db.session.execute(
+                select(Tag.id, Tag.name)
+            )
+        }
+        self.cards = {
+            title: card_id for card_id, title in db.session.execute(
+                select(KanbanCard.id, KanbanCard.title).where(KanbanCard.project_id == project_id)
+            )
+        }
+
+    def _parse_row(self, row_number, row_data):
+        """Converte uma linha em (valores do card, ids de usuários, ids de tags)"""
+        result = self.result
+        card_title = str(row_data.get('Card Title')).strip()
+        if len(card_title) > TITLE_MAX_LENGTH:
+            raise ValueError(f"Card title longer than {TITLE_MAX_LENGTH} characters: '{card_title[:TITLE_MAX_LENGTH]}...'")
+
+        tempo = str(row_data.get('Time Estimate') or '')
+        if len(tempo) > TEMPO_MAX_LENGTH:
+            raise ValueError(f"Time estimate longer than {TEMPO_MAX_LENGTH} characters for card '{card_title}': {tempo}")
+
+        phase_name = str(row_data.get('Phase') or '').strip()
+        phase_id = self.phases.get(phase_name)
+        if not phase_id:
+            raise ValueError(f"Phase not found: {phase_name}")
+
+        start_date = parse_excel_date(row_data.get('Start Date'))
+        if not start_date and row_data.get('Start Date'):
+            result.warning(row_number, f"Invalid start date format for card '{card_title}': {row_data['Start Date']}")
+
+        due_date = parse_excel_date(row_data.get('Due Date'))
+        if not due_date and row_data.get('Due Date'):
+            result.warning(row_number, f"Invalid due date format for card '{card_title}': {row_data['Due Date']}")
+
+        try:
+            percentage = int(float(row_data.get('Percentage') or 0))
+        except (TypeError, ValueError):
+            result.warning(row_number, f"Invalid percentage for card '{card_title}': {row_data.get('Percentage')}")
+            percentage = 0
+
+        user_ids = []
+        for email in _split(row_data.get('Users')):
+            user_id = self.users.get(email.lower())
+            if user_id is None:
+                result.warning(row_number, f"User not found: {email}")
+            elif user_id not in user_ids:
+                user_ids.append(user_id)
+
+        tag_ids = []
+        for tag_name in _split(row_data.get('Tags')):
+            tag_id = self.tags.get(tag_name.lower())
+            if tag_id is None:
+                result.warning(row_number, f"Tag not found: {tag_name}")
+            elif tag_id not in tag_ids:
+                tag_ids.append(tag_id)
+
+        values = {
+            'title': card_title,
+            'description': row_data.get('Description') or '',
+            'tempo': tempo,
+            'start_date': start_date,
+            'deadline': due_date,
+            'phase_id': phase_id,
+            'percentage': percentage,
+            'comments': row_data.get('Comments') or ''
+        }
+        return values, user_ids, tag_ids
+
+    def _flush_batch(self, new_cards, updated_cards, assignments, card_tag_links):
+        """Grava um lote com operações em massa"""
+        if new_cards:
+            db.session.execute(insert(KanbanCard), list(new_cards.values()))
+        if updated_cards:
+            db.session.execute(update(KanbanCard), list(updated_cards.values()))
+
+        # Cards novos não têm associações; só os existentes precisam ser limpos
+        existing_ids = [card_id for card_id in assignments if card_id not in new_cards]
+        if existing_ids:
+            db.session.execute(delete(card_users).where(card_users.c.card_id.in_(existing_ids)))
+            db.session.execute(delete(card_tags).where(card_tags.c.card_id.in_(existing_ids)))
+
+        if assignments:
+            user_rows = [{'card_id': cid, 'team_id': uid}
+                         for cid, uids in assignments.items() for uid in uids]
+            tag_rows = [{'card_id': cid, 'tag_id': tid}
+                        for cid, tids in card_tag_links.items() for tid in tids]
+            if user_rows:
+                db.session.execute(insert(card_users), user_rows)
+            if tag_rows:
+                db.session.execute(insert(card_tags), tag_rows)
+
+        if self.progress:
+            self.progress(self.result)
+
+    def run(self, fileobj):
+        """Importa a planilha. O commit (ou rollback) fica com quem chama."""
+        result = self.result
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            rows = ws.iter_rows(values_only=True)
+            headers = [str(h).strip() if h is not None else None for h in next(rows, [])]
+            missing = [h for h in REQUIRED_HEADERS if h not in headers]
+            if missing:
+                raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+            new_cards, updated_cards = {}, {}
+            assignments, card_tag_links = {}, {}
+
+            with db.session.no_autoflush:
+                for row_number, row in enumerate(rows, start=2):
+                    row_data = dict(zip(headers, row))
+                    if not row_data.get('Card Title'):
+                        continue
+
+                    result.processed += 1
+                    try:
+                        values, user_ids, tag_ids = self._parse_row(row_number, row_data)
+                    except Exception as e:
+                        result.error(row_number, str(e))
+                        result.skipped += 1
+                        continue
+
+                    card_id = self.cards.get(values['title'])
+                    if card_id is None:
+                        card_id = str(uuid.uuid4())
+                        self.cards[values['title']] = card_id
+                        new_cards[card_id] = {'id': card_id, 'project_id': self.project_id, **values}
+                        result.created += 1
+                    elif card_id in new_cards:
+                        # Título repetido na planilha: a última linha prevalece
+                        new_cards[card_id].update(values)
+                        result.updated += 1
+                    else:
+                        updated_cards[card_id] = {'id': card_id, **values}
+                        result.updated += 1
+
+                    assignments[card_id] = user_ids
+                    card_tag_links[card_id] = tag_ids
+
+                    if len(assignments) >= self.batch_size:
+                        self._flush_batch(new_cards, updated_cards, assignments, card_tag_links)
+                        new_cards, updated_cards = {}, {}
+                        assignments, card_tag_links = {}, {}
+
+                self._flush_batch(new_cards, updated_cards, assignments, card_tag_links)
+        finally:
+            wb.close()
+
+        return result
+
+
+def import_project_workbook(project_id, fileobj, progress=None):
+    """Importa a planilha no projeto em uma única transação e retorna o ImportResult."""
+    importer = ProjectImporter(project_id, progress=progress)
+    try:
+        result = importer.run(fileobj)
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+# Progresso das importações em andamento neste processo (job_id -> dict)
+_live_progress = {}
+_progress_lock = threading.Lock()
+
+
+def get_import_dir():
+    """Diretório onde ficam as planilhas enviadas e os relatórios de erro"""
+    path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'imports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def get_live_progress(job_id):
+    with _progress_lock:
+        progress = _live_progress.get(job_id)
+        return dict(progress) if progress else None
+
+
+def _progress_values(result):
+    summary = result.to_dict()
+    return {
+        'rows_processed': summary['processed'],
+        'created_count': summary['created'],
+        'updated_count': summary['updated'],
+        'skipped_count': summary['skipped'],
+        'error_count': summary['error_count'],
+        'warning_count': summary['warning_count'],
+        'rows_per_second': summary['rows_per_second']
+    }
+
+
+def _publish_progress(job_id, result):
+    """
+    Publica o progresso parcial. A importação roda em uma única transação,
+    então o progresso vai para a memória do processo e, fora do SQLite (que
+    bloquearia na trava de escrita), também para a linha do job por uma
+    conexão separada, visível aos demais workers.
+    """
+    values = _progress_values(result)
+    with _progress_lock:
+        _live_progress[job_id] = values
+
+    if db.engine.dialect.name != 'sqlite':
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(update(ImportJob.__table__)
+                             .where(ImportJob.__table__.c.id == job_id)
+                             .values(**values))
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar o progresso do job {job_id}: {e}")
+
+
+def write_report(job_id, result):
+    """Grava o relatório de erros/avisos (CSV) e retorna o caminho, ou None se vazio"""
+    if not result.errors and not result.warnings:
+        return None
+
+    path = os.path.join(get_import_dir(), f"{job_id}_report.csv")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['row', 'level', 'message'])
+        for item in result.errors:
+            writer.writerow([item['row'], 'error', item['message']])
+        for item in result.warnings:
+            writer.writerow([item['row'], 'warning', item['message']])
+    return path
+
+
+def run_import_job(job_id):
+    """Processa um ImportJob enfileirado (executado pelo pool de utils/jobs.py)"""
+    job = db.session.get(ImportJob, job_id)
+    if not job or job.status != 'queued':
+        return
+
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    importer = None
+    try:
+        importer = ProjectImporter(job.project_id,
+                                   progress=lambda result: _publish_progress(job_id, result))
+        result = importer.run(job.file_path)
+        db.session.commit()
+        status, error_message = 'done', None
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Falha na importação {job_id}")
+        # Falha já no pré-carregamento: não há resultado parcial
+        result = importer.result if importer else ImportResult()
+        status, error_message = 'failed', str(e)
+
+    job = db.session.get(ImportJob, job_id)
+    for key, value in _progress_values(result).items():
+        setattr(job, key, value)
+    if status == 'failed':
+        # A transação foi desfeita: nada foi criado ou atualizado
+        job.created_count = job.updated_count = 0
+    job.status = status
+    job.error_message = error_message
+    job.report_path = write_report(job_id, result)
+    job.finished_at = datetime.utcnow()
+
+    # A planilha original não é mais necessária
+    if job.file_path and os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    job.file_path = None
+    db.session.commit()
+
+    with _progress_lock:
+        _live_progress.pop(job_id, None)
+
+    logger.info(f"Importação {job_id} finalizada ({status}): {result.to_dict()}")
@@ -0,0 +1,275 @@
+"""
+Armazenamento dos arquivos enviados (documentos e fotos de perfil).
+
+As rotas não gravam nem apagam arquivos diretamente: usam o driver devolvido
+por get_storage(), escolhido por STORAGE_BACKEND:
+
+    local   (padrão) disco local; a chave é o próprio caminho (Uploads/...)
+    s3      bucket S3 ou compatível (MinIO, Ceph), via boto3:
+              S3_BUCKET, S3_ENDPOINT_URL (ex.: http://minio:9000), S3_REGION,
+              S3_ACCESS_KEY_ID e S3_SECRET_ACCESS_KEY (ou a configuração
+              padrão do boto3), S3_PREFIX, S3_ADDRESSING_STYLE (path no MinIO),
+              S3_PRESIGN_EXPIRES (segundos, padrão 300),
+              S3_MULTIPART_THRESHOLD_MB e S3_MULTIPART_CHUNK_MB (padrão 16)
+
+A chave de um arquivo é o caminho gravado no banco (ex.: DocumentVersion.file_path
+= Uploads/Blobs/ab/cd/<sha256>), de modo que trocar de driver não exige migrar
+registros, apenas copiar os objetos (flask docs-storage-push).
+
+Envios partem de um arquivo local (staging) ou de um stream e usam multipart
+acima do limite configurado. No driver remoto os downloads são entregues por
+URL pré-assinada, e o processamento que precisa de um arquivo no disco
+(texto, miniaturas) usa local_file, que baixa uma cópia temporária.
+Arquivos que continuam no disco (formato antigo, staging) são sempre lidos
+localmente.
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_storage = None
+_lock = threading.Lock()
+
+
+class LocalStorage:
+    """Arquivos no disco local; a chave é o caminho do arquivo"""
+
+    local = True
+
+    def put_file(self, key, src_path, move=True):
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        if move:
+            os.replace(src_path, key)
+        else:
+            shutil.copyfile(src_path, key)
+
+    def put_stream(self, key, stream):
+        # Grava em um temporário ao lado e renomeia: leitores nunca veem arquivo parcial
+        os.makedirs(os.path.dirname(key), exist_ok=True)
+        temp_path = f"{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+            os.replace(temp_path, key)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def open(self, key):
+        return open(key, 'rb')
+
+    def exists(self, key):
+        return os.path.isfile(key)
+
+    def size(self, key):
+        try:
+            return os.path.getsize(key)
+        except OSError:
+            return None
+
+    def delete(self, key):
+        """Apaga o arquivo; retorna os bytes liberados"""
+        try:
+            size = os.path.getsize(key)
+            os.remove(key)
+            return size
+        except OSError:
+            return 0
+
+    def list_keys(self, prefix):
+        return glob.glob(glob.escape(prefix) + '*')
+
+    def list_objects(self, directory):
+        """(chave, tamanho, mtime) de todos os arquivos sob o diretório"""
+        entries = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    @contextmanager
+    def local_copy(self, key):
+        if not os.path.isfile(key):
+            raise FileNotFoundError(key)
+        yield key
+
+    def download_url(self, key, disposition, content_type=None):
+        # Servido pelo próprio app (send_file ou X-Accel/X-Sendfile)
+        return None
+
+
+class S3Storage:
+    """Bucket S3 ou compatível; dependência opcional boto3"""
+
+    local = False
+
+    def __init__(self):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requer o pacote boto3") from e
+
+        self.bucket = os.getenv('S3_BUCKET')
+        if not self.bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requer S3_BUCKET")
+        self.prefix = os.getenv('S3_PREFIX', '').strip('/')
+        self.presign_expires = int(os.getenv('S3_PRESIGN_EXPIRES', 300))
+        self._client_error = ClientError
+
+        self.client = boto3.client(
+            's3',
+            endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+            region_name=os.getenv('S3_REGION') or None,
+            aws_access_key_id=os.getenv('S3_ACCESS_KEY_ID') or None,
+            aws_secret_access_key=os.getenv('S3_SECRET_ACCESS_KEY') or None,
+            config=Config(
+                signature_version='s3v4',
+                s3={'addressing_style': os.getenv('S3_ADDRESSING_STYLE', 'auto')},
+                max_pool_connections=int(os.getenv('S3_MAX_CONNECTIONS', 20))
+            )
+        )
+        chunk = int(os.getenv('S3_MULTIPART_CHUNK_MB', 16)) * 1024 * 1024
+        self.transfer = TransferConfig(
+            multipart_threshold=int(os.getenv('S3_MULTIPART_THRESHOLD_MB', 16)) * 1024 * 1024,
+            multipart_chunksize=chunk,
+            max_concurrency=int(os.getenv('S3_MULTIPART_CONCURRENCY', 4)),
+            io_chunksize=COPY_CHUNK_SIZE
+        )
+
+    def _key(self, key):
+        key = os.path.normpath(key).replace(os.sep, '/')
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def put_file(self, key, src_path, move=True):
+        # upload_file divide em partes (multipart) acima de multipart_threshold
+        self.client.upload_file(src_path, self.bucket, self._key(key), Config=self.transfer)
+        if move:
+            os.remove(src_path)
+
+    def put_stream(self, key, stream):
+        self.client.upload_fileobj(stream, self.bucket, self._key(key), Config=self.transfer)
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self._client_error as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        return head['ContentLength'] if head else None
+
+    def delete(self, key):
+        size = self.size(key)
+        if size is None:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return size
+
+    def list_keys(self, prefix):
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys.extend(item['Key'][strip:] for item in page.get('Contents', []))
+        return keys
+
+    def list_objects(self, directory):
+        """(chave, tamanho, mtime) de todos os objetos sob o diretório"""
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        entries = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(directory) + '/'):
+            entries.extend((item['Key'][strip:], item['Size'], item['LastModified'].timestamp())
+                           for item in page.get('Contents', []))
+        return entries
+
+    @contextmanager
+    def local_copy(self, key):
+        fd, path = tempfile.mkstemp(prefix='storage_')
+        os.close(fd)
+        try:
+            try:
+                self.client.download_file(self.bucket, self._key(key), path, Config=self.transfer)
+            except self._client_error as e:
+                if self._is_missing(e):
+                    raise FileNotFoundError(key) from e
+                raise
+            yield path
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def download_url(self, key, disposition, content_type=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(key), 'ResponseContentDisposition': disposition}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_expires)
+
+
+def get_storage():
+    """Driver configurado (um por processo)"""
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                _storage = S3Storage() if STORAGE_BACKEND == 's3' else LocalStorage()
+    return _storage
+
+
+def open_file(key):
+    """Abre para leitura: o arquivo local, se existir, ou o objeto do armazenamento"""
+    if os.path.isfile(key):
+        return open(key, 'rb')
+    return get_storage().open(key)
+
+
+def file_size(key):
+    """Tamanho do arquivo local ou do objeto; None se não existir"""
+    if os.path.isfile(key):
+        return os.path.getsize(key)
+    return get_storage().size(key)
+
+
+@contextmanager
+def local_file(key):
+    """Caminho no disco para processar o arquivo (cópia temporária se estiver remoto)"""
+    if os.path.isfile(key):
+        yield key
+    else:
+        with get_storage().local_copy(key) as path:
+            yield path
@@ -0,0 +1,258 @@
+"""
+Miniaturas e pré-visualizações (derivados) de imagens e PDFs.
+
+Os derivados são gerados em um pool de processos depois do envio, fora do
+ciclo da requisição, e gravados em Uploads/Derivatives/<aa>/<sha256>_<tam>.webp.
+Como a chave é o hash do conteúdo original, o mesmo arquivo enviado em vários
+projetos (ou como foto de perfil) gera os derivados uma única vez, e as URLs
+podem ser servidas com cache de longa duração. Os originais são lidos pelo
+driver de armazenamento (utils/storage.py); os derivados são um cache local
+de cada servidor, regenerado sob demanda.
+
+Dependências opcionais: Pillow (imagens) e PyMuPDF (primeira página de
+PDFs). Sem elas, nenhum derivado é gerado e as rotas respondem 404.
+"""
+
+import glob
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.doc_storage import UPLOAD_BASE, blob_sha
+from utils.logger import setup_logger
+from utils.storage import get_storage, local_file, file_size
+
+logger = setup_logger('thumbnails')
+
+DERIVATIVE_DIR = os.path.join(UPLOAD_BASE, 'Derivatives')
+AVATAR_DIR = os.path.join(UPLOAD_BASE, 'Avatars')
+
+# Lado maior (px) de cada tamanho
+SIZES = {'sm': 128, 'md': 320, 'lg': 1024}
+AVATAR_SIZE = 'sm'
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+PDF_EXTENSIONS = {'.pdf'}
+
+# Arquivos maiores que isso não geram pré-visualização
+MAX_SOURCE_SIZE = int(os.getenv('THUMBNAIL_MAX_SOURCE_MB', 100)) * 1024 * 1024
+MAX_IMAGE_PIXELS = 80_000_000
+
+_executor = None
+_in_flight = {}
+_lock = threading.Lock()
+
+
+def derivative_kind(filename):
+    """'image', 'pdf' ou None conforme a extensão do arquivo"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in PDF_EXTENSIONS:
+        return 'pdf'
+    return None
+
+
+def derivative_path(sha256, size, ext='webp'):
+    return os.path.join(DERIVATIVE_DIR, sha256[:2], f"{sha256}_{size}.{ext}")
+
+
+def find_derivative(sha256, size):
+    """Caminho do derivado já gerado (WebP ou, na falta de suporte, JPEG)"""
+    for ext in ('webp', 'jpg'):
+        path = derivative_path(sha256, size, ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def render_derivatives(src_path, kind, sha256, sizes=None):
+    """
+    Gera os derivados de um arquivo. Executado nos processos do pool, não
+    acessa o banco. Retorna os caminhos gravados.
+    """
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return []
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    sizes = sizes or list(SIZES)
+    largest = max(SIZES[size] for size in sizes)
+
+    if kind == 'pdf':
+        try:
+            import pymupdf as fitz
+        except ImportError:
+            try:
+                import fitz  # PyMuPDF < 1.24
+            except ImportError:
+                return []
+        with local_file(src_path) as path, fitz.open(path) as pdf:
+            if pdf.page_count == 0:
+                return []
+            page = pdf.load_page(0)
+            scale = largest / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    else:
+        with local_file(src_path) as path:
+            image = Image.open(path)
+            image.draft('RGB', (largest, largest))  # decodifica JPEGs já reduzidos
+            image = ImageOps.exif_transpose(image)
+            image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'P') else 'RGB')
+
+    use_webp = features.check('webp')
+    written = []
+    os.makedirs(os.path.join(DERIVATIVE_DIR, sha256[:2]), exist_ok=True)
+    for size in sorted(sizes, key=lambda s: SIZES[s], reverse=True):
+        copy = image.copy()
+        copy.thumbnail((SIZES[size], SIZES[size]), Image.LANCZOS)
+        if use_webp:
+            path = derivative_path(sha256, size, 'webp')
+            options = {'format': 'WEBP', 'quality': 80, 'method': 4}
+        else:
+            path = derivative_path(sha256, size, 'jpg')
+            copy = copy.convert('RGB')
+            options = {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        copy.save(tmp_path, **options)
+        os.replace(tmp_path, path)
+        written.append(path)
+    return written
+
+
+def _new_executor():
+    # spawn: processos limpos, sem herdar threads e conexões do servidor.
+    # Cada processo reimporta o módulo principal; por isso run.py não
+    # inicializa o app no nível do módulo (create_app)
+    return ProcessPoolExecutor(
+        max_workers=int(os.getenv('THUMBNAIL_WORKERS', 2)),
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = _new_executor()
+        return _executor
+
+
+def _done(sha256, future):
+    with _lock:
+        # Após recriar o pool, o mesmo conteúdo pode já ter um novo job
+        if _in_flight.get(sha256) is future:
+            del _in_flight[sha256]
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error:
+        logger.warning(f"Falha ao gerar derivados de {sha256}: {error}")
+
+
+def schedule_derivatives(sha256, src_path, filename):
+    """Agenda a geração dos derivados (se o tipo for suportado e ainda não existirem)"""
+    kind = derivative_kind(filename)
+    if not sha256 or not kind or find_derivative(sha256, 'lg'):
+        return None
+    try:
+        size = file_size(src_path)
+    except Exception:
+        return None
+    if size is None or size > MAX_SOURCE_SIZE:
+        return None
+
+    # Arquivos locais vão com caminho absoluto; chaves remotas são baixadas pelo processo
+    source = os.path.abspath(src_path) if os.path.isfile(src_path) else src_path
+    args = (render_derivatives, source, kind, sha256)
+
+    # Consulta e envio sob a mesma trava: pedidos simultâneos do mesmo
+    # conteúdo compartilham um único job
+    global _executor
+    broken = None
+    with _lock:
+        if sha256 in _in_flight:
+            return _in_flight[sha256]
+        if _executor is None:
+            _executor = _new_executor()
+        try:
+            future = _executor.submit(*args)
+        except BrokenProcessPool:
+            # Um processo do pool morreu (ex.: falta de memória): recria o pool
+            broken, _executor = _executor, _new_executor()
+            _in_flight.clear()
+            future = _executor.submit(*args)
+        _in_flight[sha256] = future
+    if broken is not None:
+        # Fora da trava: cancelar os jobs pendentes dispara _done
+        broken.shutdown(wait=False, cancel_futures=True)
+    future.add_done_callback(lambda f: _done(sha256, f))
+    return future
+
+
+def schedule_version_derivatives(*versions):
+    """Agenda os derivados de versões recém-gravadas (chamar após o commit)"""
+    for version in versions:
+        try:
+            schedule_derivatives(blob_sha(version.file_path), version.file_path, version.file_name)
+        except Exception as e:
+            # A pré-visualização nunca deve derrubar o envio
+            logger.warning(f"Não foi possível agendar derivados da versão {version.id}: {e}")
+
+
+def ensure_derivative(sha256, src_path, filename, size):
+    """
+    Derivado pronto para servir. Se ainda não existir, aguarda a geração em
+    andamento ou gera agora (caso de fotos antigas ou processo reiniciado).
+    """
+    path = find_derivative(sha256, size)
+    if path:
+        return path
+
+    future = schedule_derivatives(sha256, src_path, filename)
+    if future is None:
+        return None
+    try:
+        future.result(timeout=30)
+    except Exception as e:
+        logger.warning(f"Derivado de {sha256} indisponível: {e}")
+        return None
+    return find_derivative(sha256, size)
+
+
+def find_source_by_hash(directory, sha256):
+    """Arquivo original salvo como <sha256>.<ext> em directory"""
+    matches = glob.glob(os.path.join(directory, f"{sha256}.*"))
+    return matches[0] if matches else None
+
+
+def avatar_key(sha256, extension):
+    """Chave no armazenamento da foto de perfil original"""
+    return os.path.join(AVATAR_DIR, f"{sha256}.{extension}")
+
+
+def find_avatar_source(sha256, legacy_dir=None):
+    """Foto original no armazenamento ou, para fotos antigas, em legacy_dir"""
+    keys = get_storage().list_keys(os.path.join(AVATAR_DIR, f"{sha256}."))
+    if keys:
+        return keys[0]
+    return find_source_by_hash(legacy_dir, sha256) if legacy_dir else None
+
+
+def remove_derivatives(sha256):
+    """Apaga os derivados de um conteúdo cujo blob foi removido; retorna os bytes liberados"""
+    freed = 0
+    for path in glob.glob(os.path.join(DERIVATIVE_DIR, sha256[:2], f"{sha256}_*")):
+        try:
+            freed += os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            pass
+    return freed
@@ -0,0 +1,83 @@
+"""
+Referência leve de usuário (id, nome, foto) com cache no processo.
+
+Substitui Team.to_dict() nos serializadores que só precisam exibir nome e
+avatar, evitando carregar project_access e os demais campos de perfil.
+O cache é limitado (LRU) e tem tempo de vida, para que alterações feitas
+por outros workers apareçam sem reinício; as rotas de atualização de
+usuário chamam invalidate_user_ref().
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 5000
+TTL_SECONDS = 300
+
+_refs = OrderedDict()  # id -> (expira_em, referência)
+_lock = threading.Lock()
+
+
+def make_user_ref(user_id, name, foto):
+    return {'id': user_id, 'name': name, 'foto': foto}
+
+
+def _store(ref, now):
+    _refs[ref['id']] = (now + TTL_SECONDS, ref)
+    _refs.move_to_end(ref['id'])
+    while len(_refs) > MAX_ENTRIES:
+        _refs.popitem(last=False)
+
+
+def get_user_refs(user_ids):
+    """Retorna {id: referência}, buscando os ausentes do cache em uma única consulta."""
+    from models.db import db, Team
+
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+
+    now = time.time()
+    result = {}
+    with _lock:
+        for user_id in user_ids:
+            entry = _refs.get(user_id)
+            if entry and entry[0] > now:
+                _refs.move_to_end(user_id)
+                result[user_id] = entry[1]
+
+    missing = user_ids - result.keys()
+    if missing:
+        rows = db.session.query(Team.id, Team.name, Team.foto).filter(Team.id.in_(missing)).all()
+        with _lock:
+            for row in rows:
+                ref = make_user_ref(row.id, row.name, row.foto)
+                _store(ref, now)
+                result[row.id] = ref
+
+    return result
+
+
+def get_user_ref(user_id):
+    """Referência de um único usuário (ou None se não existir)."""
+    return get_user_refs([user_id]).get(user_id)
+
+
+def user_ref_from(team):
+    """Referência a partir de um Team já carregado, alimentando o cache."""
+    if team is None:
+        return None
+    ref = make_user_ref(team.id, team.name, team.foto)
+    with _lock:
+        _store(ref, time.time())
+    return ref
+
+
+def invalidate_user_ref(user_id=None):
+    """Remove um usuário do cache (ou todos, sem argumento)."""
+    with _lock:
+        if user_id is None:
+            _refs.clear()
+        else:
+            _refs.pop(user_id, None)